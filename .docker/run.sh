@@ -128,6 +128,21 @@ stderr_logfile=/var/log/shipyard/worker.err
 EOF
 fi
 
+if [ ! -z "`echo $APP_COMPONENTS | grep events`" ] ; then
+    cat << EOF >> $SUPERVISOR_CONF
+[program:events]
+priority=99
+directory=/app
+command=python manage.py consume_events
+user=root
+autostart=true
+autorestart=true
+stdout_logfile=/var/log/shipyard/events.log
+stderr_logfile=/var/log/shipyard/events.err
+
+EOF
+fi
+
 if [ ! -z "$EXTRA_CMD" ]; then
     /bin/bash -c "$EXTRA_CMD"
 fi
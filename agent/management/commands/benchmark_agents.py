@@ -0,0 +1,364 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends import util
+from django.test.client import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+    setup_test_environment, teardown_test_environment)
+from optparse import make_option
+from hosts.models import Host
+from datetime import datetime
+import hashlib
+import json
+import random
+import time
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+class RowCounter(object):
+    """
+    Counts the write statements executed and the rows they changed
+
+    """
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def __enter__(self):
+        self.execute = util.CursorDebugWrapper.execute
+        self.executemany = util.CursorDebugWrapper.executemany
+        counter = self
+        def execute(cursor, sql, params=()):
+            ret = counter.execute(cursor, sql, params)
+            counter.count(cursor, sql)
+            return ret
+        def executemany(cursor, sql, param_list):
+            ret = counter.executemany(cursor, sql, param_list)
+            counter.count(cursor, sql)
+            return ret
+        util.CursorDebugWrapper.execute = execute
+        util.CursorDebugWrapper.executemany = executemany
+        return self
+
+    def __exit__(self, *args):
+        util.CursorDebugWrapper.execute = self.execute
+        util.CursorDebugWrapper.executemany = self.executemany
+
+    def count(self, cursor, sql):
+        if sql.split(None, 1)[0].upper() not in WRITE_STATEMENTS:
+            return
+        self.statements += 1
+        if cursor.cursor.rowcount > 0:
+            self.rows += cursor.cursor.rowcount
+
+class FakeAgent(object):
+    """
+    Generates the payloads of a single agent
+
+    """
+    def __init__(self, host, containers, images, churn, rnd):
+        self.host = host
+        self.churn = churn
+        self.rnd = rnd
+        self.generation = None
+        self.images = [self.image() for x in range(images)]
+        self.containers = {}
+        for x in range(containers):
+            self.add_container()
+        self.changed = set(self.containers.keys())
+        self.removed = set()
+
+    def new_id(self):
+        return hashlib.sha256(str(self.rnd.random())).hexdigest()
+
+    def image(self):
+        image_id = self.new_id()
+        return {
+            'Id': image_id,
+            'RepoTags': ['bench/{}:latest'.format(image_id[:8])],
+            'Created': int(time.time()),
+            'Size': self.rnd.randint(1, 500) * 1048576,
+            'VirtualSize': self.rnd.randint(500, 1000) * 1048576,
+        }
+
+    def add_container(self):
+        c_id = self.new_id()
+        image = self.rnd.choice(self.images)
+        port = self.rnd.randint(49153, 65535)
+        self.containers[c_id] = {
+            'Container': {'Id': c_id},
+            'Meta': {
+                'Id': c_id,
+                'Name': '/bench-{}'.format(c_id[:8]),
+                'Created': datetime.utcnow().isoformat() + 'Z',
+                'Image': image.get('Id'),
+                'Config': {
+                    'Hostname': c_id[:12],
+                    'Image': image.get('RepoTags')[0],
+                    'Cmd': ['/bin/sh', '-c', 'run.sh'],
+                    'Env': ['HOME=/', 'PATH=/usr/bin:/bin'],
+                    'ExposedPorts': {'80/tcp': {}},
+                    'Memory': 0,
+                },
+                'State': {
+                    'Running': True,
+                    'Pid': self.rnd.randint(100, 32000),
+                    'ExitCode': 0,
+                    'StartedAt': datetime.utcnow().isoformat() + 'Z',
+                },
+                'NetworkSettings': {
+                    'IPAddress': '172.17.0.{}'.format(self.rnd.randint(2, 254)),
+                    'Ports': {
+                        '80/tcp': [{'HostIp': '0.0.0.0',
+                            'HostPort': str(port)}],
+                    },
+                },
+                'HostConfig': {
+                    'PortBindings': {
+                        '80/tcp': [{'HostIp': '0.0.0.0',
+                            'HostPort': str(port)}],
+                    },
+                },
+            },
+        }
+        return c_id
+
+    def tick(self):
+        """
+        Applies churn: replaces half of the churned containers and
+        restarts the other half
+
+        """
+        count = int(len(self.containers) * self.churn)
+        for c_id in self.rnd.sample(self.containers.keys(), count):
+            if self.rnd.random() < 0.5:
+                del self.containers[c_id]
+                self.removed.add(c_id)
+                self.changed.discard(c_id)
+                self.changed.add(self.add_container())
+            else:
+                state = self.containers[c_id]['Meta']['State']
+                state['Pid'] = self.rnd.randint(100, 32000)
+                state['StartedAt'] = datetime.utcnow().isoformat() + 'Z'
+                self.changed.add(c_id)
+
+    def container_payload(self, delta):
+        if delta and self.generation is not None:
+            data = {
+                'generation': self.generation,
+                'containers': [self.containers[x] for x in self.changed],
+                'removed': list(self.removed),
+            }
+        else:
+            data = self.containers.values()
+        self.changed = set()
+        self.removed = set()
+        return data
+
+    def metrics_payload(self):
+        metrics = []
+        for c_id in self.containers:
+            metrics.append({
+                'type': 'container',
+                'container_id': c_id,
+                'counters': [
+                    {'name': 'cpu', 'value': self.rnd.randint(0, 100),
+                        'unit': '%'},
+                    {'name': 'memory', 'value': self.rnd.randint(0, 2 ** 20),
+                        'unit': 'KB'},
+                ],
+            })
+        return metrics
+
+class Command(BaseCommand):
+    help = 'Benchmarks agent ingest against a temporary database'
+    option_list = BaseCommand.option_list + (
+        make_option('--hosts', type='int', default=10,
+            help='Number of simulated agents'),
+        make_option('--containers', type='int', default=100,
+            help='Number of containers per host'),
+        make_option('--images', type='int', default=20,
+            help='Number of images per host'),
+        make_option('--rounds', type='int', default=5,
+            help='Number of sync intervals to simulate'),
+        make_option('--churn', type='float', default=0.05,
+            help='Fraction of containers replaced or restarted per round'),
+        make_option('--delta', action='store_true', default=False,
+            help='Use delta container syncs after the first full sync'),
+        make_option('--no-redis', action='store_true', default=False,
+            help='Disable the redis backed agent caches and buffers'),
+        make_option('--seed', type='int', default=0,
+            help='Random seed for the generated payloads'),
+        make_option('--output', default=None,
+            help='Write the results as JSON to this file'),
+        make_option('--baseline', default=None,
+            help='Fail if results regress against this results file'),
+        make_option('--tolerance', type='float', default=0.25,
+            help='Allowed regression against the baseline (fraction)'),
+    )
+
+    def handle(self, *args, **options):
+        from south.management.commands import patch_for_test_db_setup
+        patch_for_test_db_setup()
+        setup_test_environment()
+        db_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            overrides = {}
+            if options.get('no_redis'):
+                overrides = {
+                    'AGENT_CACHE_ENABLED': False,
+                    'METRICS_BUFFER_ENABLED': False,
+                    'METRICS_RING_ENABLED': False,
+                }
+            with override_settings(**overrides):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(db_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options.get('output'):
+            with open(options.get('output'), 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options.get('baseline'):
+            with open(options.get('baseline')) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, results,
+                options.get('tolerance'))
+            if regressions:
+                raise CommandError('Regressions against {}:\n{}'.format(
+                    options.get('baseline'), '\n'.join(regressions)))
+
+    def run(self, options):
+        rnd = random.Random(options.get('seed'))
+        client = Client()
+        agents = []
+        for x in range(options.get('hosts')):
+            host = Host(name='bench-{}'.format(x),
+                hostname='10.{}.{}.{}'.format(x / 65536 % 256,
+                    x / 256 % 256, x % 256), enabled=True)
+            host.save()
+            agents.append(FakeAgent(host, options.get('containers'),
+                options.get('images'), options.get('churn'), rnd))
+        stats = {}
+        started = time.time()
+        for r in range(options.get('rounds')):
+            for agent in agents:
+                if r:
+                    agent.tick()
+                resp = self.post(client, stats, 'containers', agent,
+                    agent.container_payload(options.get('delta')))
+                if resp.status_code == 200:
+                    agent.generation = json.loads(resp.content).get(
+                        'generation')
+                self.post(client, stats, 'images', agent, agent.images)
+                self.post(client, stats, 'metrics', agent,
+                    agent.metrics_payload())
+        duration = time.time() - started
+        results = {
+            'config': dict([(x, options.get(x)) for x in ('hosts',
+                'containers', 'images', 'rounds', 'churn', 'delta',
+                'no_redis', 'seed')]),
+            'date': datetime.utcnow().isoformat() + 'Z',
+            'duration': duration,
+            'endpoints': {},
+        }
+        total = {'latencies': [], 'queries': 0, 'write_queries': 0,
+            'rows': 0, 'errors': 0, 'bytes': 0}
+        for name, s in stats.items():
+            results['endpoints'][name] = self.summarize(s, duration)
+            for k in total:
+                total[k] += s[k]
+        results['total'] = self.summarize(total, duration)
+        return results
+
+    def post(self, client, stats, endpoint, agent, data):
+        body = json.dumps(data)
+        s = stats.setdefault(endpoint, {'latencies': [], 'queries': 0,
+            'write_queries': 0, 'rows': 0, 'errors': 0, 'bytes': 0})
+        with CaptureQueriesContext(connection) as queries:
+            with RowCounter() as rows:
+                start = time.time()
+                resp = client.post('/agent/{}/'.format(endpoint), body,
+                    content_type='application/json',
+                    HTTP_AUTHORIZATION='AgentKey:{}'.format(
+                        agent.host.agent_key))
+                s['latencies'].append(time.time() - start)
+        s['queries'] += len(queries)
+        s['write_queries'] += rows.statements
+        s['rows'] += rows.rows
+        s['bytes'] += len(body)
+        if resp.status_code != 200:
+            s['errors'] += 1
+        return resp
+
+    def summarize(self, s, duration):
+        latencies = sorted(s['latencies'])
+        count = len(latencies)
+        def percentile(p):
+            if not latencies:
+                return 0
+            return latencies[min(count - 1, int(round(p * count + 0.5)) - 1)]
+        return {
+            'requests': count,
+            'errors': s['errors'],
+            'requests_per_second': count / duration if duration else 0,
+            'latency_ms': {
+                'p50': percentile(0.5) * 1000,
+                'p99': percentile(0.99) * 1000,
+                'max': latencies[-1] * 1000 if latencies else 0,
+            },
+            'queries_per_request': float(s['queries']) / count if count else 0,
+            'write_queries_per_request': float(s['write_queries']) / count \
+                if count else 0,
+            'rows_written': s['rows'],
+            'rows_written_per_request': float(s['rows']) / count \
+                if count else 0,
+            'bytes_per_request': float(s['bytes']) / count if count else 0,
+        }
+
+    def report(self, results):
+        self.stdout.write('{:<12}{:>10}{:>10}{:>10}{:>10}{:>12}{:>12}'.format(
+            'endpoint', 'req/s', 'p50 ms', 'p99 ms', 'queries', 'writes',
+            'rows'))
+        rows = sorted(results['endpoints'].items())
+        rows.append(('total', results['total']))
+        for name, s in rows:
+            self.stdout.write(
+                '{:<12}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>12.1f}{:>12}'.format(
+                name, s['requests_per_second'], s['latency_ms']['p50'],
+                s['latency_ms']['p99'], s['queries_per_request'],
+                s['write_queries_per_request'], s['rows_written']))
+
+    def compare(self, baseline, results, tolerance):
+        """
+        Returns the metrics that regressed against the baseline
+
+        """
+        regressions = []
+        checks = (
+            ('queries_per_request', lambda x: x['queries_per_request']),
+            ('rows_written_per_request',
+                lambda x: x['rows_written_per_request']),
+            ('p99 latency', lambda x: x['latency_ms']['p99']),
+        )
+        for name, s in results['endpoints'].items():
+            base = baseline.get('endpoints', {}).get(name)
+            if not base:
+                continue
+            for label, value in checks:
+                if value(s) > value(base) * (1 + tolerance):
+                    regressions.append('{} {}: {:.2f} (baseline {:.2f})'.format(
+                        name, label, value(s), value(base)))
+        return regressions
@@ -0,0 +1,134 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Agent request payloads
+
+Bodies may be sent with a `Content-Encoding` of `gzip`, `deflate` or `zstd`
+(if the `zstandard` package is installed) and either as a single JSON
+document or as newline delimited JSON (`Content-Type: application/x-ndjson`)
+which is decoded one line at a time.
+
+"""
+from django.conf import settings
+from shipyard.exceptions import PayloadError, UnsupportedEncodingError
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/x-json-stream')
+
+def get_decompressor(request):
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor()
+    raise UnsupportedEncodingError(
+        'Unsupported content encoding: {}'.format(encoding))
+
+def iter_decoded(request):
+    """
+    Yields the decoded request body in chunks of at most `CHUNK_SIZE`
+    bytes
+
+    Compressed bodies are decompressed as the chunks are consumed so a
+    small body cannot expand in memory past the chunk size.
+
+    """
+    decompressor = get_decompressor(request)
+    if decompressor is None or hasattr(decompressor, 'stream_reader'):
+        reader = request
+        if decompressor is not None:
+            reader = decompressor.stream_reader(request)
+        while True:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        return
+    while True:
+        data = request.read(CHUNK_SIZE)
+        if not data:
+            break
+        # input past `CHUNK_SIZE` bytes of output is kept in
+        # `unconsumed_tail`
+        while data:
+            chunk = decompressor.decompress(data, CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+def iter_body(request):
+    """
+    Yields the decoded request body in chunks
+
+    Raises `PayloadError` once more than `AGENT_MAX_PAYLOAD_SIZE` bytes
+    are decoded.
+
+    """
+    max_size = getattr(settings, 'AGENT_MAX_PAYLOAD_SIZE', 0)
+    size = 0
+    for chunk in iter_decoded(request):
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise PayloadError('Payload too large')
+        yield chunk
+
+def is_ndjson(request):
+    content_type = request.META.get('CONTENT_TYPE', '').split(';')[0]
+    return content_type.strip().lower() in NDJSON_CONTENT_TYPES
+
+def iter_ndjson(request):
+    """
+    Yields the objects of a newline delimited JSON body
+
+    """
+    pending = ''
+    for chunk in iter_body(request):
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield loads(line)
+    if pending.strip():
+        yield loads(pending)
+
+def load(request):
+    """
+    Returns the decoded request body
+
+    Newline delimited bodies are returned as an iterator of objects
+
+    """
+    if is_ndjson(request):
+        return iter_ndjson(request)
+    return loads(''.join(iter_body(request)))
+
+def loads(data):
+    try:
+        return json.loads(data)
+    except ValueError, e:
+        raise PayloadError('Invalid JSON: {}'.format(e))
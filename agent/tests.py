@@ -1,3 +1,305 @@
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from agent import payload
+from containers.models import Container
+from hosts.models import Host
+from metrics.models import Metric
+from shipyard.exceptions import PayloadError
+from StringIO import StringIO
+import gzip
+import json
+import mock
+import zlib
 
-# Create your tests here.
+def container_data(container_id, running=True, name=None):
+    meta = {
+        'Id': container_id,
+        'State': {'Running': running},
+    }
+    if name:
+        meta['Names'] = ['/{}'.format(name)]
+    return {
+        'Container': {'Id': container_id},
+        'Meta': meta,
+    }
+
+class AgentContainerSyncTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.containers_url = '/agent/containers/'
+
+    def post_containers(self, data):
+        return self.client.post(self.containers_url, json.dumps(data),
+            content_type='application/json',
+            HTTP_AUTHORIZATION='AgentKey:{}'.format(self.host.agent_key))
+
+    def test_sync_unauthorized(self):
+        """
+        Test sync without a valid agent key returns unauthorized
+        """
+        resp = self.client.post(self.containers_url, '[]',
+            content_type='application/json',
+            HTTP_AUTHORIZATION='AgentKey:invalid')
+        self.assertEqual(resp.status_code, 401)
+
+    def test_sync_creates_containers(self):
+        """
+        Test sync creates containers reported by the agent
+        """
+        resp = self.post_containers([container_data('abc', name='web'),
+            container_data('def', running=False)])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Container.objects.filter(host=self.host).count(), 2)
+        c = Container.objects.get(container_id='abc')
+        self.assertTrue(c.is_running)
+        self.assertTrue(c.synced)
+        self.assertEqual(c.description, 'web')
+        self.assertFalse(Container.objects.get(container_id='def').is_running)
+
+    def test_sync_updates_and_removes_containers(self):
+        """
+        Test sync updates changed containers and removes stale ones
+        """
+        self.host.sync_containers([container_data('abc'),
+            container_data('def'), container_data('ghi')])
+        Container.objects.filter(container_id='ghi').update(protected=True)
+        self.host.sync_containers([container_data('abc', running=False)])
+        self.assertFalse(Container.objects.get(container_id='abc').is_running)
+        self.assertFalse(Container.objects.filter(container_id='def').exists())
+        self.assertTrue(Container.objects.filter(container_id='ghi').exists())
+
+    def test_sync_unchanged_queries(self):
+        """
+        Test an unchanged sync only loads the existing containers
+        """
+        data = [container_data('c{}'.format(x)) for x in range(50)]
+        self.host.sync_containers(data)
+        with self.assertNumQueries(1):
+            self.host.sync_containers(data)
+
+    def test_sync_returns_generation(self):
+        """
+        Test a full sync returns the next generation
+        """
+        resp = self.post_containers([container_data('abc')])
+        self.assertEqual(json.loads(resp.content).get('generation'), 1)
+        resp = self.post_containers([container_data('abc')])
+        self.assertEqual(json.loads(resp.content).get('generation'), 2)
+
+    def test_sync_delta(self):
+        """
+        Test a delta sync only applies the reported changes
+        """
+        self.post_containers([container_data('abc'), container_data('def'),
+            container_data('ghi')])
+        resp = self.post_containers({
+            'generation': 1,
+            'containers': [container_data('abc', running=False),
+                container_data('jkl')],
+            'removed': ['def'],
+        })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content).get('generation'), 2)
+        ids = Container.objects.values_list('container_id', flat=True)
+        self.assertEqual(sorted(ids), ['abc', 'ghi', 'jkl'])
+        self.assertFalse(Container.objects.get(container_id='abc').is_running)
+
+    def test_sync_delta_generation_mismatch(self):
+        """
+        Test a delta against a stale generation requests a full sync
+        """
+        self.post_containers([container_data('abc')])
+        resp = self.post_containers({
+            'generation': 0,
+            'removed': ['abc'],
+        })
+        self.assertEqual(resp.status_code, 409)
+        data = json.loads(resp.content)
+        self.assertEqual(data.get('generation'), 1)
+        self.assertTrue(data.get('full'))
+        self.assertTrue(Container.objects.filter(container_id='abc').exists())
+
+class AgentMetricsTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.metrics_url = '/agent/metrics/'
+        self.metrics = [{
+            'type': 'container',
+            'container_id': 'abc',
+            'counters': [{'name': 'cpu', 'value': 5, 'unit': '%'}],
+        }]
+
+    def post_metrics(self, data):
+        return self.client.post(self.metrics_url, json.dumps(data),
+            content_type='application/json',
+            HTTP_AUTHORIZATION='AgentKey:{}'.format(self.host.agent_key))
+
+    def test_metrics_unbuffered(self):
+        """
+        Test metrics are written directly when buffering is disabled
+        """
+        resp = self.post_metrics(self.metrics)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Metric.objects.filter(source='abc').count(), 1)
+
+    @override_settings(METRICS_BUFFER_ENABLED=True)
+    def test_metrics_buffered(self):
+        """
+        Test metrics are queued when buffering is enabled
+        """
+        with mock.patch('metrics.buffer.buffer_size', return_value=0), \
+                mock.patch('metrics.buffer.queue_samples') as queue:
+            resp = self.post_metrics(self.metrics)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(queue.call_args[0][0][0].get('counter'), 'cpu')
+        self.assertEqual(Metric.objects.count(), 0)
+
+    @override_settings(METRICS_BUFFER_ENABLED=True, METRICS_BUFFER_MAX=10)
+    def test_metrics_buffer_full(self):
+        """
+        Test agents are asked to back off when the buffer is full
+        """
+        with mock.patch('metrics.buffer.buffer_size', return_value=10), \
+                mock.patch('metrics.buffer.queue_samples') as queue:
+            resp = self.post_metrics(self.metrics)
+        self.assertEqual(resp.status_code, 503)
+        self.assertTrue(resp.has_header('Retry-After'))
+        self.assertFalse(queue.called)
+
+class RecordingDecompressor(object):
+    """
+    Gzip decompressor recording the size of each decompressed chunk
+    """
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.sizes = []
+
+    @property
+    def unconsumed_tail(self):
+        return self.decompressor.unconsumed_tail
+
+    def decompress(self, data, max_length=0):
+        chunk = self.decompressor.decompress(data, max_length)
+        self.sizes.append(len(chunk))
+        return chunk
+
+    def flush(self):
+        chunk = self.decompressor.flush()
+        self.sizes.append(len(chunk))
+        return chunk
+
+class AgentPayloadTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.containers_url = '/agent/containers/'
+
+    def post(self, body, content_type='application/json', **extra):
+        return self.client.post(self.containers_url, body,
+            content_type=content_type,
+            HTTP_AUTHORIZATION='AgentKey:{}'.format(self.host.agent_key),
+            **extra)
+
+    def gzip(self, data):
+        buf = StringIO()
+        f = gzip.GzipFile(fileobj=buf, mode='wb')
+        f.write(data)
+        f.close()
+        return buf.getvalue()
+
+    def test_gzip_json(self):
+        """
+        Test gzip encoded JSON bodies are accepted
+        """
+        body = self.gzip(json.dumps([container_data('abc')]))
+        resp = self.post(body, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(Container.objects.filter(container_id='abc').exists())
+
+    @override_settings(AGENT_SYNC_BATCH_SIZE=2)
+    def test_gzip_ndjson(self):
+        """
+        Test newline delimited bodies are synced in batches
+        """
+        lines = [json.dumps(container_data('c{}'.format(x)))
+            for x in range(5)]
+        resp = self.post(self.gzip('\n'.join(lines)),
+            content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Container.objects.count(), 5)
+        lines = [json.dumps({'generation': 1, 'removed': ['c0', 'c1', 'c2']}),
+            json.dumps(container_data('c5'))]
+        resp = self.post('\n'.join(lines) + '\n',
+            content_type='application/x-ndjson')
+        self.assertEqual(json.loads(resp.content).get('generation'), 2)
+        ids = Container.objects.values_list('container_id', flat=True)
+        self.assertEqual(sorted(ids), ['c3', 'c4', 'c5'])
+
+    @override_settings(AGENT_MAX_PAYLOAD_SIZE=1024 * 1024)
+    def test_gzip_bomb(self):
+        """
+        Test compressed bodies are not decompressed past the chunk size
+        """
+        request = RequestFactory().post(self.containers_url,
+            self.gzip('0' * 20 * 1024 * 1024), content_type='application/json',
+            HTTP_CONTENT_ENCODING='gzip')
+        decompressor = RecordingDecompressor()
+        with mock.patch('agent.payload.get_decompressor',
+                return_value=decompressor):
+            self.assertRaises(PayloadError, list, payload.iter_body(request))
+        self.assertTrue(max(decompressor.sizes) <= payload.CHUNK_SIZE)
+        self.assertTrue(sum(decompressor.sizes) <=
+            1024 * 1024 + payload.CHUNK_SIZE)
+
+    def test_unsupported_encoding(self):
+        """
+        Test unsupported content encodings are rejected
+        """
+        resp = self.post('[]', HTTP_CONTENT_ENCODING='br')
+        self.assertEqual(resp.status_code, 415)
+
+    def test_invalid_payload(self):
+        """
+        Test invalid bodies are rejected without syncing
+        """
+        lines = [json.dumps(container_data('abc')), '{invalid']
+        resp = self.post('\n'.join(lines),
+            content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Container.objects.count(), 0)
+
+class AgentBenchmarkTest(TestCase):
+
+    def results(self, queries, p99):
+        return {'endpoints': {'containers': {
+            'queries_per_request': queries,
+            'rows_written_per_request': 10,
+            'latency_ms': {'p99': p99},
+        }}}
+
+    def test_compare_regressions(self):
+        """
+        Test benchmark results are compared against a baseline
+        """
+        from agent.management.commands.benchmark_agents import Command
+        baseline = self.results(5, 100)
+        cmd = Command()
+        self.assertEqual(cmd.compare(baseline, self.results(6, 120), 0.25), [])
+        regressions = cmd.compare(baseline, self.results(10, 120), 0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('containers queries'))
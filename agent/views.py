@@ -14,11 +14,16 @@
 from django.views.decorators.http import require_http_methods
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.conf import settings
 from functools import wraps
 from hosts.models import Host
 from containers.models import Container
 from images.models import Image
-from metrics.models import Metric
+from metrics import buffer
+from agent import payload
+from shipyard.exceptions import PayloadError, UnsupportedEncodingError
+import itertools
 import json
 
 def http_401(msg):
@@ -39,16 +44,60 @@ def agent_key_required(func):
 
         Authorization AgentKey:<key>
 
+    The host for the key is set as `request.host`.  Agents can report the
+    docker version of the host in the `X-Docker-Version` and
+    `X-Docker-Api-Version` headers to refresh its cached capabilities.
+
     """
     def f(request, *args, **kwargs):
         key = get_agent_key(request)
-        try:
-            host = Host.objects.get(agent_key=key)
-        except Host.DoesNotExist:
+        host = Host.get_by_agent_key(key)
+        if host is None:
             return http_401('unauthorized')
+        request.host = host
+        version = request.META.get('HTTP_X_DOCKER_VERSION')
+        if version:
+            host.update_capabilities(version,
+                request.META.get('HTTP_X_DOCKER_API_VERSION'))
         return func(request, *args, **kwargs)
     return f
 
+def agent_payload(func):
+    """
+    Decorator to return a 415 for unsupported content encodings and a 400
+    for invalid payloads
+
+    """
+    @wraps(func)
+    def f(request, *args, **kwargs):
+        try:
+            return func(request, *args, **kwargs)
+        except UnsupportedEncodingError, e:
+            return HttpResponse(str(e), status=415)
+        except PayloadError, e:
+            return HttpResponse(str(e), status=400)
+    return f
+
+def get_container_sync(request):
+    """
+    Returns the container sync header and an iterable of the containers
+
+    Newline delimited bodies hold one container per line, optionally
+    preceded by the sync header (`generation`, `full`, `removed`).
+
+    """
+    data = payload.load(request)
+    if isinstance(data, list):
+        return {'full': True}, data
+    if isinstance(data, dict):
+        return data, data.get('containers', [])
+    first = next(data, None)
+    if first is None:
+        return {'full': True}, []
+    if 'Container' in first:
+        return {'full': True}, itertools.chain([first], data)
+    return first, data
+
 @require_http_methods(['POST'])
 @csrf_exempt
 def register(request):
@@ -71,72 +120,78 @@ def register(request):
 
 @csrf_exempt
 @agent_key_required
+@agent_payload
 def containers(request):
-    key = get_agent_key(request)
-    host = Host.objects.get(agent_key=key)
-    host.save() # update last_updated
+    """
+    Syncs the host containers reported by the agent
+
+    Agents either post the full list of containers (`[{"Container": ...,
+    "Meta": ...}]`) or a delta against the last sync generation:
+
+        {
+            "generation": 12,
+            "containers": [{"Container": ..., "Meta": ...}],
+            "removed": ["<container id>"]
+        }
+
+    `containers` only holds added or changed containers.  A delta may also
+    set `"full": true` to send the complete list.  The response holds the
+    generation the controller expects next; if a delta does not match the
+    current generation a 409 is returned and the agent must send a full sync.
+
+    The body may be compressed and newline delimited (see `agent.payload`).
+
+    """
+    host = request.host
+    host.heartbeat()
     if not host.enabled:
         return HttpResponse(status=403)
-    container_data = json.loads(request.body)
-    for d in container_data:
-        if d.get('HostConfig', {}).get('PortBindings'):
-            print(d)
-        c = d.get('Container')
-        meta = d.get('Meta')
-        running = meta.get('State', {}).get('Running', False)
-        container, created = Container.objects.get_or_create(host=host,
-                container_id=c.get('Id'))
-        if container.description == '' and meta.get('Names'):
-            container.description = meta.get('Names')[0][1:]
-        container.meta = json.dumps(meta)
-        container.is_running = running
-        container.synced = True
-        container.save()
-    container_ids = [x.get('Container').get('Id') for x in container_data]
-    # cleanup old containers
-    Container.objects.filter(host=host).exclude(protected=True).exclude(
-            container_id__in=container_ids).exclude(synced=False).delete()
-    return HttpResponse()
+    data, container_data = get_container_sync(request)
+    full = data.get('full', False)
+    with transaction.atomic():
+        generation = host.advance_sync_generation(
+            None if full else data.get('generation', -1))
+        if generation is None:
+            resp = {
+                'generation': host.sync_generation,
+                'full': True,
+            }
+            return HttpResponse(json.dumps(resp), status=409,
+                content_type='application/json')
+        host.sync_containers(container_data, removed=data.get('removed'),
+            full=full)
+    resp = {
+        'generation': generation,
+    }
+    return HttpResponse(json.dumps(resp), content_type='application/json')
 
 @csrf_exempt
 @agent_key_required
+@agent_payload
 def images(request):
-    key = get_agent_key(request)
-    host = Host.objects.get(agent_key=key)
-    host.save() # update last_updated
+    host = request.host
+    host.heartbeat()
     if not host.enabled:
         return HttpResponse(status=403)
-    image_data = json.loads(request.body)
-    for i in image_data:
-        image, created = Image.objects.get_or_create(host=host,
-                image_id=i.get('Id'))
-        image.repository = i.get('RepoTags')[0]
-        image.history = json.dumps(image_data)
-        image.save()
-    # cleanup old images
-    image_ids = [x.get('Id') for x in image_data]
-    Image.objects.filter(host=host).exclude(image_id__in=image_ids).delete()
+    Image.sync(host, payload.load(request))
     return HttpResponse()
 
 @csrf_exempt
 @agent_key_required
+@agent_payload
 def metrics(request):
-    key = get_agent_key(request)
-    host = Host.objects.get(agent_key=key)
-    host.save() # update last_updated
+    host = request.host
+    host.heartbeat()
     if not host.enabled:
         return HttpResponse(status=403)
-    metrics = json.loads(request.body)
-    if metrics:
-        for metric in metrics:
-            # add counters
-            for counter in metric.get('counters'):
-                m = Metric()
-                m.metric_type = metric.get('type')
-                m.source = metric.get('container_id')
-                m.counter = counter.get('name')
-                m.value = counter.get('value')
-                m.unit = counter.get('unit')
-                m.save()
+    samples = buffer.get_samples(payload.load(request))
+    if not getattr(settings, 'METRICS_BUFFER_ENABLED', False):
+        buffer.store_samples(samples)
+        return HttpResponse()
+    # ask the agent to back off until the buffer has been flushed
+    if buffer.buffer_size() >= getattr(settings, 'METRICS_BUFFER_MAX'):
+        resp = HttpResponse('metrics buffer full', status=503)
+        resp['Retry-After'] = getattr(settings, 'METRICS_BUFFER_RETRY_AFTER')
+        return resp
+    buffer.queue_samples(samples)
     return HttpResponse()
-
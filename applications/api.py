@@ -25,7 +25,8 @@ class ApplicationResource(ModelResource):
     containers = fields.ToManyField(ContainerResource, 'containers', null=True, full=True)
 
     class Meta:
-        queryset = Application.objects.all()
+        queryset = Application.objects.prefetch_related('containers__host',
+            'containers__port_bindings')
         resource_name = 'applications'
         always_return_data = True
         authorization = Authorization()
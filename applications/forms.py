@@ -14,7 +14,7 @@
 from django import forms
 from django.utils.translation import ugettext as _
 from applications.models import Application
-from containers.models import Container
+from containers.models import Container, PortBinding
 from hosts.models import Host
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Fieldset, ButtonHolder, Submit, Field
@@ -60,13 +60,22 @@ class ApplicationForm(forms.ModelForm):
 
         port = data.get('backend_port')
         interface = data.get('host_interface') or '0.0.0.0'
+        port_proto = "{0}/tcp".format(port)
+        # host interfaces each container publishes the port on
+        interfaces = {}
+        try:
+            bindings = PortBinding.objects.filter(
+                container__in=data.get('containers'), port=int(port),
+                protocol='tcp')
+        except (TypeError, ValueError):
+            bindings = []
+        for b in bindings:
+            interfaces.setdefault(b.container_id, set()).add(b.host_interface)
         for c in data.get('containers', []):
-            port_proto = "{0}/tcp".format(port)
-            container_ports = c.get_ports()
-            if not port_proto in container_ports:
+            if not c.id in interfaces:
                 msg = _(u'Port %s is not available on the selected containers.' % port_proto)
                 self._errors['backend_port'] = self.error_class([msg])
-            if not container_ports.get(port_proto, {}).get(interface):
+            if not interface in interfaces.get(c.id, ()):
                 msg = _(u'Port %s is not bound to the interface %s on the selected containers.' % (port_proto, interface))
                 self._errors['host_interface'] = self.error_class([msg])
 
@@ -20,6 +20,8 @@ urlpatterns = patterns('applications.views',
         name='applications.details'),
     url(r'^(?P<app_uuid>\w{32})/delete/$', 'delete',
         name='applications.delete'),
+    url(r'^(?P<app_uuid>\w{32})/health/$', 'health',
+        name='applications.health'),
     url(r'^(?P<app_uuid>\w{32})/containers/attach/$',
         'attach_containers', name='applications.attach_containers'),
     url(r'^(?P<app_uuid>\w{32})/containers/(?P<container_id>\w{12})/remove/$',
@@ -15,6 +15,7 @@ from django.shortcuts import render_to_response, redirect
 from django.core.urlresolvers import reverse
 from django.template import RequestContext
 from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db.models import Q
@@ -23,6 +24,7 @@ from django.contrib.auth.decorators import login_required
 from applications.models import Application
 from applications.forms import ApplicationForm, EditApplicationForm
 from containers.models import Container
+import json
 
 @login_required
 def index(request):
@@ -84,11 +86,9 @@ def _details(request, app_uuid=None):
         'backend_port': app.backend_port,
         'protocol': app.protocol,
     }
-    all_containers = Container.objects.filter(Q(owner=None) |
-        Q(owner=request.user)) \
-        .exclude(container_id__in=attached_container_ids)
-    containers = [c for c in all_containers if c.get_meta().get('State', {}) \
-        .get('Running') == True]
+    containers = Container.objects.filter(Q(owner=None) |
+        Q(owner=request.user), is_running=True) \
+        .exclude(container_id__in=attached_container_ids).defer('meta')
     ctx = {
         'application': app,
         'form_edit_application': EditApplicationForm(initial=initial),
@@ -97,6 +97,23 @@ def _details(request, app_uuid=None):
     return render_to_response('applications/application_details.html', ctx,
         context_instance=RequestContext(request))
 
+@require_http_methods(['GET'])
+@login_required
+def health(request, app_uuid=None):
+    '''
+    Returns the availability of the application containers
+
+    '''
+    app = Application.objects.get(uuid=app_uuid)
+    containers = app.containers.select_related('host')
+    availability = Container.get_availability(containers)
+    data = {
+        'healthy': len([x for x in availability.values() if x]),
+        'unhealthy': len([x for x in availability.values() if not x]),
+        'containers': availability,
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
 @login_required
 #@owner_required # TODO
 def delete(request, app_uuid=None):
@@ -1,10 +1,16 @@
 import fabfile
+import threading
+
+# fabric keeps the current host in the process wide `env` so commands
+# run from concurrent launches must not overlap
+_lock = threading.Lock()
 
 class Commands():
 
   @staticmethod
   def execute(host, name, ip):
     try:
-      fabfile.command(host, name, ip)
+      with _lock:
+        fabfile.command(host, name, ip)
     except Exception, e:
       print 'Error in execute fabric command: {}'.format(e)
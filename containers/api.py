@@ -16,25 +16,33 @@ from tastypie import fields
 from tastypie.resources import ModelResource
 from tastypie.constants import ALL, ALL_WITH_RELATIONS
 from tastypie.bundle import Bundle
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.http import HttpAccepted, HttpApplicationError
 from tastypie.authorization import Authorization
 from tastypie.authentication import (ApiKeyAuthentication,
     SessionAuthentication, MultiAuthentication)
+from django.conf import settings
 from django.conf.urls import url
+from django.core.urlresolvers import reverse
 from tastypie.utils import trailing_slash
+from containers import bulk, pagination
 from containers.models import Container
 from hosts.models import Host
 from hosts.api import HostResource
+from metrics.models import Metric
 from django.contrib.auth.models import User
 from shipyard import utils
-import time
-import socket
+import urllib
 
 class ContainerResource(ModelResource):
-    host = fields.ToOneField(HostResource, 'host', full=True)
-    meta = fields.DictField(attribute='get_meta')
+    host = fields.ToOneField(HostResource, 'host', full=True, full_list=False)
+    meta = fields.DictField(attribute='get_meta', use_in='detail')
+    port_bindings = fields.ListField(readonly=True)
 
     class Meta:
-        queryset = Container.objects.all()
+        queryset = Container.objects.select_related('host').\
+            prefetch_related('port_bindings')
+        paginator_class = pagination.KeysetPaginator
         resource_name = 'containers'
         always_return_data = True
         authorization = Authorization()
@@ -45,31 +53,53 @@ class ContainerResource(ModelResource):
         filtering = {
             'container_id': ALL,
             'is_running': ALL,
+            'name': ALL,
+            'image': ALL,
+            'created': ALL,
+            'started': ALL,
+            'exit_code': ALL,
         }
 
+    def dehydrate_port_bindings(self, bundle):
+        return [{
+            'port': b.port,
+            'protocol': b.protocol,
+            'host_interface': b.host_interface,
+            'host_port': b.host_port,
+        } for b in bundle.obj.port_bindings.all()]
+
+    def build_filters(self, filters=None):
+        # host, owner and state are applied by `apply_filters`
+        filters = dict([(k, v) for k, v in (filters or {}).items()
+            if k not in ('host', 'owner', 'state')])
+        return super(ContainerResource, self).build_filters(filters)
+
+    def apply_filters(self, request, applicable_filters):
+        containers = super(ContainerResource, self).apply_filters(request,
+            applicable_filters).defer('meta')
+        return pagination.filter_containers(containers,
+            host=request.GET.get('host'), owner=request.GET.get('owner'),
+            state=request.GET.get('state'))
+
     def prepend_urls(self):
         return [
+            url(r"^(?P<resource_name>%s)/ready%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('ready'), name="api_ready"),
+            url(r"^(?P<resource_name>%s)/bulk%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('bulk'), name="api_bulk"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/restart%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('restart'), name="api_restart"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/stop%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('stop'), name="api_stop"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/start%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('start'), name="api_start"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/destroy%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('destroy'), name="api_destroy"),
+            url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/metrics%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('metrics'), name="api_metrics"),
         ]
     
-    def _container_action(self, action, request, **kwargs):
+    def _get_container(self, c_id):
         """
-        Container actions
-
-        :param action: Action to perform (restart, stop, destroy)
-        :param request: Request object
+        Returns a tuple of the container by model or container id and an
+        error response if it cannot be found
 
         """
-        self.method_check(request, allowed=['get'])
-        self.is_authenticated(request)
-        self.throttle_check(request)
-
-        c_id = kwargs.get('pk')
         if not c_id:
-            return HttpResponse(status=404)
+            return None, HttpResponse(status=404)
         container = None
         # try to get by model id
         try:
@@ -81,10 +111,28 @@ class ContainerResource(ModelResource):
             # try to find by container id
             c = Container.objects.filter(container_id__contains=c_id)
             if not c:
-                return HttpResponse("Invalid container", status=404)
+                return None, HttpResponse("Invalid container", status=404)
             if len(c) > 1:
-                return HttpResponse("Multiple containers found", status=400)
+                return None, HttpResponse("Multiple containers found",
+                    status=400)
             container = c[0]
+        return container, None
+
+    def _container_action(self, action, request, **kwargs):
+        """
+        Container actions
+
+        :param action: Action to perform (restart, stop, destroy)
+        :param request: Request object
+
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        container, resp = self._get_container(kwargs.get('pk'))
+        if resp:
+            return resp
         actions = {
             'restart': container.restart,
             'stop': container.stop,
@@ -124,6 +172,80 @@ class ContainerResource(ModelResource):
         """
         return self._container_action('destroy', request, **kwargs)
 
+    def metrics(self, request, **kwargs):
+        """
+        Custom view for container cpu and memory metrics
+
+        Accepts an optional `period` (in seconds) of history to return
+
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        container, resp = self._get_container(kwargs.get('pk'))
+        if resp:
+            return resp
+        try:
+            period = int(request.GET.get('period'))
+        except (TypeError, ValueError):
+            period = None
+        data = {}
+        for counter in ('cpu', 'memory'):
+            data[counter] = Metric.get_series(container.container_id, counter,
+                period)
+        self.log_throttled_access(request)
+        return self.create_response(request, data)
+
+    def ready(self, request, **kwargs):
+        """
+        Custom view for checking the availability of containers
+
+        Expects one or more `id` (container id) parameters ; the containers
+        are checked once without waiting
+
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        ids = request.GET.getlist('id')
+        containers = Container.objects.filter(container_id__in=ids).\
+            select_related('host')
+        availability = Container.get_availability(containers)
+        data = {
+            'ready': bool(ids) and len(availability) == len(set(ids)) and \
+                all(availability.values()),
+            'containers': availability,
+        }
+        self.log_throttled_access(request)
+        return self.create_response(request, data)
+
+    def bulk(self, request, **kwargs):
+        """
+        Custom view for running an action on many containers
+
+        Expects an `action` (restart, start, stop or destroy) and at least
+        one selector: `ids` (list of container ids), `application` (uuid),
+        `host` (name) or `image`.  The containers matching all selectors are
+        acted on concurrently and the result of each is returned.
+
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        data = self.deserialize(request, request.body,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        action = data.get('action')
+        selectors = dict([(x, data.get(x)) for x in
+            ('ids', 'application', 'host', 'image') if data.get(x)])
+        if action not in bulk.ACTIONS:
+            return HttpResponse('Invalid action', status=400)
+        if not selectors:
+            return HttpResponse('No containers selected', status=400)
+        containers = bulk.select_containers(**selectors)
+        result = bulk.run_action(action, containers)
+        self.log_throttled_access(request)
+        return self.create_response(request, result)
+
     def detail_uri_kwargs(self, bundle_or_obj, **kwargs):
         kwargs = {}
         if isinstance(bundle_or_obj, Bundle):
@@ -136,6 +258,10 @@ class ContainerResource(ModelResource):
         """
         Override obj_create to launch containers and return metadata
 
+        If the launch fails on some of the hosts the containers started on
+        the other hosts are left running ; their ids and the error of each
+        failed host are returned with a 500 response.
+
         """
         # HACK: get host id -- this should probably be some type of
         # reverse lookup from tastypie
@@ -144,37 +270,52 @@ class ContainerResource(ModelResource):
         host_urls = bundle.data.get('hosts')
         # remove 'hosts' from data and pass rest to create_container
         del bundle.data['hosts']
-        containers = []
-        # launch on hosts
-        for host_url in host_urls:
-            host_id = host_url.split('/')[-2]
-            host = Host.objects.get(id=host_id)
-            data = bundle.data
+        data = bundle.data
+        hosts = Host.objects.in_bulk([x.split('/')[-2] for x in host_urls])
+        def launch(host_url):
+            host = hosts.get(int(host_url.split('/')[-2]))
+            if host is None:
+                raise Host.DoesNotExist('Host {} not found'.format(host_url))
             c_id, status = host.create_container(**data)
-            obj = Container.objects.get(container_id=c_id)
-            bundle.obj = obj
-            containers.append(obj)
+            return c_id
+        # launch on hosts
+        results = utils.run_concurrently(launch, host_urls,
+            getattr(settings, 'CONTAINER_LAUNCH_CONCURRENCY', 10))
+        container_ids = [c_id for c_id, error in results if error is None]
+        errors = dict([(url, str(error)) for url, (c_id, error) in
+            zip(host_urls, results) if error is not None])
+        if errors:
+            raise ImmediateHttpResponse(response=self.create_response(
+                bundle.request, {
+                    'containers': container_ids,
+                    'errors': errors,
+                }, response_class=HttpApplicationError))
+        containers = dict([(x.container_id, x) for x in
+            Container.objects.filter(container_id__in=container_ids)])
+        if container_ids and container_ids[-1] in containers:
+            bundle.obj = containers[container_ids[-1]]
+        get = bundle.request.GET
+        if get.has_key('async'):
+            # return a url to check readiness instead of waiting
+            ready_url = reverse('api_ready', kwargs={
+                'api_name': self._meta.api_name,
+                'resource_name': self._meta.resource_name})
+            ready_url += '?' + urllib.urlencode([('id', x)
+                for x in container_ids])
+            resp = self.create_response(bundle.request, {
+                'containers': container_ids,
+                'ready': ready_url,
+            }, response_class=HttpAccepted)
+            resp['Location'] = ready_url
+            raise ImmediateHttpResponse(response=resp)
         # wait for containers if port is specified and requested
-        if bundle.request.GET.has_key('wait') == True:
+        if get.has_key('wait'):
             # check for timeout override
             try:
-                timeout = int(bundle.request.GET.get('wait'))
+                timeout = int(get.get('wait'))
             except Exception, e:
                 timeout = 60
-            ids = []
-            for c in containers:
-                # wait for port to be available
-                count = 0
-                c_id = c.container_id
-                while True:
-                    if count > timeout:
-                        break
-                    # reload meta to get NAT port
-                    c = Container.objects.get(container_id=c_id)
-                    if c.is_available():
-                        break
-                    count += 1
-                    time.sleep(1)
+            Container.wait_until_available(container_ids, timeout)
         bundle = self.full_hydrate(bundle)
         return bundle
 
@@ -185,6 +326,5 @@ class ContainerResource(ModelResource):
         h.destroy_container(c.container_id)
 
     def obj_delete_list(self, request=None, **kwargs):
-        for c in Container.objects.all():
-            h = c.host
-            h.destroy_container(c.container_id)
+        bulk.run_action('destroy',
+            list(Container.objects.select_related('host')))
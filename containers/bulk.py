@@ -0,0 +1,145 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.db.models import Q
+from django.utils.translation import ugettext as _
+from docker import client
+from containers.models import Container
+from shipyard.exceptions import ProtectedContainerError
+from shipyard import utils
+
+ACTIONS = ('restart', 'start', 'stop', 'destroy')
+# length of a full docker container id
+FULL_ID_LENGTH = 64
+# number of full ids matched per query
+ID_CHUNK_SIZE = 500
+# number of id prefixes matched per query ; every prefix adds a level to
+# the sql expression tree
+PREFIX_CHUNK_SIZE = 50
+
+def select_containers(ids=None, application=None, host=None, image=None):
+    """
+    Returns the containers matching all of the given selectors
+
+    :param ids: List of container ids (or id prefixes)
+    :param application: Application uuid
+    :param host: Host name
+    :param image: Image (repository or repository:tag) the containers run
+
+    """
+    containers = Container.objects.select_related('host')
+    if application:
+        containers = containers.filter(application__uuid=application)
+    if host:
+        containers = containers.filter(host__name=host)
+    if image:
+        tag = image if ':' in image else '{0}:latest'.format(image)
+        containers = containers.filter(image__in=(image, tag))
+    if ids is None:
+        return list(containers)
+    ids = set([x for x in ids if x])
+    full_ids = [x for x in ids if len(x) >= FULL_ID_LENGTH]
+    prefixes = [x for x in ids if len(x) < FULL_ID_LENGTH]
+    filters = []
+    for i in range(0, len(full_ids), ID_CHUNK_SIZE):
+        filters.append(Q(container_id__in=full_ids[i:i + ID_CHUNK_SIZE]))
+    for i in range(0, len(prefixes), PREFIX_CHUNK_SIZE):
+        q = Q()
+        for prefix in prefixes[i:i + PREFIX_CHUNK_SIZE]:
+            q |= Q(container_id__startswith=prefix)
+        filters.append(q)
+    selected = {}
+    for q in filters:
+        for container in containers.filter(q):
+            selected[container.id] = container
+    return [selected[x] for x in sorted(selected)]
+
+def _run_host_action(action, host, containers):
+    """
+    Runs an action on the containers of a single host
+
+    Returns a list of `(container, error)` tuples
+
+    """
+    c = host._get_client()
+    def run(container):
+        if container.protected and action in ('stop', 'destroy'):
+            raise ProtectedContainerError(
+                _('Unable to {0} container.  Container is protected.').format(
+                    action))
+        if action == 'restart':
+            c.restart(container.container_id)
+        elif action == 'start':
+            container.start()
+        elif action == 'stop':
+            c.stop(container.container_id)
+        elif action == 'destroy':
+            try:
+                c.kill(container.container_id)
+                c.remove_container(container.container_id)
+            except client.APIError:
+                # ignore 404s from api if container not found
+                pass
+    results = utils.run_concurrently(run, containers,
+        getattr(settings, 'CONTAINER_BULK_HOST_CONCURRENCY', 4))
+    return [(x, e) for x, (r, e) in zip(containers, results)]
+
+def run_action(action, containers):
+    """
+    Runs an action on the containers concurrently
+
+    Containers are grouped by host ; at most `CONTAINER_BULK_CONCURRENCY`
+    hosts are worked on at once with at most
+    `CONTAINER_BULK_HOST_CONCURRENCY` concurrent actions per host.  The
+    applications of the containers are reconfigured once at the end.
+
+    Returns a dict with the number of containers `succeeded` and `failed`
+    and the `error` (or `None`) of each container id in `results`
+
+    :param action: One of `ACTIONS`
+    :param containers: List of containers (with their host loaded)
+
+    """
+    from applications.models import Application
+    if action not in ACTIONS:
+        raise ValueError('Unknown action: {0}'.format(action))
+    hosts = {}
+    for container in containers:
+        hosts.setdefault(container.host_id, (container.host, []))[1].append(
+            container)
+    host_results = utils.run_concurrently(
+        lambda x: _run_host_action(action, x[0], x[1]), hosts.values(),
+        getattr(settings, 'CONTAINER_BULK_CONCURRENCY', 10))
+    results = {}
+    done = []
+    for (host, host_containers), (r, e) in zip(hosts.values(),
+            host_results):
+        for container, error in r or [(x, e) for x in host_containers]:
+            results[container.container_id] = str(error) if error else None
+            if error is None:
+                done.append(container.id)
+    if action == 'destroy':
+        # remove metadata
+        for i in range(0, len(done), 500):
+            Container.objects.filter(id__in=done[i:i + 500]).delete()
+    elif action in ('restart', 'start'):
+        # update hipache
+        for app in Application.objects.filter(containers__in=done).distinct():
+            app.update_config()
+    return {
+        'action': action,
+        'succeeded': len(done),
+        'failed': len(results) - len(done),
+        'results': results,
+    }
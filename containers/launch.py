@@ -0,0 +1,116 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.core.cache import cache
+from hosts.models import Host
+from shipyard import utils
+from uuid import uuid4
+import threading
+
+LAUNCH_KEY = 'launch:{0}'
+LAUNCH_TTL = getattr(settings, 'CONTAINER_LAUNCH_TTL', 3600)
+
+def create_batch(hosts):
+    """
+    Creates a launch batch for the hosts and returns its id
+
+    :param hosts: List of host ids
+
+    """
+    batch_id = str(uuid4()).replace('-', '')
+    cache.set(LAUNCH_KEY.format(batch_id), _new_batch(batch_id, hosts),
+        LAUNCH_TTL)
+    return batch_id
+
+def _new_batch(batch_id, hosts):
+    return {
+        'id': batch_id,
+        'status': 'pending',
+        'hosts': dict([(str(x), {'status': 'pending'}) for x in hosts]),
+    }
+
+def get_batch(batch_id):
+    """
+    Returns the status of a launch batch or `None`
+
+    The batch has a `status` (pending, running or finished) and the
+    `status` (pending, running, created or failed), `container_id` and
+    `error` of each host.  Finished batches also have the number of
+    containers `created` and `failed`.
+
+    """
+    return cache.get(LAUNCH_KEY.format(batch_id))
+
+def launch_batch(batch_id, hosts, ips, concurrency=None, **kwargs):
+    """
+    Launches a container on each host in parallel
+
+    At most `CONTAINER_LAUNCH_CONCURRENCY` hosts are launched at once ;
+    the fabric provisioning step is run one host at a time as fabric
+    keeps its state in the process.  The batch status is updated in the
+    cache as each host finishes.
+
+    Returns a `(container_id, error)` tuple per host ; hosts whose
+    container did not start have an error.
+
+    :param batch_id: Id returned by `create_batch`
+    :param hosts: List of host ids
+    :param ips: Provisioning IPs (one per host)
+    :param kwargs: Arguments for `Host.create_container`
+
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'CONTAINER_LAUNCH_CONCURRENCY', 10)
+    key = LAUNCH_KEY.format(batch_id)
+    batch = cache.get(key) or _new_batch(batch_id, hosts)
+    lock = threading.Lock()
+    def update(host_id, **status):
+        with lock:
+            if host_id is None:
+                batch.update(status)
+            else:
+                batch['hosts'][str(host_id)].update(status)
+            cache.set(key, batch, LAUNCH_TTL)
+    host_map = Host.objects.in_bulk(hosts)
+    name = kwargs.pop('name', None)
+    def launch(args):
+        index, host_id = args
+        update(host_id, status='running')
+        try:
+            host = host_map.get(int(host_id))
+            if host is None:
+                raise Host.DoesNotExist('Host {} not found'.format(host_id))
+            prov_obj = {
+                'hostname': host.hostname,
+                'name': name or 'maq-{}'.format(index + 1),
+                'ip': ips[index],
+            }
+            c_id, status = host.create_container(name=prov_obj['name'],
+                prov_obj=prov_obj, **kwargs)
+        except Exception, e:
+            update(host_id, status='failed', error=str(e))
+            raise
+        if not status:
+            update(host_id, status='failed', container_id=c_id,
+                error='Container did not start')
+            raise StandardError('Container {} did not start'.format(c_id))
+        update(host_id, status='created', container_id=c_id)
+        return c_id
+    update(None, status='running')
+    results = utils.run_concurrently(launch, enumerate(hosts), concurrency)
+    created = len([x for x in batch['hosts'].values()
+        if x.get('status') == 'created'])
+    update(None, status='finished', created=created,
+        failed=len(batch['hosts']) - created)
+    return results
@@ -0,0 +1,215 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.core.cache import cache
+from collections import deque
+from hashlib import md5
+from multiprocessing import Pool
+from shipyard import utils
+import calendar
+import itertools
+import struct
+import time
+
+STREAM_HEADER_SIZE = 8
+READ_SIZE = 8192
+RENDER_KEY = 'logs:{0}:{1}'
+RENDER_TTL = getattr(settings, 'LOG_RENDER_CACHE_TTL', 3600)
+# process pool for converting large logs
+_render_pool = None
+
+def read_frames(raw, tty=False):
+    """
+    Returns a generator of the output chunks of a docker log response
+
+    Containers without a tty multiplex stdout and stderr in frames with an
+    8 byte header ; tty containers stream the raw output.
+
+    :param raw: File like response body
+    :param tty: Whether the container has a tty
+
+    """
+    if tty:
+        while True:
+            data = raw.read(READ_SIZE)
+            if not data:
+                break
+            yield data
+        return
+    while True:
+        header = raw.read(STREAM_HEADER_SIZE)
+        if len(header) < STREAM_HEADER_SIZE:
+            break
+        _, length = struct.unpack('>BxxxL', header)
+        data = raw.read(length)
+        if not data:
+            break
+        yield data
+
+def split_lines(chunks):
+    """
+    Returns a generator of the lines in the chunks (with line endings)
+
+    """
+    partial = ''
+    for chunk in chunks:
+        lines = (partial + chunk).splitlines(True)
+        partial = ''
+        if lines and not lines[-1].endswith('\n'):
+            partial = lines.pop()
+        for line in lines:
+            yield line
+    if partial:
+        yield partial
+
+def parse_timestamp(line):
+    """
+    Splits a docker timestamped log line into a unix timestamp and the line
+
+    """
+    ts, _, line = line.partition(' ')
+    try:
+        ts = calendar.timegm(time.strptime(ts[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        return None, line
+    return ts, line
+
+def filter_lines(lines, tail=None, since=None, until=None, timestamps=False):
+    """
+    Applies the tail, since and until filters to log lines
+
+    Only `tail` lines are kept in memory.
+
+    :param lines: Iterable of log lines
+    :param tail: Only return the last `tail` lines
+    :param since: Only return lines logged at or after this unix timestamp
+    :param until: Only return lines logged before this unix timestamp
+    :param timestamps: Whether the lines are prefixed with docker timestamps
+        (required for `since` and `until` ; they are removed)
+
+    """
+    def filtered():
+        for line in lines:
+            if timestamps:
+                ts, line = parse_timestamp(line)
+                if ts is not None:
+                    if since is not None and ts < since:
+                        continue
+                    if until is not None and ts >= until:
+                        break
+            yield line
+    if tail is None:
+        return filtered()
+    return iter(deque(filtered(), maxlen=tail))
+
+def group_lines(lines, size=65536):
+    """
+    Groups lines into chunks of about `size` bytes
+
+    """
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+def get_render_pool():
+    """
+    Returns the process pool used to convert large logs or `None` if
+    disabled (`LOG_RENDER_PROCESSES`)
+
+    """
+    global _render_pool
+    processes = getattr(settings, 'LOG_RENDER_PROCESSES', 2)
+    if _render_pool is None and processes:
+        _render_pool = Pool(processes)
+    return _render_pool
+
+def _render_segment(args):
+    text, state = args
+    return utils.convert_ansi_to_html(text, state=state)
+
+def render_lines(lines, container_id=None, size=None, follow=False):
+    """
+    Returns a generator of the HTML of ANSI log lines
+
+    Lines are converted in segments of about `size` bytes keeping the ANSI
+    attributes across segments.  When `container_id` is given the lines
+    must be the complete log ; complete segments are then cached by
+    container id and byte offset so a refresh only converts the new tail.
+    When several segments of a window need converting they are converted
+    in the render process pool.
+
+    :param lines: Iterable of log lines
+    :param container_id: Container id to cache the segments for
+    :param size: Segment size (default `LOG_RENDER_SEGMENT_SIZE`)
+    :param follow: Render each line as soon as it is read
+
+    """
+    size = size or getattr(settings, 'LOG_RENDER_SEGMENT_SIZE', 65536)
+    window_size = 1 if follow else \
+        max(getattr(settings, 'LOG_RENDER_PROCESSES', 2) * 2, 8)
+    segments = group_lines(lines, 1 if follow else size)
+    state = []
+    offset = 0
+    while True:
+        window = list(itertools.islice(segments, window_size))
+        if not window:
+            break
+        offsets = []
+        for segment in window:
+            offsets.append(offset)
+            offset += len(segment)
+        keys = {}
+        if container_id and not follow:
+            # only complete segments are stable
+            keys = dict([(o, RENDER_KEY.format(container_id, o))
+                for o, segment in zip(offsets, window) if len(segment) >= size])
+        cached = cache.get_many(keys.values()) if keys else {}
+        jobs = []
+        for o, segment in zip(offsets, window):
+            entry = cached.get(keys.get(o))
+            if entry and entry.get('md5') != md5(segment).hexdigest():
+                entry = None
+            start = state
+            state = entry['state'] if entry else \
+                utils.get_ansi_state(segment, state)
+            jobs.append((o, segment, start, state, entry))
+        pending = [(x[1], x[2]) for x in jobs if x[4] is None]
+        pool = get_render_pool() if len(pending) > 1 else None
+        if pool is not None:
+            rendered = iter(pool.map(_render_segment, pending))
+        else:
+            rendered = iter(map(_render_segment, pending))
+        to_cache = {}
+        for o, segment, start, end, entry in jobs:
+            if entry is not None:
+                yield entry['html']
+                continue
+            html = next(rendered)
+            if o in keys:
+                to_cache[keys[o]] = {
+                    'md5': md5(segment).hexdigest(),
+                    'html': html,
+                    'state': end,
+                }
+            yield html
+        if to_cache:
+            cache.set_many(to_cache, RENDER_TTL)
@@ -11,24 +11,65 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext as _
 from django.db.models import Q
+from django.utils import timezone
+from containers import probe
 from shipyard import utils
+from datetime import datetime
+import hashlib
 import json
+import time
+
+# container fields extracted from the metadata (see `Container.get_summary`)
+SUMMARY_FIELDS = ('name', 'image', 'command', 'created', 'started',
+    'exit_code', 'ports')
+
+def parse_docker_time(value):
+    """
+    Parses a docker timestamp (`2014-06-01T12:00:00.123456789Z`) into an
+    aware datetime ; returns `None` for unset (`0001-01-01...`) or invalid
+    timestamps
+
+    """
+    if not value or value.startswith('0001-'):
+        return None
+    try:
+        dt = datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=timezone.utc)
 
 class Container(models.Model):
     container_id = models.CharField(max_length=96, null=True, blank=True)
     description = models.TextField(blank=True, null=True, default='')
-    meta = models.TextField(blank=True, null=True, default='{}')
-    is_running = models.BooleanField(default=True)
+    meta = models.BinaryField(blank=True, null=True,
+            help_text='Compressed container metadata (see `set_meta`)')
+    is_running = models.BooleanField(default=True, db_index=True)
     host = models.ForeignKey('hosts.Host', null=True, blank=True)
     owner = models.ForeignKey(User, null=True, blank=True)
     protected = models.BooleanField(default=False)
     synced = models.BooleanField(default=False, blank=True,
             help_text='Whether the agent has synced the container info')
     provisioning = models.TextField(blank=True, null=True, default='')
+    fingerprint = models.CharField(max_length=32, null=True, blank=True,
+            help_text='Hash of the container metadata')
+    # summary of the metadata ; kept in sync by `set_meta`
+    name = models.CharField(max_length=255, null=True, blank=True,
+            default='', db_index=True)
+    image = models.CharField(max_length=255, null=True, blank=True,
+            default='', db_index=True)
+    command = models.TextField(null=True, blank=True, default='')
+    created = models.DateTimeField(null=True, blank=True, db_index=True)
+    started = models.DateTimeField(null=True, blank=True, db_index=True)
+    exit_code = models.IntegerField(null=True, blank=True, db_index=True)
+    ports = models.CharField(max_length=255, null=True, blank=True,
+            default='', help_text='Published ports (host port->port/proto)')
+
+    class Meta:
+        unique_together = (('host', 'container_id'),)
 
     def __unicode__(self):
         d = self.get_short_id()
@@ -51,10 +92,88 @@ class Container(models.Model):
             return False
 
     def get_meta(self):
-        meta = {}
-        if self.meta:
-            meta = json.loads(self.meta)
-        return meta
+        return utils.load_json_blob(self.meta, {})
+
+    def set_meta(self, meta):
+        data = json.dumps(meta, sort_keys=True)
+        self.meta = utils.compress_json(data)
+        self.fingerprint = hashlib.md5(data).hexdigest()
+        for k, v in self.get_summary(meta).items():
+            setattr(self, k, v)
+        # written to the port binding table by `save`
+        self._port_bindings = self.get_port_bindings(meta)
+
+    def save(self, *args, **kwargs):
+        super(Container, self).save(*args, **kwargs)
+        bindings = getattr(self, '_port_bindings', None)
+        if bindings is not None:
+            PortBinding.replace({self.id: bindings})
+            self._port_bindings = None
+
+    @classmethod
+    def get_port_bindings(cls, meta):
+        """
+        Returns the `(port, protocol, host_interface, host_port)` of the
+        published ports in container metadata
+
+        :param meta: Container metadata
+
+        """
+        network_settings = meta.get('NetworkSettings') or {}
+        bindings = []
+        if network_settings.get('Ports') is not None:
+            for port_proto, host_list in network_settings.get('Ports').items():
+                port, sep, proto = port_proto.partition('/')
+                for host in host_list or []:
+                    if not host.get('HostPort'):
+                        continue
+                    bindings.append((int(port), proto or 'tcp',
+                        host.get('HostIp') or '0.0.0.0',
+                        int(host.get('HostPort'))))
+        else:
+            # docker versions prior to v0.6.5
+            port_mapping = network_settings.get('PortMapping') or {}
+            for proto, mapping in port_mapping.items():
+                for port, host_port in (mapping or {}).items():
+                    bindings.append((int(port), proto.lower(), '0.0.0.0',
+                        int(host_port)))
+        return bindings
+
+    @classmethod
+    def get_summary(cls, meta):
+        """
+        Returns the values of the summary fields for container metadata
+
+        :param meta: Container metadata (docker inspect or list output)
+
+        """
+        config = meta.get('Config') or {}
+        state = meta.get('State') or {}
+        name = meta.get('Name') or (meta.get('Names') or [''])[0]
+        command = config.get('Cmd') or config.get('Entrypoint') or \
+            meta.get('Command') or ''
+        if isinstance(command, list):
+            command = ' '.join(command)
+        ports = []
+        network_ports = (meta.get('NetworkSettings') or {}).get('Ports') or {}
+        for port_proto, bindings in sorted(network_ports.items()):
+            for b in bindings or []:
+                ports.append('{0}->{1}'.format(b.get('HostPort'), port_proto))
+        created = meta.get('Created')
+        if isinstance(created, (int, long)):
+            created = datetime.utcfromtimestamp(created).replace(
+                tzinfo=timezone.utc)
+        else:
+            created = parse_docker_time(created)
+        return {
+            'name': name.lstrip('/')[:255],
+            'image': (config.get('Image') or meta.get('Image') or '')[:255],
+            'command': command,
+            'created': created,
+            'started': parse_docker_time(state.get('StartedAt')),
+            'exit_code': state.get('ExitCode'),
+            'ports': ', '.join(ports)[:255],
+        }
 
     def get_provisioning(self):
       return self.provisioning
@@ -66,38 +185,81 @@ class Container(models.Model):
         from applications.models import Application
         return Application.objects.filter(containers__in=[self])
 
-    def is_available(self):
+    def get_probe_addresses(self):
+        """
+        Returns the `(host, port)` of each exposed port of the container
+
+        """
+        meta = self.get_meta()
+        exposed_ports = meta.get('Config', {}).get('ExposedPorts') or []
+        ports = (meta.get('NetworkSettings') or {}).get('Ports')
+        if not ports:
+            return []
+        host = self.host.get_hostname()
+        addresses = []
+        for e_port in exposed_ports:
+            port_defs = ports.get(e_port)
+            if port_defs:
+                addresses.append((host, int(port_defs[0].get('HostPort'))))
+        return addresses
+
+    def is_available(self, use_cache=True):
         """
         This will run through all ExposedPorts and attempt a connect.  If
         successful, returns True.  If there are no ExposedPorts, it is assumed
         that the container has completed and is available.
 
         """
-        meta = self.get_meta()
-        exposed_ports = meta.get('Config', {}).get('ExposedPorts', [])
-        available = True
-        port_checks = []
-        host = self.host.get_hostname()
-        # attempt to connect to check availability
-        meta_net = meta.get('NetworkSettings')
-        if meta_net.get('Ports') and len(meta_net.get('Ports')) != 0:
-            for e_port in exposed_ports:
-                ports = meta_net.get('Ports')
-                port_defs = ports[e_port]
-                if port_defs:
-                    port = port_defs[0].get('HostPort')
-                    try:
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.settimeout(1)
-                        s.connect((host, int(port)))
-                        port_checks.append(True)
-                        continue
-                    except Exception, e:
-                        port_checks.append(False)
-                        s.close()
-            if port_checks and False in port_checks:
-                available = False
-        return available
+        addresses = self.get_probe_addresses()
+        results = probe.probe(addresses, use_cache=use_cache)
+        return all([results[x] for x in addresses])
+
+    @classmethod
+    def get_availability(cls, containers, use_cache=True):
+        """
+        Checks the availability of the containers
+
+        The ports of all containers are probed at once.  Returns a dict of
+        container id to availability
+
+        """
+        addresses = dict([(c.container_id, c.get_probe_addresses())
+            for c in containers])
+        results = probe.probe([x for v in addresses.values() for x in v],
+            use_cache=use_cache)
+        return dict([(c_id, all([results[x] for x in v]))
+            for c_id, v in addresses.items()])
+
+    @classmethod
+    def wait_until_available(cls, container_ids, timeout=60, interval=1):
+        """
+        Waits until all containers are available or the timeout expires
+
+        Containers are reloaded each round to pick up the NAT ports reported
+        by the agent.  Returns the ids of the containers that are still
+        unavailable.
+
+        :param container_ids: List of container ids
+        :param timeout: Max amount of time in seconds to wait for all
+            containers
+        :param interval: Amount of time in seconds between checks
+
+        """
+        deadline = time.time() + timeout
+        pending = list(container_ids)
+        while pending:
+            containers = cls.objects.filter(container_id__in=pending).\
+                select_related('host')
+            availability = cls.get_availability(containers, use_cache=False)
+            pending = [x for x in pending if not availability.get(x)]
+            remaining = deadline - time.time()
+            if not pending or remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+        return pending
+
+    def start(self):
+        return self.host.start_container(container_id=self.container_id)
 
     def restart(self):
         return self.host.restart_container(container_id=self.container_id)
@@ -112,22 +274,15 @@ class Container(models.Model):
         return self.host.destroy_container(container_id=self.container_id)
 
     def get_ports(self):
-        meta = self.get_meta()
-        network_settings = meta.get('NetworkSettings', {})
+        """
+        Returns the published ports of the container
+        (`{'port/proto': {host_interface: host_port}}`)
+
+        """
         ports = {}
-        if self.host.version < '0.6.5':
-            # for verions prior to docker v0.6.5
-            port_mapping = network_settings.get('PortMapping')
-            for proto in port_mapping:
-                for port, external_port in port_mapping[proto].items():
-                    port_proto = "{0}/{1}".format(port, proto)
-                    ports[port_proto] = { '0.0.0.0': external_port }
-        else:
-            # for versions after docker v0.6.5
-            if network_settings.get('Ports') != None:
-                for port_proto, host_list in network_settings.get('Ports', {}).items():
-                    for host in host_list or []:
-                        ports[port_proto] = { host.get('HostIp'): host.get('HostPort') }
+        for b in self.port_bindings.all():
+            ports.setdefault(b.get_port_proto(), {})[b.host_interface] = \
+                str(b.host_port)
         return ports
 
     def get_memory_limit(self):
@@ -142,3 +297,47 @@ class Container(models.Model):
         if self.description:
             d = self.description
         return d
+
+class PortBinding(models.Model):
+    """
+    A published port of a container
+
+    Kept in sync with the container metadata so routing and port links
+    can be resolved without parsing the metadata.
+
+    """
+    container = models.ForeignKey(Container, related_name='port_bindings')
+    port = models.PositiveIntegerField(help_text='Container port')
+    protocol = models.CharField(max_length=8, default='tcp')
+    host_interface = models.CharField(max_length=64, default='0.0.0.0')
+    host_port = models.PositiveIntegerField(db_index=True)
+
+    class Meta:
+        index_together = (('port', 'protocol', 'host_interface'),)
+
+    def __unicode__(self):
+        return '{0}:{1}->{2}'.format(self.host_interface, self.host_port,
+            self.get_port_proto())
+
+    def get_port_proto(self):
+        return '{0}/{1}'.format(self.port, self.protocol)
+
+    @classmethod
+    def replace(cls, bindings):
+        """
+        Replaces the port bindings of containers
+
+        :param bindings: Dict of container pk to a list of
+            `(port, protocol, host_interface, host_port)` (see
+            `Container.get_port_bindings`)
+
+        """
+        if not bindings:
+            return
+        with transaction.atomic():
+            cls.objects.filter(container__in=bindings.keys()).delete()
+            cls.objects.bulk_create([cls(container_id=pk, port=port,
+                protocol=proto, host_interface=interface,
+                host_port=host_port)
+                for pk, values in bindings.items()
+                for port, proto, interface, host_port in values])
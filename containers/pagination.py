@@ -0,0 +1,175 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.db.models import Q
+from django.utils.http import urlencode
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+import base64
+import json
+
+# sort keys and the fields they order by ; rows are ordered by id within
+# equal values so the (value, id) cursor is unique
+SORT_FIELDS = {
+    'name': 'name',
+    'image': 'image',
+    'host': 'host__name',
+    'id': 'id',
+}
+# sort fields that can be NULL (containers without a host or hosts
+# without a name) ; NULLs are paged as a separate segment ordered by id,
+# before the other values (after them when descending)
+NULLABLE_FIELDS = ('host__name',)
+STATES = ('running', 'stopped', 'all')
+
+def filter_containers(containers, host=None, image=None, owner=None,
+    state=None, name=None):
+    """
+    Applies the list filters to a container queryset
+
+    :param containers: Container queryset
+    :param host: Host name
+    :param image: Image name (`:latest` is assumed without a tag)
+    :param owner: Owner username
+    :param state: `running`, `stopped` or `all`
+    :param name: Container name prefix
+
+    """
+    if host:
+        containers = containers.filter(host__name=host)
+    if image:
+        tag = image if ':' in image else '{0}:latest'.format(image)
+        containers = containers.filter(image__in=(image, tag))
+    if owner:
+        containers = containers.filter(owner__username=owner)
+    if state == 'running':
+        containers = containers.filter(is_running=True)
+    elif state == 'stopped':
+        containers = containers.filter(is_running=False)
+    if name:
+        containers = containers.filter(name__startswith=name)
+    return containers
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(json.dumps([value, pk]))
+
+def decode_cursor(cursor):
+    """
+    Returns the `(value, id)` of a cursor ; raises `ValueError` if it is
+    invalid
+
+    """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    return value, int(pk)
+
+def _get_value(container, field):
+    value = container
+    for attr in field.split('__'):
+        value = getattr(value, attr, None)
+    return value
+
+def paginate(containers, sort=None, cursor=None, limit=None):
+    """
+    Returns a page of containers and the cursor of the next page
+
+    Pages are selected by the sort value and id of the last container of
+    the previous page (keyset pagination) so every page costs the same
+    indexed range scan however deep it is.
+
+    :param containers: Container queryset
+    :param sort: Key of `SORT_FIELDS` ; prefix with `-` for descending
+    :param cursor: Cursor returned for the previous page
+    :param limit: Number of containers per page
+
+    """
+    sort = sort or 'name'
+    desc = sort.startswith('-')
+    field = SORT_FIELDS.get(sort.lstrip('-'))
+    if not field:
+        raise ValueError('Invalid sort: {0}'.format(sort))
+    if not limit or limit < 1:
+        limit = getattr(settings, 'CONTAINER_PAGE_SIZE', 100)
+    order = [field, 'id'] if field != 'id' else ['id']
+    containers = containers.order_by(
+        *[('-' if desc else '') + x for x in order])
+    if field == 'host__name':
+        containers = containers.select_related('host')
+    op = '__lt' if desc else '__gt'
+    # (NULL segment, queryset) read in page order
+    segments = [(False, containers)]
+    if field in NULLABLE_FIELDS:
+        segments = [
+            (True, containers.filter(**{field + '__isnull': True})),
+            (False, containers.filter(**{field + '__isnull': False})),
+        ]
+        if desc:
+            segments.reverse()
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        is_null = value is None and field in NULLABLE_FIELDS
+        # skip the segment before the one of the cursor
+        if segments[0][0] != is_null:
+            segments.pop(0)
+        first = segments[0][1]
+        q = Q(**{'id' + op: pk})
+        if field != 'id' and not is_null:
+            q = Q(**{field + op: value}) | (Q(**{field: value}) & q)
+        segments[0] = (is_null, first.filter(q))
+    page = []
+    for is_null, segment in segments:
+        page.extend(segment[:limit + 1 - len(page)])
+        if len(page) > limit:
+            break
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(_get_value(page[-1], field), page[-1].id)
+    return page, next_cursor
+
+class KeysetPaginator(Paginator):
+    """
+    Tastypie paginator using `paginate`
+
+    Requests with an `offset` (and no `cursor`) are paginated by offset as
+    before.
+
+    """
+    def page(self):
+        cursor = self.request_data.get('cursor')
+        if self.request_data.get('offset') and not cursor:
+            return super(KeysetPaginator, self).page()
+        limit = self.get_limit() or self.max_limit
+        sort = self.request_data.get('sort')
+        try:
+            objects, next_cursor = paginate(self.objects, sort, cursor, limit)
+        except ValueError, e:
+            raise BadRequest(str(e))
+        meta = {
+            'limit': limit,
+            'sort': sort or 'name',
+            'next': None,
+        }
+        if next_cursor:
+            params = dict([(k, v) for k, v in self.request_data.items()
+                if k not in ('cursor', 'offset')])
+            params['cursor'] = next_cursor
+            meta['next'] = '{0}?{1}'.format(self.resource_uri,
+                urlencode(params))
+        return {
+            self.collection_name: objects,
+            'meta': meta,
+        }
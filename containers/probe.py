@@ -0,0 +1,121 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+import errno
+import select
+import socket
+import time
+
+# in process probe results ({(host, port): (expires, available)})
+_cache = {}
+
+def _connect(address):
+    """
+    Starts a non-blocking connect and returns the socket and whether the
+    connect already completed
+
+    """
+    host, port = address
+    info = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    s = socket.socket(info[0], info[1], info[2])
+    s.setblocking(0)
+    err = s.connect_ex(info[4])
+    if err == 0:
+        return s, True
+    if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+        return s, False
+    s.close()
+    raise socket.error(err, 'connect failed')
+
+def _wait(pending, timeout):
+    """
+    Waits for the pending connects until they finish or `timeout` expires
+
+    Returns a dict of address to whether the connect succeeded
+
+    :param pending: Dict of file descriptor to `(address, socket)`
+
+    """
+    results = {}
+    deadline = time.time() + timeout
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        for fd in pending:
+            poller.register(fd, select.POLLOUT | select.POLLERR |
+                select.POLLHUP)
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if hasattr(select, 'poll'):
+            ready = [fd for fd, ev in poller.poll(remaining * 1000)]
+        else:
+            ready = select.select([], pending.keys(), pending.keys(),
+                remaining)[1]
+        for fd in ready:
+            address, s = pending.pop(fd)
+            if hasattr(select, 'poll'):
+                poller.unregister(fd)
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            results[address] = err == 0
+            s.close()
+    for address, s in pending.values():
+        results[address] = False
+        s.close()
+    return results
+
+def probe(addresses, timeout=None, use_cache=True):
+    """
+    Checks whether TCP connections can be made to the addresses
+
+    All connects are started at once and multiplexed with poll/select so
+    any number of addresses take at most one `timeout` to check.  Results
+    are cached in process for `CONTAINER_PROBE_TTL` seconds.
+
+    Returns a dict of `(host, port)` to availability
+
+    :param addresses: Iterable of `(host, port)` tuples
+    :param timeout: Amount of time in seconds to wait for connects
+        (default `CONTAINER_PROBE_TIMEOUT`)
+    :param use_cache: Return cached results when available
+
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CONTAINER_PROBE_TIMEOUT', 1)
+    ttl = getattr(settings, 'CONTAINER_PROBE_TTL', 2)
+    now = time.time()
+    results = {}
+    fresh = {}
+    pending = {}
+    for address in set([(h, int(p)) for h, p in addresses]):
+        entry = _cache.get(address)
+        if use_cache and entry and entry[0] > now:
+            results[address] = entry[1]
+            continue
+        try:
+            s, connected = _connect(address)
+        except socket.error:
+            fresh[address] = False
+            continue
+        if connected:
+            fresh[address] = True
+            s.close()
+        else:
+            pending[s.fileno()] = (address, s)
+    fresh.update(_wait(pending, timeout))
+    expires = time.time() + ttl
+    for address, available in fresh.items():
+        _cache[address] = (expires, available)
+    results.update(fresh)
+    return results
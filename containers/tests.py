@@ -1,8 +1,20 @@
 from tastypie.test import ResourceTestCase
 from django.contrib.auth.models import User
-from containers.models import Container
+from django.core.cache import get_cache
+from django.test import TestCase
+from containers import launch, logs, pagination, probe
+from commands.models import Commands
+from containers.models import Container, PortBinding
+from hosts import models
 from hosts.models import Host
+from shipyard import tasks, utils
+from StringIO import StringIO
+import json
+import mock
 import os
+import socket
+import struct
+import time
 
 class ContainerResourceTest(ResourceTestCase):
 
@@ -107,3 +119,707 @@ class ContainerResourceTest(ResourceTestCase):
             authentication=self.get_credentials())
         self.assertHttpAccepted(resp)
 
+
+class ContainerLaunchTest(TestCase):
+
+    def setUp(self):
+        self.hosts = []
+        for x in range(3):
+            host = Host()
+            host.name = 'host{}'.format(x)
+            host.hostname = '10.0.0.{}'.format(x)
+            host.save()
+            self.hosts.append(host.id)
+        patcher = mock.patch('containers.launch.cache',
+            get_cache('django.core.cache.backends.locmem.LocMemCache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_launch_batch(self):
+        """
+        Test a batch launches on every host and records each result
+        """
+        def create_container(host, **kwargs):
+            if host.name == 'host1':
+                raise StandardError('unavailable')
+            return 'c-{}'.format(kwargs.get('prov_obj').get('ip')), True
+        batch_id = launch.create_batch(self.hosts)
+        self.assertEqual(launch.get_batch(batch_id).get('status'), 'pending')
+        with mock.patch.object(Host, 'create_container', autospec=True,
+                side_effect=create_container):
+            results = launch.launch_batch(batch_id, self.hosts,
+                ['ip0', 'ip1', 'ip2'], image='base')
+        self.assertEqual([x[0] for x in results], ['c-ip0', None, 'c-ip2'])
+        batch = launch.get_batch(batch_id)
+        self.assertEqual(batch.get('status'), 'finished')
+        statuses = batch.get('hosts')
+        self.assertEqual(statuses[str(self.hosts[0])].get('container_id'),
+            'c-ip0')
+        self.assertEqual(statuses[str(self.hosts[1])].get('status'), 'failed')
+        self.assertEqual(statuses[str(self.hosts[1])].get('error'),
+            'unavailable')
+        self.assertEqual(statuses[str(self.hosts[2])].get('status'), 'created')
+
+    def test_launch_not_started(self):
+        """
+        Test containers that did not start are counted as failed
+        """
+        def create_container(host, **kwargs):
+            return 'c-{}'.format(host.name), host.name != 'host1'
+        batch_id = launch.create_batch(self.hosts)
+        with mock.patch.object(Host, 'create_container', autospec=True,
+                side_effect=create_container):
+            result = tasks.launch_containers(batch_id, self.hosts,
+                ['ip0', 'ip1', 'ip2'], image='base')
+        self.assertEqual(result, 'Launched 2 of 3 containers (1 failed)')
+        batch = launch.get_batch(batch_id)
+        self.assertEqual(batch.get('created'), 2)
+        self.assertEqual(batch.get('failed'), 1)
+        self.assertEqual(batch.get('hosts')[str(self.hosts[1])].get('status'),
+            'failed')
+
+    def test_launch_provisioning_serialized(self):
+        """
+        Test fabric provisioning does not run concurrently
+        """
+        active = []
+        overlaps = []
+        def command(host, name, ip):
+            active.append(host)
+            if len(active) > 1:
+                overlaps.append(host)
+            time.sleep(0.05)
+            active.remove(host)
+        def create_container(host, **kwargs):
+            prov_obj = kwargs.get('prov_obj')
+            Commands.execute(host.hostname, prov_obj.get('name'),
+                prov_obj.get('ip'))
+            return 'c-{}'.format(host.name), True
+        batch_id = launch.create_batch(self.hosts)
+        with mock.patch.object(Host, 'create_container', autospec=True,
+                side_effect=create_container), \
+                mock.patch('commands.fabfile.command', side_effect=command):
+            results = launch.launch_batch(batch_id, self.hosts,
+                ['ip0', 'ip1', 'ip2'], image='base')
+        self.assertEqual([x[1] for x in results], [None, None, None])
+        self.assertEqual(overlaps, [])
+
+class ContainerReadinessTest(ResourceTestCase):
+
+    def setUp(self):
+        super(ContainerReadinessTest, self).setUp()
+        self.username = 'testuser'
+        self.password = 'testpass'
+        self.user = User.objects.create_user(self.username,
+            'testuser@example.com', self.password)
+        self.api_key = self.user.api_key.key
+        host = Host()
+        host.name = 'local'
+        host.hostname = '127.0.0.1'
+        host.save()
+        for c_id, port in (('abc', '49153'), ('def', '49154')):
+            c = Container(container_id=c_id, host=host)
+            c.set_meta({
+                'Config': {'ExposedPorts': {'80/tcp': {}}},
+                'NetworkSettings': {'Ports': {
+                    '80/tcp': [{'HostIp': '0.0.0.0', 'HostPort': port}],
+                }},
+            })
+            c.save()
+
+    def get_credentials(self):
+        return self.create_apikey(self.username, self.api_key)
+
+    def test_wait_until_available(self):
+        """
+        Test waiting returns the containers still unavailable
+        """
+        def probe(addresses, **kwargs):
+            return dict([(x, x[1] == 49153) for x in addresses])
+        with mock.patch('containers.probe.probe', side_effect=probe):
+            pending = Container.wait_until_available(['abc', 'def'],
+                timeout=0)
+        self.assertEqual(pending, ['def'])
+
+    def test_ready(self):
+        """
+        Test the readiness view checks every requested container
+        """
+        url = '/api/v1/containers/ready/?id=abc&id=def'
+        def probe(addresses, **kwargs):
+            return dict([(x, available) for x in addresses])
+        available = True
+        with mock.patch('containers.probe.probe', side_effect=probe):
+            resp = self.api_client.get(url, format='json',
+                authentication=self.get_credentials())
+            self.assertValidJSONResponse(resp)
+            data = self.deserialize(resp)
+            self.assertTrue(data.get('ready'))
+            self.assertEqual(data.get('containers'),
+                {'abc': True, 'def': True})
+            available = False
+            resp = self.api_client.get(url, format='json',
+                authentication=self.get_credentials())
+        self.assertFalse(self.deserialize(resp).get('ready'))
+
+class ContainerProbeTest(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.addCleanup(self.server.close)
+        self.addCleanup(probe._cache.clear)
+        self.open_port = self.server.getsockname()[1]
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        self.closed_port = s.getsockname()[1]
+        s.close()
+
+    def test_probe(self):
+        """
+        Test probing reports open and closed ports
+        """
+        open_addr = ('127.0.0.1', self.open_port)
+        closed_addr = ('127.0.0.1', self.closed_port)
+        results = probe.probe([open_addr, closed_addr], timeout=1)
+        self.assertEqual(results, {open_addr: True, closed_addr: False})
+
+    def test_probe_cached(self):
+        """
+        Test probe results are cached
+        """
+        addr = ('127.0.0.1', self.open_port)
+        self.assertTrue(probe.probe([addr])[addr])
+        self.server.close()
+        self.assertTrue(probe.probe([addr])[addr])
+        self.assertFalse(probe.probe([addr], use_cache=False)[addr])
+
+class ContainerBulkTest(ResourceTestCase):
+
+    def setUp(self):
+        super(ContainerBulkTest, self).setUp()
+        self.username = 'testuser'
+        self.password = 'testpass'
+        self.user = User.objects.create_user(self.username,
+            'testuser@example.com', self.password)
+        self.api_key = self.user.api_key.key
+        self.api_bulk_url = '/api/v1/containers/bulk/'
+        for x in range(2):
+            host = Host()
+            host.name = 'host{}'.format(x)
+            host.hostname = '10.0.0.{}'.format(x)
+            host.save()
+            for y in range(3):
+                c = Container(container_id='c{}{}'.format(x, y), host=host)
+                c.set_meta({'Config': {'Image': 'base:latest'}})
+                c.save()
+        Container.objects.filter(container_id='c00').update(protected=True)
+        self.docker = mock.MagicMock()
+        patcher = mock.patch.object(Host, '_get_client',
+            return_value=self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_credentials(self):
+        return self.create_apikey(self.username, self.api_key)
+
+    def test_bulk_destroy(self):
+        """
+        Test bulk destroy removes the selected unprotected containers
+        """
+        # mock call counts are not thread safe
+        removed = []
+        self.docker.remove_container.side_effect = lambda *args, **kwargs: \
+            removed.append(args) or mock.DEFAULT
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'destroy', 'image': 'base'},
+            authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(data.get('succeeded'), 5)
+        self.assertEqual(data.get('failed'), 1)
+        self.assertTrue(data.get('results').get('c00'))
+        self.assertEqual(len(removed), 5)
+        ids = Container.objects.values_list('container_id', flat=True)
+        self.assertEqual(list(ids), ['c00'])
+
+    def test_bulk_restart_selectors(self):
+        """
+        Test bulk actions only run on containers matching every selector
+        """
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'restart', 'host': 'host1', 'ids': ['c10', 'c0']},
+            authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        self.assertEqual(self.deserialize(resp).get('results'), {'c10': None})
+        self.docker.restart.assert_called_once_with('c10')
+
+    def test_bulk_start(self):
+        """
+        Test bulk start starts the containers without restarting them
+        """
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'start', 'ids': ['c11']},
+            authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        self.assertEqual(self.deserialize(resp).get('results'), {'c11': None})
+        self.docker.start.assert_called_once_with('c11')
+        self.assertFalse(self.docker.restart.called)
+
+    def test_bulk_many_ids(self):
+        """
+        Test bulk actions select a thousand full ids and id prefixes
+        """
+        host = Host.objects.get(name='host1')
+        container_ids = ['{0:064x}'.format(x) for x in range(1000)]
+        Container.objects.bulk_create([Container(container_id=x, host=host,
+            image='other:latest') for x in container_ids])
+        ids = container_ids[:500] + [utils.get_short_id(x)
+            for x in container_ids[500:]]
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'stop', 'ids': ids, 'image': 'other'},
+            authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(data.get('succeeded'), 1000)
+        self.assertEqual(sorted(data.get('results')), container_ids)
+
+    def test_bulk_invalid(self):
+        """
+        Test bulk actions require an action and a selector
+        """
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'destroy'}, authentication=self.get_credentials())
+        self.assertHttpBadRequest(resp)
+        resp = self.api_client.post(self.api_bulk_url, format='json',
+            data={'action': 'kill', 'host': 'host0'},
+            authentication=self.get_credentials())
+        self.assertHttpBadRequest(resp)
+        self.assertEqual(Container.objects.count(), 6)
+
+class ContainerCreateTest(ResourceTestCase):
+
+    def setUp(self):
+        super(ContainerCreateTest, self).setUp()
+        self.username = 'testuser'
+        self.password = 'testpass'
+        self.user = User.objects.create_user(self.username,
+            'testuser@example.com', self.password)
+        self.api_key = self.user.api_key.key
+        self.api_list_url = '/api/v1/containers/'
+        self.hosts = []
+        for x in range(3):
+            host = Host()
+            host.name = 'host{}'.format(x)
+            host.hostname = '10.0.0.{}'.format(x)
+            host.save()
+            self.hosts.append(host)
+
+    def get_credentials(self):
+        return self.create_apikey(self.username, self.api_key)
+
+    def test_create_partial_failure(self):
+        """
+        Test the containers started are reported when some hosts fail
+        """
+        def create_container(host, **kwargs):
+            if host.name == 'host1':
+                raise StandardError('no such image')
+            return 'c-{}'.format(host.name), 'running'
+        urls = ['/api/v1/hosts/{}/'.format(x.id) for x in self.hosts]
+        with mock.patch.object(Host, 'create_container', autospec=True,
+                side_effect=create_container):
+            resp = self.api_client.post(self.api_list_url, format='json',
+                data={'image': 'base', 'hosts': urls},
+                authentication=self.get_credentials())
+        self.assertHttpApplicationError(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(sorted(data.get('containers')),
+            ['c-host0', 'c-host2'])
+        self.assertEqual(data.get('errors'), {urls[1]: 'no such image'})
+
+class ContainerSummaryTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.save()
+        self.meta = {
+            'Id': 'abc',
+            'Name': '/web',
+            'Created': '2014-06-01T12:00:00.123456789Z',
+            'Config': {'Image': 'base:latest', 'Cmd': ['/bin/sh', 'run.sh']},
+            'State': {'Running': False, 'ExitCode': 2,
+                'StartedAt': '0001-01-01T00:00:00Z'},
+            'NetworkSettings': {'Ports': {'80/tcp': [{'HostIp': '0.0.0.0',
+                'HostPort': '49153'}]}},
+        }
+
+    def test_set_meta_summary(self):
+        """
+        Test the summary fields are extracted from the metadata
+        """
+        c = Container(container_id='abc', host=self.host)
+        c.set_meta(self.meta)
+        c.save()
+        c = Container.objects.get(name='web', image='base:latest')
+        self.assertEqual(c.command, '/bin/sh run.sh')
+        self.assertEqual(c.exit_code, 2)
+        self.assertEqual(c.created.year, 2014)
+        self.assertEqual(c.started, None)
+        self.assertEqual(c.ports, '49153->80/tcp')
+
+    def test_meta_compressed(self):
+        """
+        Test the metadata is stored compressed and decoded transparently
+        """
+        c = Container(container_id='abc', host=self.host)
+        c.set_meta(self.meta)
+        c.save()
+        c = Container.objects.get(container_id='abc')
+        self.assertEqual(c.get_meta(), self.meta)
+        self.assertTrue(len(str(c.meta)) < len(json.dumps(self.meta)))
+        # rows stored before compression
+        c.meta = json.dumps(self.meta)
+        self.assertEqual(c.get_meta(), self.meta)
+
+    def test_sync_summary(self):
+        """
+        Test agent syncs update the summary fields
+        """
+        self.host.sync_containers([{'Container': {'Id': 'abc'},
+            'Meta': self.meta}])
+        self.meta['Config']['Image'] = 'base:1'
+        self.meta['State'] = {'Running': True, 'ExitCode': 0,
+            'StartedAt': '2014-06-02T08:00:00Z'}
+        self.host.sync_containers([{'Container': {'Id': 'abc'},
+            'Meta': self.meta}])
+        c = Container.objects.get(container_id='abc')
+        self.assertEqual(c.image, 'base:1')
+        self.assertEqual(c.exit_code, 0)
+        self.assertEqual(c.started.day, 2)
+
+class ContainerPaginationTest(ResourceTestCase):
+
+    def setUp(self):
+        super(ContainerPaginationTest, self).setUp()
+        self.username = 'testuser'
+        self.password = 'testpass'
+        self.user = User.objects.create_user(self.username,
+            'testuser@example.com', self.password)
+        self.api_key = self.user.api_key.key
+        self.api_list_url = '/api/v1/containers/'
+        for x in range(2):
+            host = Host()
+            host.name = 'host{}'.format(x)
+            host.hostname = '10.0.0.{}'.format(x)
+            host.enabled = True
+            host.save()
+            for y in range(5):
+                c = Container(container_id='c{}{}'.format(x, y), host=host,
+                    is_running=y != 4)
+                c.set_meta({'Name': '/app{}'.format(y % 3),
+                    'Config': {'Image': 'base:latest' if y % 2 else 'web:1'}})
+                c.save()
+
+    def get_credentials(self):
+        return self.create_apikey(self.username, self.api_key)
+
+    def collect(self, containers, sort, limit):
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = pagination.paginate(containers, sort, cursor,
+                limit)
+            pages.append([x.container_id for x in page])
+            if not cursor:
+                return pages
+
+    def test_paginate(self):
+        """
+        Test every container is returned once in sort order across pages
+        """
+        containers = Container.objects.all()
+        for sort in ('name', '-name', 'host', 'image', '-id'):
+            pages = self.collect(containers, sort, 3)
+            prefix = '-' if sort.startswith('-') else ''
+            expected = containers.order_by(
+                prefix + pagination.SORT_FIELDS[sort.lstrip('-')],
+                prefix + 'id').values_list('container_id', flat=True)
+            self.assertEqual([x for p in pages for x in p], list(expected))
+            self.assertEqual([len(x) for x in pages], [3, 3, 3, 1])
+
+    def test_paginate_null_host_name(self):
+        """
+        Test pages continue past containers whose host has no name
+        """
+        host = Host(hostname='10.0.0.9')
+        host.save()
+        for y in range(4):
+            Container(container_id='n{}'.format(y), host=host).save()
+        Container(container_id='none').save()
+        containers = Container.objects.all()
+        for sort in ('host', '-host'):
+            pages = self.collect(containers, sort, 3)
+            ids = [x for p in pages for x in p]
+            self.assertEqual(len(ids), 15)
+            self.assertEqual(set(ids), set(containers.values_list(
+                'container_id', flat=True)))
+            nulls = ['n0', 'n1', 'n2', 'n3', 'none']
+            if sort.startswith('-'):
+                self.assertEqual(ids[-5:], nulls[::-1])
+            else:
+                self.assertEqual(ids[:5], nulls)
+
+    def test_paginate_invalid(self):
+        """
+        Test invalid sort keys and cursors are rejected
+        """
+        containers = Container.objects.all()
+        self.assertRaises(ValueError, pagination.paginate, containers,
+            'meta')
+        self.assertRaises(ValueError, pagination.paginate, containers,
+            'name', 'invalid')
+
+    def test_filter(self):
+        """
+        Test containers are filtered by host, image, state and name
+        """
+        containers = pagination.filter_containers(Container.objects.all(),
+            host='host1', image='base', state='running', name='app1')
+        self.assertEqual([x.container_id for x in containers], ['c11'])
+        containers = pagination.filter_containers(Container.objects.all(),
+            state='stopped')
+        self.assertEqual(containers.count(), 2)
+
+    def test_index_view(self):
+        """
+        Test the container list is paginated
+        """
+        self.client.login(username=self.username, password=self.password)
+        with self.settings(CONTAINER_PAGE_SIZE=5):
+            resp = self.client.get('/containers/', {'sort': 'name'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['containers']), 5)
+        resp = self.client.get(resp.context['next_url'])
+        self.assertEqual(len(resp.context['containers']), 3)
+        self.assertEqual(resp.context['next_url'], None)
+
+    def test_api_list(self):
+        """
+        Test the API list is paginated by cursor without metadata
+        """
+        resp = self.api_client.get(self.api_list_url, format='json',
+            data={'limit': 4, 'state': 'all', 'host': 'host0'},
+            authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(len(data.get('objects')), 4)
+        self.assertFalse('meta' in data.get('objects')[0])
+        self.assertTrue(isinstance(data.get('objects')[0].get('host'),
+            basestring))
+        resp = self.api_client.get(data.get('meta').get('next'),
+            format='json', authentication=self.get_credentials())
+        data = self.deserialize(resp)
+        self.assertEqual(len(data.get('objects')), 1)
+        self.assertEqual(data.get('meta').get('next'), None)
+
+class ContainerPortBindingTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.save()
+
+    def meta(self, c_id, host_port, host_ip='0.0.0.0'):
+        return {
+            'Id': c_id,
+            'State': {'Running': True},
+            'NetworkSettings': {'Ports': {
+                '80/tcp': [{'HostIp': host_ip, 'HostPort': str(host_port)}],
+                '443/tcp': None,
+            }},
+        }
+
+    def test_set_meta_bindings(self):
+        """
+        Test saving container metadata replaces its port bindings
+        """
+        c = Container(container_id='abc', host=self.host)
+        c.set_meta(self.meta('abc', 49153))
+        c.save()
+        self.assertEqual(c.get_ports(), {'80/tcp': {'0.0.0.0': '49153'}})
+        c.set_meta(self.meta('abc', 49154, '10.0.0.1'))
+        c.save()
+        b = PortBinding.objects.get(container=c)
+        self.assertEqual((b.port, b.protocol, b.host_interface, b.host_port),
+            (80, 'tcp', '10.0.0.1', 49154))
+
+    def test_legacy_port_mapping(self):
+        """
+        Test port mappings of docker versions prior to v0.6.5
+        """
+        meta = {'NetworkSettings': {'PortMapping': {
+            'Tcp': {'80': '49153'}, 'Udp': {}}}}
+        self.assertEqual(Container.get_port_bindings(meta),
+            [(80, 'tcp', '0.0.0.0', 49153)])
+
+    def test_sync_bindings(self):
+        """
+        Test agent syncs maintain the port bindings
+        """
+        self.host.sync_containers([{'Container': {'Id': x},
+            'Meta': self.meta(x, 49153 + n)} for n, x in enumerate('abc')])
+        self.assertEqual(PortBinding.objects.count(), 3)
+        self.host.sync_containers([{'Container': {'Id': 'a'},
+            'Meta': self.meta('a', 50000)}])
+        b = PortBinding.objects.get()
+        self.assertEqual((b.container.container_id, b.host_port), ('a', 50000))
+
+    def test_upstreams(self):
+        """
+        Test application upstreams are resolved from the port bindings
+        """
+        from applications.models import Application
+        with mock.patch('shipyard.utils.update_hipache'):
+            app = Application.objects.create(name='app',
+                domain_name='app.local', backend_port='80', protocol='http')
+            for n in range(3):
+                c = Container(container_id='c{0}'.format(n), host=self.host)
+                c.set_meta(self.meta(c.container_id, 49153 + n))
+                c.save()
+                app.containers.add(c)
+        with self.assertNumQueries(2):
+            upstreams = utils.get_upstreams(app)
+        self.assertEqual(sorted(upstreams), ['http://127.0.0.1:49153',
+            'http://127.0.0.1:49154', 'http://127.0.0.1:49155'])
+        app.backend_port = '443'
+        self.assertRaises(KeyError, utils.get_upstreams, app)
+
+class ContainerLogsTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.save()
+        self.host.update_capabilities('0.10.0')
+        self.addCleanup(models._capability_cache.clear)
+        Container(container_id='abc', host=self.host).save()
+        self.docker = mock.MagicMock()
+        self.docker._url.side_effect = lambda x: x
+        patcher = mock.patch.object(Host, '_get_client',
+            return_value=self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def frame(self, data):
+        return struct.pack('>BxxxL', 1, len(data)) + data
+
+    def set_logs(self, data):
+        self.docker.get.return_value.raw = StringIO(''.join(
+            [self.frame(x) for x in data]))
+
+    def test_read_frames(self):
+        """
+        Test multiplexed and tty log streams are read incrementally
+        """
+        raw = StringIO(self.frame('one\ntw') + self.frame('o\n'))
+        self.assertEqual(list(logs.split_lines(logs.read_frames(raw))),
+            ['one\n', 'two\n'])
+        raw = StringIO('one\ntwo')
+        self.assertEqual(list(logs.split_lines(logs.read_frames(raw,
+            tty=True))), ['one\n', 'two'])
+
+    def test_get_container_logs_tail(self):
+        """
+        Test only the tail of the logs is returned
+        """
+        self.set_logs(['line{}\n'.format(x) for x in range(10)])
+        self.assertEqual(self.host.get_container_logs('abc', tail=2),
+            'line8\nline9\n')
+        self.assertEqual(self.docker.get.call_args[1]['params']['tail'], 2)
+
+    def test_get_container_logs_since(self):
+        """
+        Test logs are filtered by time using docker timestamps
+        """
+        self.set_logs([
+            '2014-05-01T00:00:00.000000001Z old\n',
+            '2014-05-01T00:01:00.000000001Z new\n',
+            '2014-05-01T00:02:00.000000001Z newer\n',
+        ])
+        logs = self.host.get_container_logs('abc', since=1398902460,
+            until=1398902520)
+        self.assertEqual(logs, 'new\n')
+        self.assertEqual(self.docker.get.call_args[1]['params']['timestamps'],
+            1)
+
+    def test_get_container_logs_follow(self):
+        """
+        Test followed logs are read from a single logs request
+        """
+        self.set_logs(['line{}\n'.format(x) for x in range(3)])
+        lines = self.host.get_container_logs('abc', tail=2, follow=True)
+        self.assertEqual(list(lines), ['line0\n', 'line1\n', 'line2\n'])
+        params = self.docker.get.call_args[1]['params']
+        self.assertEqual((params['follow'], params['tail']), (1, 2))
+        self.assertEqual(self.docker.get.call_args[1]['timeout'], None)
+        self.assertFalse(self.docker.post.called)
+
+    def test_get_container_logs_follow_attach(self):
+        """
+        Test logs are followed by attaching on docker versions before 0.10
+        """
+        self.host.update_capabilities('0.9.1')
+        self.docker.post.return_value.raw = StringIO(self.frame('old\n'))
+        lines = self.host.get_container_logs('abc', follow=True)
+        self.docker.post.return_value.raw = StringIO(self.frame('new\n'))
+        self.assertEqual(list(lines), ['old\n', 'new\n'])
+        self.assertEqual(self.docker.post.call_args[1]['params']['stream'], 1)
+
+    def test_get_container_logs_since_unsupported(self):
+        """
+        Test time filters are rejected on hosts without the logs endpoint
+        """
+        self.host.update_capabilities('0.9.1')
+        self.assertRaises(ValueError, self.host.get_container_logs, 'abc',
+            since=1)
+
+    def test_container_logs_view(self):
+        """
+        Test the logs page is streamed
+        """
+        User.objects.create_user('testuser', 'testuser@example.com',
+            'testpass')
+        self.client.login(username='testuser', password='testpass')
+        with mock.patch.object(Host, 'get_container_logs',
+                return_value=iter(['one\n', 'two\n'])) as get_logs:
+            resp = self.client.get('/containers/logs/local/abc/?tail=5')
+            content = ''.join(resp.streaming_content)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(get_logs.call_args[1]['tail'], 5)
+        self.assertTrue('one' in content and 'two' in content)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+    def test_render_lines_cached(self):
+        """
+        Test rendered log segments are reused and keep ANSI state
+        """
+        lines = ['\x1b[31mred\n', 'still red\n', 'red\x1b[0m\n', 'plain\n',
+            'tail\n']
+        with mock.patch('containers.logs.cache',
+                get_cache('django.core.cache.backends.locmem.LocMemCache')):
+            html = list(logs.render_lines(lines, 'abc', size=10))
+            self.assertEqual(len(html), 3)
+            self.assertTrue(html[1].startswith(
+                '<span id="line-0"><span class="ansi31">red</span>'))
+            with mock.patch('containers.logs._render_segment',
+                    side_effect=logs._render_segment) as render:
+                self.assertEqual(list(logs.render_lines(lines, 'abc',
+                    size=10)), html)
+        # only the incomplete tail is converted again
+        self.assertEqual(render.call_count, 1)
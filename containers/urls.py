@@ -17,6 +17,8 @@ urlpatterns = patterns('containers.views',
     url(r'^$', 'index'),
     url(r'^details/(?P<container_id>.*)/$', 'container_details'),
     url(r'^create/$', 'create_container'),
+    url(r'^launch/(?P<batch_id>\w+)/$', 'launch_status',
+        name='containers.launch_status'),
     url(r'^protect/(?P<host_id>.*)/(?P<container_id>.*)/$',
         'toggle_protect_container'),
     url(r'^logs/(?P<host>.*)/(?P<container_id>.*)/$',
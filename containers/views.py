@@ -18,19 +18,22 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.translation import ugettext as _
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import (HttpResponse, HttpResponseBadRequest,
+    StreamingHttpResponse)
+from django.template.loader import render_to_string
 from django.db.models import Q
 from django.utils.html import strip_tags
 from django.core import serializers
 from django.shortcuts import render_to_response
+from containers import launch, logs, pagination
 from containers.models import Container
 from hosts.models import Host
 from metrics.models import Metric
 from django.template import RequestContext
 from containers.forms import (CreateContainerForm,
     ImportRepositoryForm, ImageBuildForm)
-from shipyard import utils
-from docker import client
+from shipyard import tasks, utils
+import itertools
 import urllib
 import random
 import json
@@ -38,6 +41,7 @@ import tempfile
 import shlex
 
 IP_PATTERN = '192.168.88'
+LOG_MARKER = '<!--logs-->'
 
 def handle_upload(f):
     tmp_file = tempfile.mktemp()
@@ -50,39 +54,54 @@ def handle_upload(f):
 def index(request):
     hosts = Host.objects.filter(enabled=True)
     show_all = True if request.GET.has_key('showall') else False
-
-    containers = Container.objects.filter(host__in=hosts, is_running=True).\
-            order_by('description')
-
+    filters = {
+        'host': request.GET.get('host'),
+        'image': request.GET.get('image'),
+        'owner': request.GET.get('owner'),
+        'state': request.GET.get('state', 'all' if show_all else 'running'),
+        'name': request.GET.get('name'),
+    }
+    sort = request.GET.get('sort', 'name')
+    containers = Container.objects.filter(host__in=hosts).\
+            select_related('host').defer('meta')
+    containers = pagination.filter_containers(containers, **filters)
+    try:
+        containers, cursor = pagination.paginate(containers, sort,
+            request.GET.get('cursor'), _get_int_param(request, 'limit'))
+    except ValueError:
+        return HttpResponseBadRequest(_('Invalid sort or cursor'))
+    next_url = None
+    if cursor:
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        next_url = '{0}?{1}'.format(request.path, params.urlencode())
     ctx = {
         'hosts': hosts,
         'containers': containers,
         'show_all': show_all,
+        'filters': filters,
+        'sort': sort,
+        'sorts': sorted(pagination.SORT_FIELDS.keys()),
+        'states': pagination.STATES,
+        'next_url': next_url,
+        'paginated': bool(cursor or request.GET.get('cursor')),
     }
     return render_to_response('containers/index.html', ctx,
         context_instance=RequestContext(request))
 
 @login_required
 def container_details(request, container_id=None):
-    c = Container.objects.get(container_id=container_id)
-    metrics = Metric.objects.filter(source=c.container_id).order_by('-timestamp')
-    cpu_metrics = metrics.filter(counter='cpu')[:30]
-    mem_metrics = metrics.filter(counter='memory')[:30]
-    # build custom data to use unix timestamp instead of python datetime
-    cpu_data = []
-    mem_data = []
-    for m in cpu_metrics:
-        cpu_data.append({
-            'counter': m.counter,
-            'value': m.value,
-            'timestamp': m.unix_timestamp(),
-            })
-    for m in mem_metrics:
-        mem_data.append({
-            'counter': m.counter,
-            'value': m.value,
-            'timestamp': m.unix_timestamp(),
-            })
+    c = Container.objects.select_related('host').get(
+        container_id=container_id)
+    # period of history to chart in seconds (default: last 30 samples)
+    try:
+        period = int(request.GET.get('period'))
+        points = None
+    except (TypeError, ValueError):
+        period = None
+        points = 30
+    cpu_data = Metric.get_series(c.container_id, 'cpu', period, points)
+    mem_data = Metric.get_series(c.container_id, 'memory', period, points)
     ctx = {
         'container': c,
         'cpu_metrics': json.dumps(cpu_data),
@@ -117,44 +136,33 @@ def create_container(request):
             private = form.data.get('private')
             privileged = form.data.get('privileged')
             user = None
-            status = False
-            
+            if private:
+                user = request.user
+
             # ********************************************** #
 
             ips = configure_ips(ip_range)
 
             # ********************************************** #
 
-            for index, i in enumerate(hosts):
-                host = Host.objects.get(id=i)
-                print 'host: {}'.format(host.hostname)
-                if private:
-                    user = request.user
-                try:
-                    if not name:
-                        name = 'maq-{}'.format(index + 1)
-
-                    prov_obj = {
-                        'hostname': host.hostname,
-                        'name': name,
-                        'ip': ips[index]
-                    } 
-
-                    c_id, status = host.create_container(image, command, ports,
-                        environment=environment, memory=memory,
-                        description=description, volumes=volume,
-                        volumes_from=volumes_from, privileged=privileged,
-                        links=links, name=name, owner=user,
-                        hostname=hostname, network_disabled=network_disabled,
-                        cpu_set=cpu_set, prov_obj=prov_obj)
-                    messages.add_message(request, messages.INFO, _('Created') + ' {0}'.format(
-                        image))
-
-                except Exception, e:
-                    print(e)
-                    messages.error(request, e)
-                    status = False
-
+            if hosts:
+                batch_id = launch.create_batch(hosts)
+                tasks.launch_containers.delay(batch_id, hosts, ips,
+                    image=image, command=command, ports=ports,
+                    environment=environment, memory=memory,
+                    description=description, volumes=volume,
+                    volumes_from=volumes_from, privileged=privileged,
+                    links=links, name=name, owner=user,
+                    hostname=hostname, network_disabled=network_disabled,
+                    cpu_set=cpu_set)
+                status_url = reverse('containers.launch_status',
+                    kwargs={'batch_id': batch_id})
+                if request.is_ajax():
+                    data = {'batch_id': batch_id, 'url': status_url}
+                    return HttpResponse(json.dumps(data), status=202,
+                        content_type='application/json')
+                messages.add_message(request, messages.INFO,
+                    _('Launching') + ' {0} ({1})'.format(image, batch_id))
 
             if not hosts:
                 messages.add_message(request, messages.ERROR, _('No hosts selected'))
@@ -166,6 +174,19 @@ def create_container(request):
     return render_to_response('containers/create_container.html', ctx,
         context_instance=RequestContext(request))
 
+@require_http_methods(['GET'])
+@login_required
+def launch_status(request, batch_id=None):
+    '''
+    Returns the status of a container launch batch
+
+    '''
+    batch = launch.get_batch(batch_id)
+    if batch is None:
+        return HttpResponse(json.dumps({'error': 'not found'}), status=404,
+            content_type='application/json')
+    return HttpResponse(json.dumps(batch), content_type='application/json')
+
 def configure_ips(ip_range):
     ips = []
     ip_range = map(int, ip_range)
@@ -198,26 +219,64 @@ def container_info(request, container_id=None):
     data = serializers.serialize('json', [c], ensure_ascii=False)[1:-1]
     return HttpResponse(data, content_type='application/json')
 
+def _get_int_param(request, name):
+    try:
+        return int(request.GET.get(name))
+    except (TypeError, ValueError):
+        return None
+
 @login_required
 def container_logs(request, host, container_id):
     '''
     Gets the specified container logs
 
+    The page is streamed as the logs are read and converted.
+
+    :param tail: Only show the last number of lines
+    :param since: Only show lines logged since this unix timestamp
+    :param until: Only show lines logged before this unix timestamp
+    :param follow: Keep streaming new lines
+
     '''
     h = Host.objects.get(name=host)
     c = Container.objects.get(container_id=container_id)
-    logs = h.get_container_logs(container_id).strip()
-    # format
-    if logs:
-        logs = utils.convert_ansi_to_html(logs)
-    else:
-        logs = None
+    follow = request.GET.has_key('follow')
+    try:
+        lines = h.get_container_logs(container_id,
+            tail=_get_int_param(request, 'tail'),
+            since=_get_int_param(request, 'since'),
+            until=_get_int_param(request, 'until'), follow=follow,
+            stream=True)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+    if not follow:
+        first = next(lines, None)
+        if first is None:
+            ctx = {
+                'container': c,
+                'logs': None,
+            }
+            return render_to_response('containers/container_logs.html', ctx,
+                context_instance=RequestContext(request))
+        lines = itertools.chain([first], lines)
     ctx = {
         'container': c,
-        'logs': logs
+        'logs': LOG_MARKER,
+        'follow': follow,
     }
-    return render_to_response('containers/container_logs.html', ctx,
+    page = render_to_string('containers/container_logs.html', ctx,
         context_instance=RequestContext(request))
+    head, foot = page.split(LOG_MARKER)
+    # rendered segments can only be cached for the complete log
+    cache_id = None
+    if not [x for x in ('tail', 'since', 'until') if request.GET.get(x)]:
+        cache_id = container_id
+    def render():
+        yield head
+        for html in logs.render_lines(lines, cache_id, follow=follow):
+            yield html
+        yield foot
+    return StreamingHttpResponse(render())
 
 @login_required
 def restart_container(request, host, container_id):
@@ -297,8 +356,7 @@ def search_repository(request):
     hosts = Host.objects.filter(enabled=True)
     rnd = random.randint(0, len(hosts)-1)
     host = hosts[rnd]
-    url = 'http://{0}:{1}'.format(host.hostname, host.port)
-    c = client.Client(url)
+    c = host._get_client()
     data = c.search(query)
     return HttpResponse(json.dumps(data), content_type='application/json')
 
@@ -0,0 +1,98 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from docker import client
+from requests.adapters import HTTPAdapter
+import threading
+
+# process wide docker clients ({url: client})
+_clients = {}
+_lock = threading.Lock()
+
+def get_url(hostname, port):
+    """
+    Returns the docker API url for a host
+
+    :param hostname: Host/IP/Socket of the docker daemon
+    :param port: Port of the docker daemon (ignored for sockets)
+
+    """
+    url = hostname
+    if 'unix' not in url:
+        url = '{0}:{1}'.format(hostname, port)
+        if not url.startswith('http'):
+            url = 'http://{0}'.format(url)
+    return url
+
+class PooledClient(client.Client):
+    """
+    Docker client sending at most `pool_size` concurrent requests
+
+    Further requests wait for a slot.  A slot is released once the
+    response headers are read ; streamed responses (logs, events) keep
+    their connection without holding a slot.
+
+    """
+    def __init__(self, pool_size, *args, **kwargs):
+        super(PooledClient, self).__init__(*args, **kwargs)
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def request(self, *args, **kwargs):
+        with self._slots:
+            return super(PooledClient, self).request(*args, **kwargs)
+
+def create_client(url):
+    """
+    Creates a docker client with a keep-alive connection pool
+
+    At most `DOCKER_CLIENT_POOL_SIZE` requests are sent to the daemon at
+    once and as many connections are kept open.  The limit is enforced by
+    the client rather than by blocking the pool as the bundled urllib3
+    loses a pool slot for every failed connection.
+
+    """
+    pool_size = getattr(settings, 'DOCKER_CLIENT_POOL_SIZE', 10)
+    c = PooledClient(pool_size, base_url=url,
+        timeout=getattr(settings, 'DOCKER_CLIENT_TIMEOUT', 60))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+        pool_block=False)
+    c.mount('http://', adapter)
+    c.mount('https://', adapter)
+    return c
+
+def get_client(url):
+    """
+    Returns the shared docker client for a url
+
+    :param url: Docker API url (see `get_url`)
+
+    """
+    c = _clients.get(url)
+    if c is None:
+        with _lock:
+            c = _clients.get(url)
+            if c is None:
+                c = create_client(url)
+                _clients[url] = c
+    return c
+
+def invalidate_client(url):
+    """
+    Closes and removes the shared docker client for a url
+
+    """
+    with _lock:
+        c = _clients.pop(url, None)
+    if c is not None:
+        c.close()
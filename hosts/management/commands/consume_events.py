@@ -0,0 +1,73 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from optparse import make_option
+from hosts.models import Host
+import threading
+import time
+
+EVENTS_SINCE_KEY = 'events:{0}:since'
+EVENTS_SINCE_TTL = 86400
+MAX_BACKOFF = 60
+
+class Command(BaseCommand):
+    help = 'Applies docker events from the enabled hosts to the container ' \
+        'metadata (restart to pick up host changes)'
+    option_list = BaseCommand.option_list + (
+        make_option('--host', action='append', dest='hosts', default=[],
+            help='Only consume events from this host (by name)'),
+    )
+
+    def handle(self, *args, **options):
+        hosts = Host.objects.filter(enabled=True)
+        if options.get('hosts'):
+            hosts = hosts.filter(name__in=options.get('hosts'))
+        hosts = list(hosts)
+        if not hosts:
+            raise CommandError('No enabled hosts')
+        threads = []
+        for host in hosts:
+            t = threading.Thread(target=self.consume, args=(host,))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        while [x for x in threads if x.is_alive()]:
+            time.sleep(1)
+
+    def consume(self, host):
+        """
+        Consumes the events of a host, reconnecting on errors
+
+        Consumers resume from the time of the last applied event.
+
+        """
+        key = EVENTS_SINCE_KEY.format(host.id)
+        backoff = 1
+        while True:
+            try:
+                self.stdout.write('Consuming events from {}'.format(
+                    host.name))
+                for event in host.get_events(cache.get(key)):
+                    host.apply_event(event)
+                    if event.get('time'):
+                        cache.set(key, event.get('time'), EVENTS_SINCE_TTL)
+                    backoff = 1
+            except Exception, e:
+                self.stderr.write('Error consuming events from {}: {}'.format(
+                    host.name, e))
+            connection.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
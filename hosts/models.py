@@ -11,26 +11,53 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from distutils.version import LooseVersion
 from docker import client
 from django.core.cache import cache
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, F
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from shipyard.exceptions import ProtectedContainerError
 from uuid import uuid4
-from containers.models import Container
+from containers.models import Container, PortBinding
+from containers import logs
 from commands.models import Commands
+from shipyard import utils
+from hosts import clients
+from datetime import datetime
+import itertools
 import shlex
 import hashlib
 import requests
 import socket
 import json
+import time
 
 HOST_CACHE_TTL = getattr(settings, 'HOST_CACHE_TTL', 15)
 CONTAINER_KEY = '{0}:containers'
 IMAGE_KEY = '{0}:images'
+AGENT_KEY = 'agent_key:{0}'
+HEARTBEAT_KEY = 'agent:heartbeats'
+AGENT_KEY_CACHE_TTL = getattr(settings, 'AGENT_KEY_CACHE_TTL', 300)
+AGENT_KEY_LOCAL_CACHE_TTL = getattr(settings, 'AGENT_KEY_LOCAL_CACHE_TTL', 5)
+# in process agent key cache ({key: (expires, host)})
+_agent_key_cache = {}
+# features and the docker version that introduced them
+DOCKER_FEATURES = (
+    ('port_bindings', '0.6.5'),
+    ('links', '0.6.5'),
+    ('container_names', '0.6.5'),
+    ('image_transfer', '0.7.1'),
+    ('logs_endpoint', '0.10.0'),
+)
+# docker events that change container state
+CONTAINER_EVENTS = ('create', 'start', 'die', 'stop', 'kill', 'restart',
+    'pause', 'unpause', 'destroy')
+# in process docker capability cache ({host_id: (expires, capabilities)})
+_capability_cache = {}
 
 def generate_agent_key():
     return str(uuid4()).replace('-', '')
@@ -48,23 +75,143 @@ class Host(models.Model):
     last_updated = models.DateTimeField(auto_now=True, null=True,
             help_text=_('Last time agent reported an update'))
     enabled = models.NullBooleanField(null=True, default=False)
+    sync_generation = models.PositiveIntegerField(default=0,
+            help_text=_('Generation of the last agent container sync'))
+
+    def __init__(self, *args, **kwargs):
+        super(Host, self).__init__(*args, **kwargs)
+        self._agent_key = self.agent_key
+        self._docker_url = self._get_docker_url()
 
     def __unicode__(self):
         return self.name
 
+    @classmethod
+    def get_by_agent_key(cls, key):
+        """
+        Returns the host for an agent key or `None`
+
+        Hosts are cached in process for `AGENT_KEY_LOCAL_CACHE_TTL` seconds
+        and in the shared cache until the host is saved or removed.
+
+        """
+        if not key:
+            return None
+        if not getattr(settings, 'AGENT_CACHE_ENABLED', False):
+            return cls.objects.filter(agent_key=key).first()
+        entry = _agent_key_cache.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        cache_key = AGENT_KEY.format(key)
+        host = cache.get(cache_key)
+        if host is None:
+            host = cls.objects.filter(agent_key=key).first()
+            if host is None:
+                return None
+            cache.set(cache_key, host, AGENT_KEY_CACHE_TTL)
+        _agent_key_cache[key] = (time.time() + AGENT_KEY_LOCAL_CACHE_TTL, host)
+        return host
+
+    @classmethod
+    def invalidate_agent_key(cls, key):
+        _agent_key_cache.pop(key, None)
+        if getattr(settings, 'AGENT_CACHE_ENABLED', False):
+            cache.delete(AGENT_KEY.format(key))
+
+    def heartbeat(self):
+        """
+        Records an agent report for the host
+
+        Heartbeats are coalesced in redis and written to `last_updated` by
+        `flush_heartbeats`.
+
+        """
+        if not getattr(settings, 'AGENT_CACHE_ENABLED', False):
+            Host.objects.filter(id=self.id).update(
+                last_updated=timezone.now())
+            return
+        rds = utils.get_redis_connection()
+        rds.hset(HEARTBEAT_KEY, self.id, int(time.time()))
+
+    @classmethod
+    def flush_heartbeats(cls):
+        """
+        Writes the recorded heartbeats to `last_updated`
+
+        Hosts are updated with one query per distinct heartbeat time so
+        each host gets its own time.
+
+        Returns the number of hosts updated
+
+        """
+        rds = utils.get_redis_connection()
+        with rds.pipeline() as pipe:
+            pipe.hgetall(HEARTBEAT_KEY)
+            pipe.delete(HEARTBEAT_KEY)
+            heartbeats, _ = pipe.execute()
+        if not heartbeats:
+            return 0
+        hosts = {}
+        for host_id, timestamp in heartbeats.items():
+            hosts.setdefault(int(timestamp), []).append(host_id)
+        count = 0
+        with transaction.atomic():
+            for timestamp, host_ids in hosts.items():
+                count += cls.objects.filter(id__in=host_ids).update(
+                    last_updated=datetime.fromtimestamp(timestamp,
+                    timezone.utc))
+        return count
+
     @property
     def version(self):
+        return LooseVersion(self.get_capabilities().get('version'))
+
+    def get_capabilities(self, refresh=False):
+        """
+        Returns the docker version, API version and features of the host
+
+        Capabilities are cached in process for `HOST_CACHE_TTL` seconds or
+        until the agent reports a new version.
+
+        :param refresh: Query the docker daemon even if cached
+
+        """
+        entry = _capability_cache.get(self.id)
+        if entry and entry[0] > time.time() and not refresh:
+            return entry[1]
         c = self._get_client()
         data = c.version()
-        return LooseVersion(data['Version'])
+        return self.update_capabilities(data.get('Version'),
+            data.get('ApiVersion'))
+
+    def update_capabilities(self, version, api_version=None):
+        """
+        Caches the capabilities of the host for a docker version
+
+        :param version: Docker version (i.e. 0.7.6)
+        :param api_version: Docker remote API version (i.e. 1.8)
+
+        """
+        capabilities = {
+            'version': version,
+            'api_version': api_version,
+            'features': [name for name, v in DOCKER_FEATURES
+                if LooseVersion(version) >= v],
+        }
+        _capability_cache[self.id] = (time.time() + HOST_CACHE_TTL,
+            capabilities)
+        return capabilities
+
+    def has_feature(self, name):
+        return name in self.get_capabilities().get('features')
+
+    def _get_docker_url(self):
+        if not self.hostname:
+            return None
+        return clients.get_url(self.hostname, self.port)
 
     def _get_client(self):
-        url = self.hostname
-        if 'unix' not in url:
-            url ='{0}:{1}'.format(self.hostname, self.port)
-            if not url.startswith('http'):
-                url = 'http://{0}'.format(url)
-        return client.Client(base_url=url)
+        return clients.get_client(self._get_docker_url())
 
     def _load_container_data(self, container_id):
         c = self._get_client()
@@ -72,9 +219,225 @@ class Host(models.Model):
         m, created = Container.objects.get_or_create(
             container_id=container_id, host=self)
         m.is_running = meta.get('State', {}).get('Running', False)
-        m.meta = json.dumps(meta)
+        m.set_meta(meta)
         m.save()
 
+    def advance_sync_generation(self, generation=None):
+        """
+        Advances the container sync generation for the host
+
+        :param generation: Generation the agent synced against.  If it does
+            not match the current generation nothing is advanced and `None`
+            is returned.
+
+        """
+        hosts = Host.objects.filter(id=self.id)
+        if generation is None:
+            hosts.update(sync_generation=F('sync_generation') + 1)
+        elif hosts.filter(sync_generation=generation).update(
+                sync_generation=generation + 1):
+            self.sync_generation = generation + 1
+            return self.sync_generation
+        self.sync_generation = hosts.values_list('sync_generation',
+            flat=True)[0]
+        if generation is None:
+            return self.sync_generation
+        return None
+
+    def sync_containers(self, container_data, removed=None, full=True):
+        """
+        Syncs the container metadata reported by the agent
+
+        Containers are read from `container_data` in batches of
+        `AGENT_SYNC_BATCH_SIZE` ; the existing containers of a batch are
+        loaded in a single query so inserts, updates and removals can be
+        computed in memory and applied together.  Containers whose metadata
+        fingerprint has not changed are not written.  Callers should run
+        the sync in a transaction.
+
+        :param container_data: Iterable of container dicts posted by the
+            agent
+        :param removed: List of container ids the agent reports as removed
+        :param full: Whether `container_data` is the complete list of
+            containers on the host (anything not listed is removed)
+
+        """
+        batch_size = getattr(settings, 'AGENT_SYNC_BATCH_SIZE', 500)
+        existing = None
+        if full:
+            existing = self._get_sync_containers()
+        container_ids = set()
+        batch = []
+        for d in container_data:
+            batch.append(d)
+            if len(batch) >= batch_size:
+                self._sync_container_batch(batch, existing, container_ids)
+                batch = []
+        self._sync_container_batch(batch, existing, container_ids)
+        # cleanup old containers
+        if full:
+            removed = [x for x in existing.values()
+                if x.container_id not in container_ids]
+        else:
+            removed = list(removed or [])
+            removed = [x for i in range(0, len(removed), batch_size)
+                for x in self._get_sync_containers(
+                    removed[i:i + batch_size]).values()]
+        removed = [x.id for x in removed if x.synced and not x.protected]
+        if removed:
+            with transaction.atomic():
+                for i in range(0, len(removed), batch_size):
+                    Container.objects.filter(
+                        id__in=removed[i:i + batch_size]).delete()
+
+    def _get_sync_containers(self, container_ids=None):
+        containers = Container.objects.filter(host=self).defer('meta')
+        if container_ids is not None:
+            containers = containers.filter(container_id__in=container_ids)
+        existing = {}
+        for c in containers:
+            existing[c.container_id] = c
+        return existing
+
+    def _sync_container_batch(self, batch, existing, container_ids):
+        if not batch:
+            return
+        if existing is None:
+            existing = self._get_sync_containers(
+                [x.get('Container').get('Id') for x in batch])
+        new_containers = []
+        updates = []
+        bindings = {}
+        for d in batch:
+            c_id = d.get('Container').get('Id')
+            meta = d.get('Meta')
+            container_ids.add(c_id)
+            running = meta.get('State', {}).get('Running', False)
+            container = existing.get(c_id)
+            if container is None:
+                container = Container(host=self, container_id=c_id,
+                    is_running=running, synced=True)
+                container.set_meta(meta)
+                if meta.get('Names'):
+                    container.description = meta.get('Names')[0][1:]
+                new_containers.append(container)
+                continue
+            fields = {}
+            if container.description == '' and meta.get('Names'):
+                fields['description'] = meta.get('Names')[0][1:]
+            meta_data = json.dumps(meta, sort_keys=True)
+            fingerprint = hashlib.md5(meta_data).hexdigest()
+            if container.fingerprint != fingerprint:
+                fields['meta'] = utils.compress_json(meta_data)
+                fields['fingerprint'] = fingerprint
+                fields.update(Container.get_summary(meta))
+                bindings[container.id] = Container.get_port_bindings(meta)
+            if container.is_running != running:
+                fields['is_running'] = running
+            if not container.synced:
+                fields['synced'] = True
+            if fields:
+                updates.append((container.id, fields))
+        if not (new_containers or updates):
+            return
+        with transaction.atomic():
+            for pk, fields in updates:
+                Container.objects.filter(id=pk).update(**fields)
+            if new_containers:
+                Container.objects.bulk_create(new_containers)
+                # bulk_create does not set the pks of the new containers
+                new_bindings = dict([(x.container_id, x._port_bindings)
+                    for x in new_containers if x._port_bindings])
+                if new_bindings:
+                    for c_id, pk in Container.objects.filter(host=self,
+                            container_id__in=new_bindings.keys()).values_list(
+                            'container_id', 'id'):
+                        bindings[pk] = new_bindings[c_id]
+            PortBinding.replace(bindings)
+
+    def get_events(self, since=None):
+        """
+        Returns a generator of the events from the docker events stream
+
+        A dedicated client is used so the stream does not hold a connection
+        of the shared client pool.
+
+        :param since: Unix timestamp to replay events from
+
+        """
+        c = clients.create_client(self._get_docker_url())
+        params = {}
+        if since:
+            params['since'] = since
+        resp = c.get(c._url('/events'), params=params, stream=True)
+        c._raise_for_status(resp)
+        for line in c._stream_helper(resp):
+            yield json.loads(line)
+
+    def apply_event(self, event):
+        """
+        Applies a docker event to the container metadata
+
+        Only the container in the event is inspected.  Applications of the
+        container are reconfigured when its state or ports change.
+
+        Returns the updated container or `None`
+
+        :param event: Event dict from the docker events stream
+
+        """
+        status = event.get('status')
+        c_id = event.get('id')
+        if status not in CONTAINER_EVENTS or not c_id:
+            return None
+        meta = None
+        if status != 'destroy':
+            try:
+                meta = self._get_client().inspect_container(c_id)
+            except client.APIError, e:
+                if e.response.status_code != 404:
+                    raise
+        container = Container.objects.filter(host=self,
+            container_id=c_id).first()
+        if meta is None:
+            # protected containers are kept for recovery
+            if container and container.protected:
+                Container.objects.filter(id=container.id).update(
+                    is_running=False)
+            elif container:
+                container.delete()
+            return None
+        running = meta.get('State', {}).get('Running', False)
+        meta_data = json.dumps(meta, sort_keys=True)
+        fingerprint = hashlib.md5(meta_data).hexdigest()
+        if container is None:
+            container = Container(host=self, container_id=c_id,
+                is_running=running, synced=True)
+            container.set_meta(meta)
+            if meta.get('Name'):
+                container.description = meta.get('Name')[1:]
+            try:
+                with transaction.atomic():
+                    container.save()
+                return container
+            except IntegrityError:
+                # created concurrently (by `create_container`)
+                container = Container.objects.get(host=self,
+                    container_id=c_id)
+        if container.fingerprint == fingerprint and \
+                container.is_running == running:
+            return container
+        container.set_meta(meta)
+        container.is_running = running
+        Container.objects.filter(id=container.id).update(
+            meta=container.meta, fingerprint=container.fingerprint,
+            is_running=running, **Container.get_summary(meta))
+        PortBinding.replace({container.id: Container.get_port_bindings(meta)})
+        # update hipache
+        for app in container.get_applications():
+            app.update_config()
+        return container
+
     def create_container(self, image=None, command=None, ports=[],
         environment=[], memory=0, description='', volumes=None, volumes_from='',
         privileged=False, binds=None, links=None, name=None, owner=None,
@@ -111,7 +474,7 @@ class Host(models.Model):
             memory = 0
         if isinstance(ports, str):
             ports = ports.split(',')
-        if self.version < '0.6.5':
+        if not self.has_feature('port_bindings'):
             port_exposes = ports
             port_bindings = None
         else:
@@ -185,6 +548,10 @@ class Host(models.Model):
         # if len(ips) < len(hosts):
         #   hosts = hosts[:len(ips)]
 
+    def start_container(self, container_id=None):
+        c = self._get_client()
+        c.start(container_id)
+
     def restart_container(self, container_id=None):
         from applications.models import Application
         c = self._get_client()
@@ -204,9 +571,71 @@ class Host(models.Model):
         c = self._get_client()
         c.stop(container_id)
 
-    def get_container_logs(self, container_id=None):
+    def get_container_logs(self, container_id=None, tail=None, since=None,
+        until=None, follow=False, stream=False):
+        """
+        Returns the logs of a container
+
+        Logs are read incrementally ; only `tail` lines are held in memory.
+
+        :param container_id: Container id
+        :param tail: Only return the last `tail` lines
+        :param since: Only return lines logged at or after this unix
+            timestamp (docker 0.10+)
+        :param until: Only return lines logged before this unix timestamp
+            (docker 0.10+)
+        :param follow: Keep streaming new output (implies `stream`) ; with
+            docker 0.10+ the existing and new output are read from a single
+            request and `tail` is applied by docker before `since`
+        :param stream: Return a generator of lines instead of a string
+
+        """
+        timestamps = since is not None or until is not None
+        logs_endpoint = self.has_feature('logs_endpoint')
+        if timestamps and not logs_endpoint:
+            raise ValueError(_('Filtering logs by time requires docker 0.10'))
+        container = Container.objects.filter(container_id=container_id).first()
+        tty = bool(container and container.get_meta().get('Config', {}).get(
+            'Tty'))
         c = self._get_client()
-        return c.logs(container_id)
+        params = {'stdout': 1, 'stderr': 1}
+        following = follow and until is None
+        if logs_endpoint:
+            params['timestamps'] = int(timestamps)
+            if following:
+                # the stream does not end so the tail is left to docker
+                params['follow'] = 1
+                if tail is not None:
+                    params['tail'] = tail
+                    tail = None
+            elif tail is not None and not timestamps:
+                params['tail'] = tail
+            resp = c.get(c._url('/containers/{0}/logs'.format(container_id)),
+                params=params, stream=True,
+                timeout=None if following else c._timeout)
+        else:
+            params['logs'] = 1
+            resp = c.post(c._url('/containers/{0}/attach'.format(
+                container_id)), params=params, stream=True, timeout=c._timeout)
+        c._raise_for_status(resp)
+        lines = logs.filter_lines(logs.split_lines(
+            logs.read_frames(resp.raw, tty)), tail, since, until, timestamps)
+        if following and not logs_endpoint:
+            # docker versions prior to 0.10 cannot follow the logs ; lines
+            # written between the two requests are not returned
+            lines = itertools.chain(lines,
+                self._follow_container_logs(c, container_id, tty))
+        elif not (stream or follow):
+            return ''.join(lines)
+        return lines
+
+    def _follow_container_logs(self, c, container_id, tty):
+        resp = c.post(c._url('/containers/{0}/attach'.format(container_id)),
+            params={'stdout': 1, 'stderr': 1, 'stream': 1}, stream=True,
+            timeout=None)
+        c._raise_for_status(resp)
+        for line in logs.split_lines(logs.read_frames(resp.raw, tty)):
+            yield line
 
     def destroy_container(self, container_id=None):
         c = Container.objects.get(container_id=container_id)
@@ -275,3 +704,24 @@ class Host(models.Model):
             container.protected = True
             container.save()
         return c_id, status
+
+def invalidate_host_agent_key(sender, **kwargs):
+    host = kwargs.get('instance')
+    Host.invalidate_agent_key(host.agent_key)
+    if host._agent_key != host.agent_key:
+        Host.invalidate_agent_key(host._agent_key)
+        host._agent_key = host.agent_key
+
+def invalidate_host_client(sender, **kwargs):
+    host = kwargs.get('instance')
+    url = host._get_docker_url()
+    if host._docker_url and (host._docker_url != url or \
+            kwargs.get('signal') == post_delete):
+        clients.invalidate_client(host._docker_url)
+        _capability_cache.pop(host.id, None)
+    host._docker_url = url
+
+post_save.connect(invalidate_host_agent_key, sender=Host)
+post_delete.connect(invalidate_host_agent_key, sender=Host)
+post_save.connect(invalidate_host_client, sender=Host)
+post_delete.connect(invalidate_host_client, sender=Host)
@@ -1,5 +1,19 @@
 from tastypie.test import ResourceTestCase
 from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import datetime
+from hosts import clients, models
+from hosts.models import Host
+from containers.models import Container
+import BaseHTTPServer
+import SocketServer
+import mock
+import socket
+import threading
+import time
 
 class HostResourceTest(ResourceTestCase):
     fixtures = ['test_hosts.json']
@@ -46,3 +60,272 @@ class HostResourceTest(ResourceTestCase):
         self.assertTrue('port' in keys)
         self.assertTrue('enabled' in keys)
 
+
+class HostAgentKeyCacheTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        patcher = mock.patch('hosts.models.cache',
+            get_cache('django.core.cache.backends.locmem.LocMemCache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(models._agent_key_cache.clear)
+
+    @override_settings(AGENT_CACHE_ENABLED=True)
+    def test_get_by_agent_key_cached(self):
+        """
+        Test agent key lookups are served from the cache
+        """
+        self.assertEqual(Host.get_by_agent_key(self.host.agent_key), self.host)
+        with self.assertNumQueries(0):
+            host = Host.get_by_agent_key(self.host.agent_key)
+        self.assertEqual(host, self.host)
+        self.assertEqual(Host.get_by_agent_key('invalid'), None)
+
+    @override_settings(AGENT_CACHE_ENABLED=True)
+    def test_get_by_agent_key_invalidated(self):
+        """
+        Test editing a host invalidates its cached agent key
+        """
+        key = self.host.agent_key
+        Host.get_by_agent_key(key)
+        self.host.enabled = False
+        self.host.save()
+        self.assertFalse(Host.get_by_agent_key(key).enabled)
+        self.host.agent_key = 'newkey'
+        self.host.save()
+        self.assertEqual(Host.get_by_agent_key(key), None)
+        self.assertEqual(Host.get_by_agent_key('newkey'), self.host)
+
+    def test_flush_heartbeats(self):
+        """
+        Test recorded heartbeats are written to last_updated
+        """
+        other = Host(name='other', hostname='10.0.0.1')
+        other.save()
+        rds = mock.MagicMock()
+        pipe = rds.pipeline.return_value.__enter__.return_value
+        pipe.execute.return_value = [{str(self.host.id): '1400000000',
+            str(other.id): '1400000060'}, 1]
+        with mock.patch('shipyard.utils.get_redis_connection',
+                return_value=rds):
+            self.assertEqual(Host.flush_heartbeats(), 2)
+        host = Host.objects.get(id=self.host.id)
+        self.assertEqual(host.last_updated,
+            datetime.fromtimestamp(1400000000, timezone.utc))
+        host = Host.objects.get(id=other.id)
+        self.assertEqual(host.last_updated,
+            datetime.fromtimestamp(1400000060, timezone.utc))
+
+class HostClientTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.addCleanup(clients._clients.clear)
+
+    def test_get_client_shared(self):
+        """
+        Test a host reuses a single pooled docker client
+        """
+        c = self.host._get_client()
+        self.assertEqual(c.base_url, 'http://127.0.0.1:4243')
+        self.assertTrue(self.host._get_client() is c)
+        host = Host.objects.get(id=self.host.id)
+        self.assertTrue(host._get_client() is c)
+
+    def test_get_client_invalidated(self):
+        """
+        Test editing a host's address replaces its docker client
+        """
+        c = self.host._get_client()
+        self.host.name = 'renamed'
+        self.host.save()
+        self.assertTrue(self.host._get_client() is c)
+        self.host.port = 2375
+        self.host.save()
+        self.assertFalse('http://127.0.0.1:4243' in clients._clients)
+        c = self.host._get_client()
+        self.assertEqual(c.base_url, 'http://127.0.0.1:2375')
+        self.host.delete()
+        self.assertEqual(clients._clients, {})
+
+    @override_settings(DOCKER_CLIENT_POOL_SIZE=2, DOCKER_CLIENT_TIMEOUT=1)
+    def test_unreachable_host_does_not_exhaust_pool(self):
+        """
+        Test failed connections to a host do not block later requests
+        """
+        # a port nothing listens on
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+        c = clients.create_client('http://127.0.0.1:{0}'.format(port))
+        errors = []
+        def run():
+            for x in range(5):
+                try:
+                    c.version()
+                except Exception, e:
+                    errors.append(e)
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(errors), 5)
+
+    @override_settings(DOCKER_CLIENT_POOL_SIZE=2)
+    def test_pool_size_limits_concurrent_requests(self):
+        """
+        Test no more than the pool size of requests reach a host at once
+        """
+        lock = threading.Lock()
+        active = []
+        peak = []
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.1)
+                with lock:
+                    active.pop()
+                body = '{"Version": "0.10.0"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        class Server(SocketServer.ThreadingMixIn,
+                BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+        server = Server(('127.0.0.1', 0), Handler)
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.addCleanup(server.shutdown)
+        c = clients.create_client('http://127.0.0.1:{0}'.format(
+            server.server_address[1]))
+        threads = [threading.Thread(target=c.version) for x in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(len(peak), 6)
+        self.assertEqual(max(peak), 2)
+
+class HostCapabilityTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.addCleanup(models._capability_cache.clear)
+
+    def test_capabilities_cached(self):
+        """
+        Test the docker version is only requested once per ttl
+        """
+        c = mock.MagicMock()
+        c.version.return_value = {'Version': '0.7.6', 'ApiVersion': '1.8'}
+        with mock.patch.object(Host, '_get_client', return_value=c):
+            self.assertEqual(self.host.version, '0.7.6')
+            self.assertTrue(self.host.has_feature('port_bindings'))
+            self.assertEqual(self.host.get_capabilities().get('api_version'),
+                '1.8')
+        self.assertEqual(c.version.call_count, 1)
+
+    def test_capabilities_from_agent(self):
+        """
+        Test agents refresh the capabilities with their docker version
+        """
+        resp = self.client.post('/agent/images/', '[]',
+            content_type='application/json',
+            HTTP_AUTHORIZATION='AgentKey:{}'.format(self.host.agent_key),
+            HTTP_X_DOCKER_VERSION='0.6.3')
+        self.assertEqual(resp.status_code, 200)
+        with mock.patch.object(Host, '_get_client') as get_client:
+            self.assertEqual(self.host.version, '0.6.3')
+            self.assertFalse(self.host.has_feature('port_bindings'))
+        self.assertFalse(get_client.called)
+
+class HostEventTest(TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.host.name = 'local'
+        self.host.hostname = '127.0.0.1'
+        self.host.enabled = True
+        self.host.save()
+        self.docker = mock.MagicMock()
+        patcher = mock.patch.object(Host, '_get_client',
+            return_value=self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def inspect(self, running):
+        self.docker.inspect_container.return_value = {
+            'Id': 'abc',
+            'Name': '/web',
+            'State': {'Running': running},
+        }
+
+    def test_apply_event(self):
+        """
+        Test container events update only the affected container
+        """
+        self.inspect(True)
+        self.host.apply_event({'status': 'start', 'id': 'abc'})
+        c = Container.objects.get(container_id='abc')
+        self.assertTrue(c.is_running)
+        self.assertEqual(c.description, 'web')
+        self.inspect(False)
+        self.host.apply_event({'status': 'die', 'id': 'abc'})
+        self.assertFalse(Container.objects.get(container_id='abc').is_running)
+        self.docker.inspect_container.assert_called_with('abc')
+        self.assertEqual(self.host.apply_event(
+            {'status': 'untag', 'id': 'image'}), None)
+        self.assertEqual(self.docker.inspect_container.call_count, 2)
+
+    def test_apply_event_created_concurrently(self):
+        """
+        Test an event does not duplicate a container created meanwhile
+        """
+        self.inspect(True)
+        set_meta = Container.set_meta
+        def create_first(container, meta):
+            # inserted by `create_container` after the event lookup
+            if not Container.objects.exists():
+                Container.objects.bulk_create([Container(container_id='abc',
+                    host=self.host, is_running=False)])
+            return set_meta(container, meta)
+        with mock.patch.object(Container, 'set_meta', autospec=True,
+                side_effect=create_first):
+            self.host.apply_event({'status': 'start', 'id': 'abc'})
+        c = Container.objects.get(container_id='abc')
+        self.assertTrue(c.is_running)
+        self.assertEqual(c.name, 'web')
+
+    def test_apply_destroy_event(self):
+        """
+        Test destroy events remove unprotected containers
+        """
+        Container(container_id='abc', host=self.host).save()
+        Container(container_id='def', host=self.host, protected=True).save()
+        self.host.apply_event({'status': 'destroy', 'id': 'abc'})
+        self.host.apply_event({'status': 'destroy', 'id': 'def'})
+        self.assertFalse(Container.objects.filter(container_id='abc').exists())
+        self.assertFalse(Container.objects.get(container_id='def').is_running)
+        self.assertFalse(self.docker.inspect_container.called)
@@ -23,10 +23,12 @@ from hosts.api import HostResource
 
 class ImageResource(ModelResource):
     host = fields.ToOneField(HostResource, 'host', full=True)
-    history = fields.ListField(attribute='get_history')
+    tags = fields.ListField(attribute='get_tags')
+    metadata = fields.DictField(attribute='get_metadata')
 
     class Meta:
-        queryset = Image.objects.exclude(repository__contains='none')
+        queryset = Image.objects.exclude(repository__contains='none') \
+            .select_related('host', 'metadata')
         resource_name = 'images'
         list_allowed_methods = ['get']
         detail_allowed_methods = ['get']
@@ -0,0 +1,320 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from shipyard import utils
+import json
+import re
+import tempfile
+import time
+
+PULLS_KEY = 'images:pulls'
+PULL_KEY = 'images:pull:{0}'
+PULL_LOCK_KEY = 'images:pull:{0}:{1}:lock'
+PULL_TTL = getattr(settings, 'IMAGE_PULL_TTL', 3600)
+# min amount of time in seconds between progress updates of a pull
+PROGRESS_INTERVAL = 1
+BUILT_IMAGE = re.compile(r'Successfully built ([0-9a-f]+)')
+# size of the chunks read when transferring an image between hosts
+TRANSFER_CHUNK_SIZE = 65536
+
+def get_waves(hosts, first_wave=None, wave_size=None):
+    """
+    Splits hosts into rollout waves
+
+    The first wave is a small canary wave ; the following waves have
+    `IMAGE_PULL_WAVE_SIZE` hosts.
+
+    """
+    if first_wave is None:
+        first_wave = getattr(settings, 'IMAGE_PULL_FIRST_WAVE', 1)
+    if wave_size is None:
+        wave_size = getattr(settings, 'IMAGE_PULL_WAVE_SIZE', 10)
+    hosts = list(hosts)
+    waves = []
+    if first_wave:
+        waves.append(hosts[:first_wave])
+        hosts = hosts[first_wave:]
+    for i in range(0, len(hosts), max(wave_size, 1)):
+        waves.append(hosts[i:i + wave_size])
+    return [x for x in waves if x]
+
+def set_status(rds, repository, host, status, progress=''):
+    rds.hset(PULL_KEY.format(repository), host.id, json.dumps({
+        'host': host.name,
+        'status': status,
+        'progress': progress,
+        'updated': int(time.time()),
+    }))
+
+def get_status(rds=None):
+    """
+    Returns the status of the recent pulls of each repository
+
+    ({repository: [{host, status, progress, updated}]})
+
+    """
+    rds = rds or utils.get_redis_connection()
+    pulls = {}
+    for repository in rds.smembers(PULLS_KEY):
+        statuses = rds.hgetall(PULL_KEY.format(repository))
+        if not statuses:
+            rds.srem(PULLS_KEY, repository)
+            continue
+        pulls[repository] = sorted([json.loads(x) for x in statuses.values()],
+            key=lambda x: x.get('host'))
+    return pulls
+
+def pull_on_host(host, repository, rds=None):
+    """
+    Pulls a repository on a host and records its progress
+
+    Only one pull of a repository runs on a host at a time ; returns `False`
+    if a pull is already in flight.
+
+    """
+    rds = rds or utils.get_redis_connection()
+    lock = PULL_LOCK_KEY.format(repository, host.id)
+    if not rds.set(lock, 1, ex=PULL_TTL, nx=True):
+        return False
+    try:
+        set_status(rds, repository, host, 'pulling')
+        updated = 0
+        for line in host._get_client().pull(repository, stream=True):
+            data = json.loads(line)
+            if data.get('error'):
+                raise StandardError(data.get('error'))
+            if time.time() - updated >= PROGRESS_INTERVAL:
+                progress = ' '.join([x for x in (data.get('status'),
+                    data.get('progress')) if x])
+                set_status(rds, repository, host, 'pulling', progress)
+                updated = time.time()
+        set_status(rds, repository, host, 'done')
+    except Exception, e:
+        set_status(rds, repository, host, 'failed', str(e))
+        raise
+    finally:
+        rds.delete(lock)
+    return True
+
+def distribute_image(repository, hosts, concurrency=None, rds=None):
+    """
+    Pulls a repository on the hosts in waves
+
+    Each wave pulls on at most `IMAGE_PULL_CONCURRENCY` hosts at once.  The
+    rollout stops if every host of a wave fails ; the remaining hosts are
+    marked as skipped.
+
+    Returns a dict of host id to status
+
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'IMAGE_PULL_CONCURRENCY', 4)
+    rds = rds or utils.get_redis_connection()
+    rds.sadd(PULLS_KEY, repository)
+    rds.delete(PULL_KEY.format(repository))
+    waves = get_waves(hosts)
+    for host in hosts:
+        set_status(rds, repository, host, 'queued')
+    rds.expire(PULL_KEY.format(repository), PULL_TTL)
+    results = {}
+    for i, wave in enumerate(waves):
+        wave_results = utils.run_concurrently(
+            lambda h: pull_on_host(h, repository, rds), wave, concurrency)
+        for host, (pulled, error) in zip(wave, wave_results):
+            if error is not None:
+                results[host.id] = 'failed'
+            else:
+                results[host.id] = 'done' if pulled else 'in progress'
+        if all([results[x.id] == 'failed' for x in wave]):
+            for host in [x for w in waves[i + 1:] for x in w]:
+                set_status(rds, repository, host, 'skipped')
+                results[host.id] = 'skipped'
+            break
+    return results
+
+def get_image_id(host, image):
+    """
+    Returns the full id of an image on a host
+
+    """
+    data = host._get_client().inspect_image(image)
+    return data.get('Id') or data.get('id')
+
+def build_on_host(host, path, tag=None):
+    """
+    Builds an image on a host and returns its full id
+
+    :param host: Host to build on
+    :param path: Remote (http, git, github.com) or local Dockerfile path
+    :param tag: Repository to tag the image with
+
+    """
+    c = host._get_client()
+    if path.startswith(('http://', 'https://', 'git://', 'github.com/')):
+        output = c.build(path=path, tag=tag, rm=True, stream=True)
+    else:
+        with open(path, 'r') as f:
+            output = list(c.build(fileobj=f, tag=tag, rm=True, stream=True))
+    image_id = None
+    for line in output:
+        data = json.loads(line)
+        if data.get('error'):
+            raise StandardError(data.get('error'))
+        match = BUILT_IMAGE.search(data.get('stream', ''))
+        if match:
+            image_id = match.group(1)
+    if not image_id:
+        raise StandardError('Build of {} on {} did not produce an ' \
+            'image'.format(path, host.name))
+    return get_image_id(host, image_id)
+
+def save_image(host, image, fileobj):
+    """
+    Streams an image (and its parent layers) from a host as a tarball
+
+    """
+    c = host._get_client()
+    resp = c._get(c._url('/images/{0}/get'.format(image)), stream=True)
+    c._raise_for_status(resp)
+    for chunk in resp.iter_content(TRANSFER_CHUNK_SIZE):
+        fileobj.write(chunk)
+    fileobj.flush()
+
+def load_image(host, fileobj):
+    """
+    Loads an image tarball (as returned by `save_image`) on a host
+
+    """
+    c = host._get_client()
+    resp = c._post(c._url('/images/load'), data=fileobj,
+        headers={'Content-Type': 'application/x-tar'})
+    c._raise_for_status(resp)
+
+def get_builder(hosts):
+    """
+    Returns the host images are built on: the host named
+    `IMAGE_BUILD_HOST` or the first host
+
+    """
+    name = getattr(settings, 'IMAGE_BUILD_HOST', None)
+    for host in hosts:
+        if not name or host.name == name:
+            return host
+    return hosts[0] if hosts else None
+
+def ship_image(image_id, builder, hosts, tag=None, path=None,
+    concurrency=None, rds=None):
+    """
+    Copies an image from the builder to the hosts
+
+    The image is saved once from the builder to a temporary file which is
+    then loaded on the hosts in parallel.  Every host is checked to end up
+    with `image_id`.
+
+    Returns a dict of host id to status
+
+    :param image_id: Full id of the image on the builder
+    :param builder: Host the image was built on
+    :param hosts: Hosts to copy the image to
+    :param tag: Repository the image is tagged with
+    :param path: Dockerfile path ; hosts that cannot load images build it
+        themselves
+
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'IMAGE_PULL_CONCURRENCY', 4)
+    rds = rds or utils.get_redis_connection()
+    name = tag or image_id
+    results = {}
+    targets = [x for x in hosts if x.id != builder.id]
+    if not targets:
+        return results
+    with tempfile.NamedTemporaryFile(prefix='shipyard-image-') as tmp:
+        save_image(builder, tag or image_id, tmp)
+        def load(host):
+            if not host.has_feature('image_transfer'):
+                if not path:
+                    raise StandardError('Docker on {} cannot load ' \
+                        'images'.format(host.name))
+                set_status(rds, name, host, 'building')
+                build_on_host(host, path, tag)
+                set_status(rds, name, host, 'built')
+                return 'built'
+            set_status(rds, name, host, 'loading')
+            with open(tmp.name, 'rb') as f:
+                load_image(host, f)
+            loaded = get_image_id(host, image_id)
+            if loaded != image_id:
+                set_status(rds, name, host, 'mismatch', loaded)
+                return 'mismatch'
+            set_status(rds, name, host, 'done')
+            return 'done'
+        for host, (status, error) in zip(targets, utils.run_concurrently(
+                load, targets, concurrency)):
+            if error is not None:
+                set_status(rds, name, host, 'failed', str(error))
+                status = 'failed'
+            results[host.id] = status
+    return results
+
+def build_image(path, tag, hosts, concurrency=None, rds=None):
+    """
+    Builds an image once and ships it to the hosts
+
+    The image is built on the builder (see `get_builder`) and then copied
+    to the other hosts with `ship_image`.  If the builder cannot save
+    images it is built on every host.
+
+    Returns a dict of host id to status
+
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'IMAGE_PULL_CONCURRENCY', 4)
+    rds = rds or utils.get_redis_connection()
+    hosts = list(hosts)
+    builder = get_builder(hosts)
+    if not builder:
+        return {}
+    name = tag or path
+    rds.sadd(PULLS_KEY, name)
+    rds.delete(PULL_KEY.format(name))
+    for host in hosts:
+        set_status(rds, name, host, 'queued')
+    rds.expire(PULL_KEY.format(name), PULL_TTL)
+    if not builder.has_feature('image_transfer'):
+        def build(host):
+            set_status(rds, name, host, 'building')
+            build_on_host(host, path, tag)
+            set_status(rds, name, host, 'built')
+        results = {}
+        for host, (x, error) in zip(hosts, utils.run_concurrently(build,
+                hosts, concurrency)):
+            if error is not None:
+                set_status(rds, name, host, 'failed', str(error))
+            results[host.id] = 'failed' if error else 'built'
+        return results
+    set_status(rds, name, builder, 'building')
+    try:
+        image_id = build_on_host(builder, path, tag)
+    except Exception, e:
+        set_status(rds, name, builder, 'failed', str(e))
+        for host in hosts:
+            if host.id != builder.id:
+                set_status(rds, name, host, 'skipped')
+        raise
+    set_status(rds, name, builder, 'done', image_id[:12])
+    results = ship_image(image_id, builder, hosts, tag, path, concurrency,
+        rds)
+    results[builder.id] = 'done'
+    return results
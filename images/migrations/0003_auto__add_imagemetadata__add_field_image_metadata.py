@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ImageMetadata'
+        db.create_table(u'images_imagemetadata', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('image_id', self.gf('django.db.models.fields.CharField')(unique=True, max_length=96)),
+            ('content_hash', self.gf('django.db.models.fields.CharField')(max_length=32, null=True, blank=True)),
+            ('data', self.gf('django.db.models.fields.TextField')(default='{}', null=True, blank=True)),
+        ))
+        db.send_create_signal(u'images', ['ImageMetadata'])
+
+        # Adding field 'Image.metadata'
+        db.add_column(u'images_image', 'metadata',
+                      self.gf('django.db.models.fields.related.ForeignKey')(to=orm['images.ImageMetadata'], null=True, blank=True),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting model 'ImageMetadata'
+        db.delete_table(u'images_imagemetadata')
+
+        # Deleting field 'Image.metadata'
+        db.delete_column(u'images_image', 'metadata_id')
+
+
+    models = {
+        u'hosts.host': {
+            'Meta': {'object_name': 'Host'},
+            'agent_key': ('django.db.models.fields.CharField', [], {'default': "'a7af3904d92b4fe19d16cedb9d3d6f59'", 'max_length': '64', 'null': 'True'}),
+            'enabled': ('django.db.models.fields.NullBooleanField', [], {'default': 'False', 'null': 'True', 'blank': 'True'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'unique': 'True', 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64', 'unique': 'True', 'null': 'True'}),
+            'port': ('django.db.models.fields.SmallIntegerField', [], {'default': '4243', 'null': 'True'}),
+            'public_hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'null': 'True', 'blank': 'True'}),
+            'sync_generation': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        u'images.image': {
+            'Meta': {'object_name': 'Image'},
+            'history': ('django.db.models.fields.TextField', [], {'default': "'{}'", 'null': 'True', 'blank': 'True'}),
+            'host': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hosts.Host']", 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'metadata': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['images.ImageMetadata']", 'null': 'True', 'blank': 'True'}),
+            'repository': ('django.db.models.fields.CharField', [], {'max_length': '96'})
+        },
+        u'images.imagemetadata': {
+            'Meta': {'object_name': 'ImageMetadata'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'default': "'{}'", 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '96'})
+        }
+    }
+
+    complete_apps = ['images']
\ No newline at end of file
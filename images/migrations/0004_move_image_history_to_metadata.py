@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+import hashlib
+import json
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        # image history held the full image list of the host ; keep only
+        # the entry for each image, stored once per image id
+        for image in orm.Image.objects.all():
+            try:
+                history = json.loads(image.history or '[]')
+            except ValueError:
+                continue
+            if not isinstance(history, list):
+                continue
+            for entry in history:
+                if entry.get('Id') != image.image_id:
+                    continue
+                data = json.dumps(entry, sort_keys=True)
+                # get_or_create opens an atomic block, which is not allowed
+                # inside the migration transaction on sqlite
+                existing = list(orm.ImageMetadata.objects.filter(
+                    image_id=image.image_id)[:1])
+                if existing:
+                    metadata = existing[0]
+                else:
+                    metadata = orm.ImageMetadata.objects.create(
+                        image_id=image.image_id, data=data,
+                        content_hash=hashlib.md5(data).hexdigest())
+                image.metadata = metadata
+                image.save()
+                break
+
+    def backwards(self, orm):
+        for image in orm.Image.objects.all():
+            images = orm.Image.objects.filter(host=image.host,
+                metadata__isnull=False).select_related('metadata')
+            image.history = json.dumps([json.loads(x.metadata.data)
+                for x in images])
+            image.save()
+
+    models = {
+        u'hosts.host': {
+            'Meta': {'object_name': 'Host'},
+            'agent_key': ('django.db.models.fields.CharField', [], {'default': "'08d0b4b285c640858ce2ac761a27b479'", 'max_length': '64', 'null': 'True'}),
+            'enabled': ('django.db.models.fields.NullBooleanField', [], {'default': 'False', 'null': 'True', 'blank': 'True'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'unique': 'True', 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64', 'unique': 'True', 'null': 'True'}),
+            'port': ('django.db.models.fields.SmallIntegerField', [], {'default': '4243', 'null': 'True'}),
+            'public_hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'null': 'True', 'blank': 'True'}),
+            'sync_generation': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        u'images.image': {
+            'Meta': {'object_name': 'Image'},
+            'history': ('django.db.models.fields.TextField', [], {'default': "'{}'", 'null': 'True', 'blank': 'True'}),
+            'host': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hosts.Host']", 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'metadata': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['images.ImageMetadata']", 'null': 'True', 'blank': 'True'}),
+            'repository': ('django.db.models.fields.CharField', [], {'max_length': '96'})
+        },
+        u'images.imagemetadata': {
+            'Meta': {'object_name': 'ImageMetadata'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'default': "'{}'", 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '96'})
+        }
+    }
+
+    complete_apps = ['images']
+    symmetrical = True
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+import zlib
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        metadata = orm.ImageMetadata.objects.only('id', 'data')
+        for m in metadata.iterator():
+            orm.ImageMetadata.objects.filter(id=m.id).update(
+                data_blob=zlib.compress((m.data or '{}').encode('utf-8'), 6))
+
+    def backwards(self, orm):
+        metadata = orm.ImageMetadata.objects.only('id', 'data_blob')
+        for m in metadata.iterator():
+            if m.data_blob is None:
+                continue
+            orm.ImageMetadata.objects.filter(id=m.id).update(
+                data=zlib.decompress(str(m.data_blob)).decode('utf-8'))
+
+    models = {
+        u'hosts.host': {
+            'Meta': {'object_name': 'Host'},
+            'agent_key': ('django.db.models.fields.CharField', [], {'default': "'6d3dcb0cfc0d41b8b3c1db2d37bfbf0f'", 'max_length': '64', 'null': 'True'}),
+            'enabled': ('django.db.models.fields.NullBooleanField', [], {'default': 'False', 'null': 'True', 'blank': 'True'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'unique': 'True', 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64', 'unique': 'True', 'null': 'True'}),
+            'port': ('django.db.models.fields.SmallIntegerField', [], {'default': '4243', 'null': 'True'}),
+            'public_hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'null': 'True', 'blank': 'True'}),
+            'sync_generation': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        u'images.image': {
+            'Meta': {'object_name': 'Image'},
+            'host': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hosts.Host']", 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'metadata': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['images.ImageMetadata']", 'null': 'True', 'blank': 'True'}),
+            'repository': ('django.db.models.fields.CharField', [], {'max_length': '96'})
+        },
+        u'images.imagemetadata': {
+            'Meta': {'object_name': 'ImageMetadata'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'default': "'{}'", 'null': 'True', 'blank': 'True'}),
+            'data_blob': ('django.db.models.fields.BinaryField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '96'})
+        }
+    }
+
+    complete_apps = ['images']
+    symmetrical = True
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+import hashlib
+import json
+import zlib
+
+# copies of `images.models.split_metadata` and `shipyard.utils.load_json_blob`
+# at the time of this migration
+HOST_FIELDS = ('RepoTags', 'RepoDigests')
+
+def split_metadata(data):
+    shared = dict([(k, v) for k, v in data.items() if k not in HOST_FIELDS])
+    return shared, data.get('RepoTags') or []
+
+def load_json_blob(value, default=None):
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    elif value is not None and not isinstance(value, basestring):
+        value = str(value)
+    if not value:
+        return default
+    if value[:1] not in ('{', '['):
+        value = zlib.decompress(value)
+    return json.loads(value)
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        metadata = {}
+        for m in orm.ImageMetadata.objects.all().iterator():
+            metadata[m.id] = load_json_blob(m.data, {})
+        # the shared metadata holds the tags of the host synced last ;
+        # other hosts keep their repository until their next sync
+        for image in orm.Image.objects.filter(metadata__isnull=False):
+            tags = metadata.get(image.metadata_id, {}).get('RepoTags') or []
+            if image.repository not in tags:
+                tags = []
+                if image.repository != '<none>:<none>':
+                    tags = [image.repository]
+            orm.Image.objects.filter(id=image.id).update(
+                tags=json.dumps(tags))
+        for m_id, data in metadata.items():
+            shared, tags = split_metadata(data)
+            data = json.dumps(shared, sort_keys=True)
+            orm.ImageMetadata.objects.filter(id=m_id).update(
+                data=zlib.compress(data, 6),
+                content_hash=hashlib.md5(data).hexdigest())
+
+    def backwards(self, orm):
+        # metadata is restored with the tags on the next image sync
+        pass
+
+    models = {
+        u'hosts.host': {
+            'Meta': {'object_name': 'Host'},
+            'agent_key': ('django.db.models.fields.CharField', [], {'default': "'e31fe8ea524d4a9eb9537e9f1537ef2b'", 'max_length': '64', 'null': 'True'}),
+            'enabled': ('django.db.models.fields.NullBooleanField', [], {'default': 'False', 'null': 'True', 'blank': 'True'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'unique': 'True', 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64', 'unique': 'True', 'null': 'True'}),
+            'port': ('django.db.models.fields.SmallIntegerField', [], {'default': '4243', 'null': 'True'}),
+            'public_hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'null': 'True', 'blank': 'True'}),
+            'sync_generation': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        u'images.image': {
+            'Meta': {'object_name': 'Image'},
+            'host': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hosts.Host']", 'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'metadata': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['images.ImageMetadata']", 'null': 'True', 'blank': 'True'}),
+            'repository': ('django.db.models.fields.CharField', [], {'max_length': '96'}),
+            'tags': ('django.db.models.fields.TextField', [], {'default': "'[]'", 'blank': 'True'})
+        },
+        u'images.imagemetadata': {
+            'Meta': {'object_name': 'ImageMetadata'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'data': ('django.db.models.fields.BinaryField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image_id': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '96'})
+        }
+    }
+
+    complete_apps = ['images']
+    symmetrical = True
@@ -11,15 +11,44 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from hosts.models import Host
+from shipyard import utils
+import hashlib
 import json
 
+# image fields that differ between hosts with the same image ; kept on
+# the per host `Image` instead of the shared metadata
+HOST_FIELDS = ('RepoTags', 'RepoDigests')
+
+def split_metadata(data):
+    """
+    Splits image data into the metadata shared by every host with the
+    image and the repository tags of the host
+
+    :param data: Image dict as returned by the docker images API
+
+    """
+    shared = dict([(k, v) for k, v in data.items() if k not in HOST_FIELDS])
+    return shared, data.get('RepoTags') or []
+
+class ImageMetadata(models.Model):
+    image_id = models.CharField(max_length=96, unique=True)
+    content_hash = models.CharField(max_length=32, null=True, blank=True,
+            help_text='Hash of the image metadata')
+    data = models.BinaryField(blank=True, null=True,
+            help_text='Compressed image metadata')
+
+    def __unicode__(self):
+        return self.image_id[:12]
+
 class Image(models.Model):
     image_id = models.CharField(max_length=96, null=True, blank=True)
     repository = models.CharField(max_length=96)
+    tags = models.TextField(blank=True, default='[]',
+            help_text='Repository tags of the image on the host')
     host = models.ForeignKey(Host, null=True)
-    history = models.TextField(blank=True, null=True, default='{}')
+    metadata = models.ForeignKey(ImageMetadata, null=True, blank=True)
 
     def __unicode__(self):
         img_id = 'unknown'
@@ -27,9 +56,86 @@ class Image(models.Model):
             img_id = self.image_id[:12]
         return "{} ({})".format(self.repository, img_id)
 
-    def get_history(self):
-        history = {}
-        if self.history:
-            history = json.loads(self.history)
-        return history
+    def get_tags(self):
+        return json.loads(self.tags or '[]')
+
+    def get_metadata(self):
+        if not self.metadata:
+            return {}
+        data = utils.load_json_blob(self.metadata.data, {})
+        data['RepoTags'] = self.get_tags()
+        return data
+
+    @classmethod
+    def sync(cls, host, image_data):
+        """
+        Syncs the images reported by the agent for a host
+
+        Image metadata is stored once per image id (shared by every host
+        with the image) and only written when its content hash changes.
+        Repository tags are stored per host as hosts can tag the same
+        image differently.
+
+        :param host: Host the images were reported for
+        :param image_data: List of image dicts posted by the agent
 
+        """
+        entries = {}
+        for i in image_data:
+            shared, tags = split_metadata(i)
+            data = json.dumps(shared, sort_keys=True)
+            entries[i.get('Id')] = (tags, utils.compress_json(data),
+                hashlib.md5(data).hexdigest())
+        metadata = {}
+        for m in ImageMetadata.objects.filter(
+                image_id__in=entries.keys()).defer('data'):
+            metadata[m.image_id] = m
+        images = {}
+        for image in Image.objects.filter(host=host):
+            images[image.image_id] = image
+        with transaction.atomic():
+            new_metadata = []
+            for image_id, (tags, data, content_hash) in entries.items():
+                m = metadata.get(image_id)
+                if m is None:
+                    new_metadata.append(ImageMetadata(image_id=image_id,
+                        data=data, content_hash=content_hash))
+                elif m.content_hash != content_hash:
+                    ImageMetadata.objects.filter(id=m.id).update(data=data,
+                        content_hash=content_hash)
+            if new_metadata:
+                try:
+                    with transaction.atomic():
+                        ImageMetadata.objects.bulk_create(new_metadata)
+                except IntegrityError:
+                    # another host synced the same image
+                    for m in new_metadata:
+                        ImageMetadata.objects.get_or_create(
+                            image_id=m.image_id, defaults={'data': m.data,
+                            'content_hash': m.content_hash})
+                for m in ImageMetadata.objects.filter(image_id__in=[
+                        x.image_id for x in new_metadata]).defer('data'):
+                    metadata[m.image_id] = m
+            new_images = []
+            for image_id, (tags, data, content_hash) in entries.items():
+                repository = (tags or ['<none>:<none>'])[0]
+                metadata_id = metadata[image_id].id
+                image = images.get(image_id)
+                if image is None:
+                    new_images.append(Image(host=host, image_id=image_id,
+                        repository=repository, tags=json.dumps(tags),
+                        metadata_id=metadata_id))
+                elif image.repository != repository or \
+                        image.get_tags() != tags or \
+                        image.metadata_id != metadata_id:
+                    Image.objects.filter(id=image.id).update(
+                        repository=repository, tags=json.dumps(tags),
+                        metadata=metadata_id)
+            if new_images:
+                Image.objects.bulk_create(new_images)
+            # cleanup old images
+            removed = [x for x in images if x not in entries]
+            if removed:
+                Image.objects.filter(host=host, image_id__in=removed).delete()
+                ImageMetadata.objects.filter(image_id__in=removed,
+                    image__isnull=True).delete()
@@ -5,7 +5,16 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from hosts.models import Host
+from images import distribution
+from images.models import Image, ImageMetadata
+from shipyard.testing import FakeRedis
+import json
+import mock
+import zlib
 
 
 class SimpleTest(TestCase):
@@ -14,3 +23,209 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class ImageSyncTest(TestCase):
+
+    def setUp(self):
+        self.hosts = []
+        for i in range(2):
+            host = Host()
+            host.name = 'host{}'.format(i)
+            host.hostname = '10.0.0.{}'.format(i)
+            host.save()
+            self.hosts.append(host)
+        self.image_data = [
+            {'Id': 'aaa', 'RepoTags': ['base:latest'], 'Size': 10},
+            {'Id': 'bbb', 'RepoTags': ['web:latest'], 'Size': 20},
+        ]
+
+    def test_sync_shares_metadata(self):
+        """
+        Test image metadata is stored once for every host
+        """
+        for host in self.hosts:
+            Image.sync(host, self.image_data)
+        self.assertEqual(Image.objects.count(), 4)
+        self.assertEqual(ImageMetadata.objects.count(), 2)
+        image = Image.objects.get(host=self.hosts[1], image_id='bbb')
+        self.assertEqual(image.repository, 'web:latest')
+        self.assertEqual(image.get_metadata().get('Size'), 20)
+
+    def test_sync_host_tags(self):
+        """
+        Test hosts tagging the same image differently keep their own tags
+        """
+        Image.sync(self.hosts[0], self.image_data)
+        Image.sync(self.hosts[1], [{'Id': 'aaa',
+            'RepoTags': ['registry/base:1', 'base:1'], 'Size': 10}])
+        m = ImageMetadata.objects.get(image_id='aaa')
+        content_hash = m.content_hash
+        Image.sync(self.hosts[0], self.image_data)
+        m = ImageMetadata.objects.get(image_id='aaa')
+        self.assertEqual(m.content_hash, content_hash)
+        self.assertFalse('RepoTags' in json.loads(zlib.decompress(
+            str(m.data))))
+        image = Image.objects.get(host=self.hosts[0], image_id='aaa')
+        self.assertEqual(image.get_metadata().get('RepoTags'),
+            ['base:latest'])
+        image = Image.objects.get(host=self.hosts[1], image_id='aaa')
+        self.assertEqual(image.repository, 'registry/base:1')
+        self.assertEqual(image.get_tags(), ['registry/base:1', 'base:1'])
+
+    def test_sync_unchanged(self):
+        """
+        Test an unchanged sync does not write
+        """
+        Image.sync(self.hosts[0], self.image_data)
+        with CaptureQueriesContext(connection) as ctx:
+            Image.sync(self.hosts[0], self.image_data)
+        writes = [x for x in ctx.captured_queries if x.get('sql').split()[0]
+            in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+
+    def test_sync_updates_and_removes(self):
+        """
+        Test changed images are updated and removed images deleted
+        """
+        for host in self.hosts:
+            Image.sync(host, self.image_data)
+        Image.sync(self.hosts[0], [{'Id': 'aaa', 'RepoTags': ['base:1'],
+            'Size': 11}])
+        image = Image.objects.get(host=self.hosts[0], image_id='aaa')
+        self.assertEqual(image.repository, 'base:1')
+        self.assertEqual(image.get_metadata().get('Size'), 11)
+        self.assertFalse(Image.objects.filter(host=self.hosts[0],
+            image_id='bbb').exists())
+        # still used by the other host
+        self.assertTrue(ImageMetadata.objects.filter(image_id='bbb').exists())
+        Image.sync(self.hosts[1], [])
+        self.assertFalse(ImageMetadata.objects.filter(image_id='bbb').exists())
+
+class ImageDistributionTest(TestCase):
+
+    def setUp(self):
+        self.rds = FakeRedis()
+        self.hosts = []
+        for i in range(5):
+            host = Host()
+            host.name = 'host{}'.format(i)
+            host.hostname = '10.0.0.{}'.format(i)
+            host.save()
+            self.hosts.append(host)
+
+    def test_waves(self):
+        """
+        Test hosts are split into a canary wave and fixed size waves
+        """
+        waves = distribution.get_waves(self.hosts, 1, 2)
+        self.assertEqual([len(x) for x in waves], [1, 2, 2])
+        waves = distribution.get_waves(self.hosts, 0, 10)
+        self.assertEqual([len(x) for x in waves], [5])
+
+    def test_pull_in_flight(self):
+        """
+        Test a repository is only pulled once per host at a time
+        """
+        host = self.hosts[0]
+        self.rds.set(distribution.PULL_LOCK_KEY.format('base', host.id), 1)
+        with mock.patch.object(Host, '_get_client') as client:
+            self.assertFalse(distribution.pull_on_host(host, 'base',
+                self.rds))
+        self.assertFalse(client.called)
+
+    def test_distribute(self):
+        """
+        Test an image is pulled on every host and the status is recorded
+        """
+        with mock.patch.object(Host, '_get_client') as client:
+            client.return_value.pull.return_value = [
+                json.dumps({'status': 'Downloading', 'progress': '[=> ]'})]
+            results = distribution.distribute_image('base', self.hosts, 2,
+                self.rds)
+        self.assertEqual(set(results.values()), set(['done']))
+        self.assertEqual(client.return_value.pull.call_count, 5)
+        pulls = distribution.get_status(self.rds)
+        self.assertEqual([x.get('status') for x in pulls['base']],
+            ['done'] * 5)
+
+    def test_distribute_failed_wave(self):
+        """
+        Test the rollout stops when every host of a wave fails
+        """
+        with mock.patch.object(Host, '_get_client') as client:
+            client.return_value.pull.return_value = [
+                json.dumps({'error': 'not found'})]
+            with self.settings(IMAGE_PULL_FIRST_WAVE=1):
+                results = distribution.distribute_image('base', self.hosts,
+                    2, self.rds)
+        self.assertEqual(client.return_value.pull.call_count, 1)
+        self.assertEqual(results[self.hosts[0].id], 'failed')
+        self.assertEqual(results[self.hosts[4].id], 'skipped')
+
+class ImageBuildTest(TestCase):
+
+    def setUp(self):
+        self.rds = FakeRedis()
+        self.hosts = []
+        for i in range(3):
+            host = Host()
+            host.name = 'host{}'.format(i)
+            host.hostname = '10.0.0.{}'.format(i)
+            host.save()
+            self.hosts.append(host)
+
+    def docker_client(self):
+        client = mock.MagicMock()
+        client.build.return_value = [
+            json.dumps({'stream': 'Step 0 : FROM base'}),
+            json.dumps({'stream': 'Successfully built abc123'}),
+        ]
+        client.inspect_image.return_value = {'Id': 'abc123def'}
+        client._get.return_value.iter_content.return_value = ['tar']
+        return client
+
+    def test_build_once(self):
+        """
+        Test an image is built on one host and loaded on the others
+        """
+        client = self.docker_client()
+        # mock call counts are not thread safe
+        loads = []
+        client._post.side_effect = lambda *args, **kwargs: \
+            loads.append(args) or mock.DEFAULT
+        with mock.patch.object(Host, '_get_client', return_value=client), \
+                mock.patch.object(Host, 'has_feature', return_value=True):
+            results = distribution.build_image('github.com/test/app', 'app',
+                self.hosts, rds=self.rds)
+        self.assertEqual(set(results.values()), set(['done']))
+        self.assertEqual(client.build.call_count, 1)
+        self.assertEqual(len(loads), 2)
+        client._url.assert_any_call('/images/app/get')
+
+    def test_build_once_mismatch(self):
+        """
+        Test hosts that end up with a different image are reported
+        """
+        client = self.docker_client()
+        ids = {self.hosts[2].id: 'other'}
+        with mock.patch.object(Host, '_get_client', return_value=client), \
+                mock.patch.object(Host, 'has_feature', return_value=True), \
+                mock.patch('images.distribution.get_image_id',
+                    side_effect=lambda h, i: ids.get(h.id, 'abc123def')):
+            results = distribution.build_image('github.com/test/app', 'app',
+                self.hosts, rds=self.rds)
+        self.assertEqual(results[self.hosts[1].id], 'done')
+        self.assertEqual(results[self.hosts[2].id], 'mismatch')
+
+    def test_build_without_transfer(self):
+        """
+        Test images are built on every host if they cannot be copied
+        """
+        client = self.docker_client()
+        with mock.patch.object(Host, '_get_client', return_value=client), \
+                mock.patch.object(Host, 'has_feature', return_value=False):
+            results = distribution.build_image('github.com/test/app', 'app',
+                self.hosts, rds=self.rds)
+        self.assertEqual(set(results.values()), set(['built']))
+        self.assertEqual(client.build.call_count, 3)
+        self.assertFalse(client._post.called)
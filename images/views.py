@@ -18,14 +18,21 @@ from django.contrib import messages
 from django.utils.translation import ugettext as _
 from hosts.models import Host
 from images.models import Image
+from images import distribution
 from shipyard import tasks
+import redis
 
 @login_required
 def index(request):
     hosts = Host.objects.filter(enabled=True)
-    images = Image.objects.filter(host__in=hosts).exclude(repository__contains='<none>').order_by('repository')
+    images = Image.objects.filter(host__in=hosts).exclude(repository__contains='<none>').select_related('host').order_by('repository')
+    try:
+        pulls = distribution.get_status()
+    except redis.RedisError:
+        pulls = {}
     ctx = {
-        'images': images
+        'images': images,
+        'pulls': sorted(pulls.items()),
     }
     return render_to_response('images/index.html', ctx,
         context_instance=RequestContext(request))
@@ -0,0 +1,127 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime
+from metrics.models import Metric
+from metrics import ring
+from shipyard import utils
+import json
+import time
+
+METRICS_BUFFER_KEY = 'metrics:buffer'
+
+def get_samples(metrics, timestamp=None):
+    """
+    Returns the counter samples from an agent metrics payload
+
+    :param metrics: List of metrics posted by the agent
+    :param timestamp: Unix timestamp of the samples (default: now)
+
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    samples = []
+    for metric in metrics or []:
+        for counter in metric.get('counters') or []:
+            samples.append({
+                'type': metric.get('type'),
+                'source': metric.get('container_id'),
+                'counter': counter.get('name'),
+                'value': counter.get('value'),
+                'unit': counter.get('unit'),
+                'timestamp': timestamp,
+            })
+    return samples
+
+def buffer_size():
+    rds = utils.get_redis_connection()
+    return rds.llen(METRICS_BUFFER_KEY)
+
+def queue_samples(samples):
+    """
+    Appends samples to the metrics buffer
+
+    Returns the number of buffered samples
+
+    """
+    if not samples:
+        return buffer_size()
+    rds = utils.get_redis_connection()
+    return rds.rpush(METRICS_BUFFER_KEY, *[json.dumps(x) for x in samples])
+
+def write_samples(samples):
+    """
+    Inserts samples into the metric table in a single transaction
+
+    """
+    metrics = []
+    for s in samples:
+        metrics.append(Metric(
+            timestamp=datetime.fromtimestamp(s.get('timestamp'), timezone.utc),
+            metric_type=s.get('type'),
+            source=s.get('source'),
+            counter=s.get('counter'),
+            value=s.get('value'),
+            unit=s.get('unit')))
+    with transaction.atomic():
+        Metric.objects.bulk_create(metrics)
+    return len(metrics)
+
+def store_samples(samples):
+    """
+    Stores samples in the ring buffers and the metric table (if enabled)
+
+    """
+    count = len(samples)
+    if getattr(settings, 'METRICS_COLD_STORAGE', True):
+        count = write_samples(samples)
+    if getattr(settings, 'METRICS_RING_ENABLED', False):
+        ring.store_samples(samples)
+    return count
+
+def flush_samples(batch_size=5000):
+    """
+    Drains the metrics buffer into the ring buffers and metric table
+
+    Samples are removed from the buffer in batches of `batch_size` and
+    inserted one batch per transaction.  If an insert fails the batch is
+    returned to the head of the buffer.
+
+    :param batch_size: Max number of samples to insert per transaction
+
+    """
+    rds = utils.get_redis_connection()
+    count = 0
+    while True:
+        with rds.pipeline() as pipe:
+            pipe.lrange(METRICS_BUFFER_KEY, 0, batch_size - 1)
+            pipe.ltrim(METRICS_BUFFER_KEY, batch_size, -1)
+            items, _ = pipe.execute()
+        if not items:
+            break
+        samples = [json.loads(x) for x in items]
+        try:
+            if getattr(settings, 'METRICS_COLD_STORAGE', True):
+                write_samples(samples)
+        except Exception:
+            rds.lpush(METRICS_BUFFER_KEY, *reversed(items))
+            raise
+        if getattr(settings, 'METRICS_RING_ENABLED', False):
+            ring.store_samples(samples)
+        count += len(samples)
+        if len(items) < batch_size:
+            break
+    return count
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'MetricRollup'
+        db.create_table(u'metrics_metricrollup', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('resolution', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('timestamp', self.gf('django.db.models.fields.DateTimeField')()),
+            ('source', self.gf('django.db.models.fields.CharField')(max_length=96)),
+            ('counter', self.gf('django.db.models.fields.CharField')(max_length=96)),
+            ('minimum', self.gf('django.db.models.fields.IntegerField')()),
+            ('maximum', self.gf('django.db.models.fields.IntegerField')()),
+            ('total', self.gf('django.db.models.fields.BigIntegerField')()),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')()),
+        ))
+        db.send_create_signal(u'metrics', ['MetricRollup'])
+
+        # Adding unique constraint on 'MetricRollup', fields ['resolution', 'source', 'counter', 'timestamp']
+        db.create_unique(u'metrics_metricrollup', ['resolution', 'source', 'counter', 'timestamp'])
+
+        # Adding model 'MetricCheckpoint'
+        db.create_table(u'metrics_metriccheckpoint', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(unique=True, max_length=64)),
+            ('last_id', self.gf('django.db.models.fields.BigIntegerField')(default=0)),
+        ))
+        db.send_create_signal(u'metrics', ['MetricCheckpoint'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'MetricRollup', fields ['resolution', 'source', 'counter', 'timestamp']
+        db.delete_unique(u'metrics_metricrollup', ['resolution', 'source', 'counter', 'timestamp'])
+
+        # Deleting model 'MetricRollup'
+        db.delete_table(u'metrics_metricrollup')
+
+        # Deleting model 'MetricCheckpoint'
+        db.delete_table(u'metrics_metriccheckpoint')
+
+
+    models = {
+        u'metrics.metric': {
+            'Meta': {'object_name': 'Metric'},
+            'counter': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'metric_type': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'source': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'null': 'True', 'blank': 'True'}),
+            'unit': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'value': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'metrics.metriccheckpoint': {
+            'Meta': {'object_name': 'MetricCheckpoint'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_id': ('django.db.models.fields.BigIntegerField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'})
+        },
+        u'metrics.metricrollup': {
+            'Meta': {'unique_together': "(('resolution', 'source', 'counter', 'timestamp'),)", 'object_name': 'MetricRollup'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'counter': ('django.db.models.fields.CharField', [], {'max_length': '96'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'maximum': ('django.db.models.fields.IntegerField', [], {}),
+            'minimum': ('django.db.models.fields.IntegerField', [], {}),
+            'resolution': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'source': ('django.db.models.fields.CharField', [], {'max_length': '96'}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {}),
+            'total': ('django.db.models.fields.BigIntegerField', [], {})
+        }
+    }
+
+    complete_apps = ['metrics']
\ No newline at end of file
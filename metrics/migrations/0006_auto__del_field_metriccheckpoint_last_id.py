@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Deleting field 'MetricCheckpoint.last_id'
+        db.delete_column(u'metrics_metriccheckpoint', 'last_id')
+
+
+    def backwards(self, orm):
+        # Adding field 'MetricCheckpoint.last_id'
+        db.add_column(u'metrics_metriccheckpoint', 'last_id',
+                      self.gf('django.db.models.fields.BigIntegerField')(default=0),
+                      keep_default=False)
+
+
+    models = {
+        u'metrics.metric': {
+            'Meta': {'object_name': 'Metric'},
+            'counter': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'metric_type': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'rolled_up': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'db_index': 'True'}),
+            'source': ('django.db.models.fields.CharField', [], {'max_length': '96', 'null': 'True', 'blank': 'True'}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'null': 'True', 'blank': 'True'}),
+            'unit': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'value': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'metrics.metriccheckpoint': {
+            'Meta': {'object_name': 'MetricCheckpoint'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'})
+        },
+        u'metrics.metricrollup': {
+            'Meta': {'unique_together': "(('resolution', 'source', 'counter', 'timestamp'),)", 'object_name': 'MetricRollup'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'counter': ('django.db.models.fields.CharField', [], {'max_length': '96'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'maximum': ('django.db.models.fields.IntegerField', [], {}),
+            'minimum': ('django.db.models.fields.IntegerField', [], {}),
+            'resolution': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'source': ('django.db.models.fields.CharField', [], {'max_length': '96'}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {}),
+            'total': ('django.db.models.fields.BigIntegerField', [], {})
+        }
+    }
+
+    complete_apps = ['metrics']
\ No newline at end of file
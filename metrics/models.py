@@ -11,19 +11,221 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta
+from metrics import ring
+import calendar
+
+# rollup resolutions in seconds
+ROLLUP_RESOLUTIONS = (60, 300, 3600)
+ROLLUP_CHECKPOINT = 'rollup'
+
+def get_bucket(timestamp, resolution):
+    ts = calendar.timegm(timestamp.utctimetuple())
+    return datetime.fromtimestamp(ts - (ts % resolution), timezone.utc)
 
 class Metric(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now, null=True,
+        blank=True)
     metric_type = models.CharField(max_length=96, null=True, blank=True)
     source = models.CharField(max_length=96, null=True, blank=True)
     counter = models.CharField(max_length=96, null=True, blank=True)
     value = models.IntegerField(null=True, blank=True)
     unit = models.CharField(max_length=64, null=True, blank=True)
+    rolled_up = models.BooleanField(default=False, db_index=True,
+        help_text='Aggregated into the rollups')
 
     def __unicode__(self):
         return '{}: {} {} {}'.format(self.metric_type, self.counter, self.value,
                 self.unit)
 
     def unix_timestamp(self):
-        return int(self.timestamp.strftime('%s'))
+        return calendar.timegm(self.timestamp.utctimetuple())
+
+    @classmethod
+    def get_series(cls, source, counter, period=None, points=None):
+        """
+        Returns chart data for a container counter
+
+        Raw samples are used for periods up to `METRIC_RAW_PERIOD` (read from
+        the ring buffers when enabled) ; longer periods read the smallest
+        rollup resolution that fits in `points` values.
+
+        :param source: Container id
+        :param counter: Counter name (i.e. cpu, memory)
+        :param period: Number of seconds of history (default: last `points`
+            raw samples)
+        :param points: Max number of values to return
+
+        """
+        points = points or getattr(settings, 'METRIC_CHART_POINTS', 300)
+        metrics = cls.objects.filter(source=source, counter=counter)
+        resolution = None
+        start = None
+        if period:
+            start = timezone.now() - timedelta(seconds=period)
+            metrics = metrics.filter(timestamp__gte=start)
+            resolution = MetricRollup.get_resolution(period, points)
+        if resolution is None and getattr(settings, 'METRICS_RING_ENABLED',
+                False):
+            # recent samples are read from the ring buffers
+            since = calendar.timegm(start.utctimetuple()) if start else 0
+            data = []
+            for timestamp, value in reversed(ring.get_samples(source, counter)):
+                if timestamp < since or len(data) >= points:
+                    break
+                data.append({
+                    'counter': counter,
+                    'value': value,
+                    'timestamp': timestamp,
+                    })
+            if data or not getattr(settings, 'METRICS_COLD_STORAGE', True):
+                return data
+        if resolution:
+            metrics = MetricRollup.objects.filter(resolution=resolution,
+                source=source, counter=counter, timestamp__gte=start)
+        data = []
+        for m in metrics.order_by('-timestamp')[:points]:
+            data.append({
+                'counter': counter,
+                'value': m.value if resolution is None else m.get_average(),
+                'timestamp': m.unix_timestamp(),
+                })
+        return data
+
+class MetricRollup(models.Model):
+    resolution = models.PositiveIntegerField()
+    timestamp = models.DateTimeField()
+    source = models.CharField(max_length=96)
+    counter = models.CharField(max_length=96)
+    minimum = models.IntegerField()
+    maximum = models.IntegerField()
+    total = models.BigIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (('resolution', 'source', 'counter', 'timestamp'),)
+
+    def __unicode__(self):
+        return '{}s {}: {} {}'.format(self.resolution, self.source,
+            self.counter, self.get_average())
+
+    def get_average(self):
+        if not self.count:
+            return 0
+        return float(self.total) / self.count
+
+    def unix_timestamp(self):
+        return calendar.timegm(self.timestamp.utctimetuple())
+
+    @classmethod
+    def get_resolution(cls, period, points):
+        """
+        Returns the smallest rollup resolution that covers `period` seconds
+        in at most `points` values (`None` when raw samples should be used)
+
+        """
+        if period <= getattr(settings, 'METRIC_RAW_PERIOD', 3600):
+            return None
+        for resolution in ROLLUP_RESOLUTIONS:
+            if period / resolution <= points:
+                return resolution
+        return ROLLUP_RESOLUTIONS[-1]
+
+    @classmethod
+    def rollup(cls, batch_size=10000):
+        """
+        Aggregates new raw metrics into the rollup tables
+
+        Raw metrics are marked once rolled up instead of tracking the last
+        id processed: ids are not committed in order by concurrent writers
+        so a lower id can show up after a higher one was rolled up.  Each
+        batch is merged into the existing rollups and marked in one
+        transaction ; concurrent rollups are serialized by locking the
+        `MetricCheckpoint` row.
+
+        :param batch_size: Max number of raw metrics per transaction
+
+        """
+        count = 0
+        while True:
+            with transaction.atomic():
+                MetricCheckpoint.objects.select_for_update().get_or_create(
+                    name=ROLLUP_CHECKPOINT)
+                rows = list(Metric.objects.filter(rolled_up=False)
+                    .order_by('id').values_list('id', 'timestamp', 'source',
+                    'counter', 'value')[:batch_size])
+                if not rows:
+                    break
+                # samples without a timestamp or value are only marked
+                samples = [x for x in rows if x[1] is not None and
+                    x[4] is not None]
+                if samples:
+                    for resolution in ROLLUP_RESOLUTIONS:
+                        cls._merge(resolution, samples)
+                Metric.objects.filter(id__in=[x[0] for x in rows]).update(
+                    rolled_up=True)
+            count += len(rows)
+            if len(rows) < batch_size:
+                break
+        return count
+
+    @classmethod
+    def _merge(cls, resolution, rows):
+        buckets = {}
+        for pk, timestamp, source, counter, value in rows:
+            key = (source, counter, get_bucket(timestamp, resolution))
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                b[0] = min(b[0], value)
+                b[1] = max(b[1], value)
+                b[2] += value
+                b[3] += 1
+        timestamps = [x[2] for x in buckets]
+        existing = cls.objects.filter(resolution=resolution,
+            timestamp__gte=min(timestamps), timestamp__lte=max(timestamps))
+        new_rollups = []
+        for r in existing:
+            b = buckets.pop((r.source, r.counter, r.timestamp), None)
+            if b is None:
+                continue
+            cls.objects.filter(id=r.id).update(
+                minimum=min(r.minimum, b[0]), maximum=max(r.maximum, b[1]),
+                total=r.total + b[2], count=r.count + b[3])
+        for (source, counter, timestamp), b in buckets.items():
+            new_rollups.append(cls(resolution=resolution, timestamp=timestamp,
+                source=source, counter=counter, minimum=b[0], maximum=b[1],
+                total=b[2], count=b[3]))
+        cls.objects.bulk_create(new_rollups)
+
+    @classmethod
+    def purge(cls):
+        """
+        Removes raw metrics and rollups older than the configured retention
+
+        Raw metrics are only removed once they have been rolled up.
+
+        """
+        retention = getattr(settings, 'METRIC_RETENTION', {})
+        now = timezone.now()
+        if retention.get(0):
+            Metric.objects.filter(rolled_up=True,
+                timestamp__lt=now - timedelta(seconds=retention[0])).delete()
+        for resolution in ROLLUP_RESOLUTIONS:
+            if retention.get(resolution):
+                cls.objects.filter(resolution=resolution, timestamp__lt=now -
+                    timedelta(seconds=retention[resolution])).delete()
+
+class MetricCheckpoint(models.Model):
+    """
+    A named row locked (`select_for_update`) to serialize a periodic job
+
+    """
+    name = models.CharField(max_length=64, unique=True)
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,132 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per container metric ring buffers
+
+The last samples for each container counter are kept in a single redis
+string as a header holding the timestamp of the first sample followed by
+fixed width records of the seconds since the previous sample (unsigned
+16 bit) and the value (signed 32 bit).  Sixty samples take 364 bytes.
+
+"""
+from django.conf import settings
+from shipyard import utils
+import redis
+import struct
+
+RING_KEY = 'metrics:ring:{0}:{1}'
+HEADER = struct.Struct('>I')
+RECORD = struct.Struct('>Hi')
+MAX_DELTA = 0xffff
+MIN_VALUE = -0x80000000
+MAX_VALUE = 0x7fffffff
+# times an update is retried when the rings are written concurrently
+MAX_RETRIES = 10
+
+def encode(samples):
+    """
+    Packs a list of (timestamp, value) tuples
+
+    """
+    if not samples:
+        return ''
+    data = [HEADER.pack(samples[0][0])]
+    previous = samples[0][0]
+    for timestamp, value in samples:
+        data.append(RECORD.pack(timestamp - previous,
+            max(MIN_VALUE, min(MAX_VALUE, int(value)))))
+        previous = timestamp
+    return ''.join(data)
+
+def decode(data):
+    """
+    Unpacks a ring buffer into a list of (timestamp, value) tuples
+
+    """
+    samples = []
+    if not data:
+        return samples
+    timestamp = HEADER.unpack_from(data)[0]
+    for offset in xrange(HEADER.size, len(data), RECORD.size):
+        delta, value = RECORD.unpack_from(data, offset)
+        timestamp += delta
+        samples.append((timestamp, value))
+    return samples
+
+def append(samples, new_samples, size):
+    """
+    Appends samples keeping the last `size` samples
+
+    Out of order samples are recorded at the previous timestamp.  If the gap
+    since the previous sample does not fit in a record the older samples
+    are dropped.
+
+    """
+    for timestamp, value in new_samples:
+        if samples:
+            previous = samples[-1][0]
+            if timestamp < previous:
+                timestamp = previous
+            elif timestamp - previous > MAX_DELTA:
+                samples = []
+        samples.append((int(timestamp), value))
+    return samples[-size:]
+
+def store_samples(samples):
+    """
+    Appends agent samples to the container ring buffers
+
+    The rings are read and written in a transaction watching their keys
+    and the update is retried if another writer changed them in between
+    (`redis.WatchError` is raised after `MAX_RETRIES` attempts).
+
+    :param samples: List of samples (see `metrics.buffer.get_samples`)
+
+    """
+    size = getattr(settings, 'METRICS_RING_SIZE', 60)
+    ttl = getattr(settings, 'METRICS_RING_TTL', 86400)
+    rings = {}
+    for s in samples:
+        if not s.get('source') or not s.get('counter') or \
+                s.get('value') is None:
+            continue
+        key = RING_KEY.format(s.get('source'), s.get('counter'))
+        rings.setdefault(key, []).append((s.get('timestamp'), s.get('value')))
+    if not rings:
+        return
+    keys = rings.keys()
+    rds = utils.get_redis_connection()
+    with rds.pipeline() as pipe:
+        for attempt in range(MAX_RETRIES):
+            try:
+                pipe.watch(*keys)
+                current = pipe.mget(keys)
+                pipe.multi()
+                for key, data in zip(keys, current):
+                    new_samples = sorted(rings[key])
+                    pipe.setex(key, encode(append(decode(data), new_samples,
+                        size)), ttl)
+                pipe.execute()
+                return
+            except redis.WatchError:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+
+def get_samples(source, counter):
+    """
+    Returns the buffered (timestamp, value) samples for a container counter
+
+    """
+    rds = utils.get_redis_connection()
+    return decode(rds.get(RING_KEY.format(source, counter)))
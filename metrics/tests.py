@@ -1,3 +1,209 @@
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import datetime
+from metrics import buffer, ring
+from metrics.models import Metric, MetricRollup
+from shipyard.testing import FakeRedis
+import json
+import mock
+import time
 
-# Create your tests here.
+METRICS = [
+    {
+        'type': 'container',
+        'container_id': 'abc',
+        'counters': [
+            {'name': 'cpu', 'value': 12, 'unit': '%'},
+            {'name': 'memory', 'value': 1024, 'unit': 'bytes'},
+        ],
+    },
+]
+
+class MetricBufferTest(TestCase):
+
+    def setUp(self):
+        self.rds = FakeRedis()
+        patcher = mock.patch('shipyard.utils.get_redis_connection',
+            return_value=self.rds)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_samples(self):
+        """
+        Test samples are built for every counter
+        """
+        samples = buffer.get_samples(METRICS, timestamp=1400000000)
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(samples[0].get('source'), 'abc')
+        self.assertEqual(samples[0].get('counter'), 'cpu')
+        self.assertEqual(samples[1].get('value'), 1024)
+
+    def test_flush_samples(self):
+        """
+        Test flushing drains the buffer into the metric table
+        """
+        samples = buffer.get_samples(METRICS * 3, timestamp=1400000000)
+        self.assertEqual(buffer.queue_samples(samples), 6)
+        self.assertEqual(buffer.flush_samples(batch_size=4), 6)
+        self.assertEqual(buffer.buffer_size(), 0)
+        self.assertEqual(Metric.objects.count(), 6)
+        m = Metric.objects.filter(counter='cpu')[0]
+        self.assertEqual(m.unix_timestamp(), 1400000000)
+
+    def test_flush_samples_requeues_on_error(self):
+        """
+        Test a failed batch is returned to the buffer
+        """
+        buffer.queue_samples(buffer.get_samples(METRICS))
+        with mock.patch('metrics.buffer.write_samples',
+                side_effect=ValueError('boom')):
+            self.assertRaises(ValueError, buffer.flush_samples)
+        self.assertEqual(buffer.buffer_size(), 2)
+        self.assertEqual(json.loads(self.rds.data[
+            buffer.METRICS_BUFFER_KEY][0]).get('counter'), 'cpu')
+
+class MetricRollupTest(TestCase):
+
+    def add_metric(self, value, timestamp, counter='cpu', pk=None):
+        m = Metric(id=pk, metric_type='container', source='abc',
+            counter=counter, value=value, unit='%',
+            timestamp=datetime.fromtimestamp(timestamp, timezone.utc))
+        m.save()
+        return m
+
+    def test_rollup(self):
+        """
+        Test raw metrics are aggregated for every resolution
+        """
+        for i, value in enumerate([10, 30, 20]):
+            self.add_metric(value, 1400000000 + i * 10)
+        self.add_metric(50, 1400000070)
+        self.assertEqual(MetricRollup.rollup(), 4)
+        rollups = MetricRollup.objects.filter(resolution=60).order_by(
+            'timestamp')
+        self.assertEqual(len(rollups), 2)
+        r = rollups[0]
+        self.assertEqual((r.minimum, r.maximum, r.count), (10, 30, 3))
+        self.assertEqual(r.get_average(), 20.0)
+        self.assertEqual(r.unix_timestamp(), 1399999980)
+        r = MetricRollup.objects.get(resolution=3600)
+        self.assertEqual((r.minimum, r.maximum, r.count), (10, 50, 4))
+
+    def test_rollup_incremental(self):
+        """
+        Test late metrics are merged into existing rollups
+        """
+        self.add_metric(10, 1400000000)
+        MetricRollup.rollup()
+        self.add_metric(40, 1400000005)
+        self.assertEqual(MetricRollup.rollup(), 1)
+        self.assertEqual(MetricRollup.rollup(), 0)
+        r = MetricRollup.objects.get(resolution=60)
+        self.assertEqual((r.minimum, r.maximum, r.total, r.count),
+            (10, 40, 50, 2))
+
+    def test_rollup_out_of_order_commit(self):
+        """
+        Test metrics committed after a higher id was rolled up are counted
+        """
+        self.add_metric(20, 1400000005, pk=10)
+        MetricRollup.rollup()
+        # a concurrent writer commits a lower id after the rollup
+        self.add_metric(10, 1400000000, pk=5)
+        self.assertEqual(MetricRollup.rollup(), 1)
+        r = MetricRollup.objects.get(resolution=60)
+        self.assertEqual((r.total, r.count), (30, 2))
+
+    @override_settings(METRIC_RETENTION={0: 3600, 60: 7200})
+    def test_purge(self):
+        """
+        Test purging only removes rolled up metrics past retention
+        """
+        self.add_metric(10, 1400000000)
+        MetricRollup.rollup()
+        self.add_metric(20, 1400000010)
+        MetricRollup.purge()
+        self.assertEqual(Metric.objects.count(), 1)
+        self.assertEqual(MetricRollup.objects.filter(resolution=60).count(), 0)
+        self.assertEqual(MetricRollup.objects.filter(resolution=300).count(), 1)
+
+    def test_get_series(self):
+        """
+        Test long periods are read from rollups
+        """
+        now = int(time.time())
+        for i in range(5):
+            self.add_metric(i, now - i * 600)
+        MetricRollup.rollup()
+        data = Metric.get_series('abc', 'cpu', period=86400, points=300)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(sum([x.get('value') for x in data]), 10)
+        data = Metric.get_series('abc', 'cpu', points=3)
+        self.assertEqual([x.get('value') for x in data], [0, 1, 2])
+
+class MetricRingTest(TestCase):
+
+    def setUp(self):
+        self.rds = FakeRedis()
+        patcher = mock.patch('shipyard.utils.get_redis_connection',
+            return_value=self.rds)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_encode_decode(self):
+        """
+        Test samples survive packing
+        """
+        samples = [(1400000000, 5), (1400000010, -3), (1400000025, 2 ** 20)]
+        data = ring.encode(samples)
+        self.assertEqual(len(data), 4 + 6 * 3)
+        self.assertEqual(ring.decode(data), samples)
+
+    def test_append(self):
+        """
+        Test appending keeps the last samples and drops stale history
+        """
+        samples = ring.append([], [(1400000000 + x, x) for x in range(10)], 4)
+        self.assertEqual([x[1] for x in samples], [6, 7, 8, 9])
+        samples = ring.append(samples, [(1400100000, 1)], 4)
+        self.assertEqual(samples, [(1400100000, 1)])
+
+    @override_settings(METRICS_RING_ENABLED=True, METRICS_RING_SIZE=60)
+    def test_store_samples(self):
+        """
+        Test samples are kept per container counter
+        """
+        for i in range(100):
+            buffer.store_samples(buffer.get_samples(METRICS,
+                timestamp=1400000000 + i * 10))
+        samples = ring.get_samples('abc', 'cpu')
+        self.assertEqual(len(samples), 60)
+        self.assertEqual(samples[-1], (1400000990, 12))
+        self.assertEqual(len(self.rds.get(ring.RING_KEY.format('abc', 'cpu'))),
+            364)
+
+    @override_settings(METRICS_RING_ENABLED=True)
+    def test_store_samples_concurrent(self):
+        """
+        Test samples written concurrently to the same ring are kept
+        """
+        ring.store_samples(buffer.get_samples(METRICS, timestamp=1400000000))
+        self.rds.before_read = lambda: ring.store_samples(
+            buffer.get_samples(METRICS, timestamp=1400000010))
+        ring.store_samples(buffer.get_samples(METRICS, timestamp=1400000020))
+        self.assertEqual([x[0] for x in ring.get_samples('abc', 'cpu')],
+            [1400000000, 1400000010, 1400000020])
+
+    @override_settings(METRICS_RING_ENABLED=True, METRICS_COLD_STORAGE=False)
+    def test_get_series(self):
+        """
+        Test recent chart data is read from the ring buffers
+        """
+        buffer.store_samples(buffer.get_samples(METRICS, timestamp=1400000000))
+        buffer.store_samples(buffer.get_samples(METRICS, timestamp=1400000010))
+        self.assertEqual(Metric.objects.count(), 0)
+        data = Metric.get_series('abc', 'memory', points=30)
+        self.assertEqual([x.get('timestamp') for x in data],
+            [1400000010, 1400000000])
+        self.assertEqual(data[0].get('value'), 1024)
@@ -17,3 +17,9 @@ class ProtectedContainerError(Exception):
 
 class RecoveryThresholdError(Exception):
     pass
+
+class PayloadError(ValueError):
+    pass
+
+class UnsupportedEncodingError(PayloadError):
+    pass
@@ -0,0 +1,146 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import logging
+import re
+
+logger = logging.getLogger('shipyard.queries')
+
+# sqlite records queries as "QUERY = '...' - PARAMS = (...)"
+SQL_SQLITE = re.compile(r"^QUERY = u?'(.*)' - PARAMS = .*$", re.S)
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LIST = re.compile(r'\bIN \([^)]*\)', re.I)
+SQL_SPACE = re.compile(r'\s+')
+
+def get_shape(sql):
+    """
+    Returns the shape of a query: the sql with its literals replaced so
+    queries that only differ by their parameters are equal
+
+    """
+    match = SQL_SQLITE.match(sql)
+    if match:
+        sql = match.group(1)
+    sql = SQL_LITERAL.sub('?', sql)
+    sql = SQL_IN_LIST.sub('IN (...)', sql)
+    return SQL_SPACE.sub(' ', sql).strip()
+
+def get_repeated(queries, threshold=None):
+    """
+    Returns the `(shape, count)` of the query shapes run at least
+    `threshold` times, most repeated first
+
+    Repeated shapes usually are N+1 queries (a query per row of a list).
+
+    :param queries: Queries as recorded in `connection.queries`
+    :param threshold: Min number of runs (default `QUERY_REPEAT_THRESHOLD`)
+
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 3)
+    shapes = Counter([get_shape(x.get('sql')) for x in queries])
+    return [(shape, count) for shape, count in shapes.most_common()
+        if count >= threshold]
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    if match.url_name and match.url_name.startswith('api_'):
+        # tastypie views are shared by every resource
+        return '{0}:{1}'.format(match.url_name,
+            match.kwargs.get('resource_name'))
+    return '{0}.{1}'.format(match.func.__module__, match.func.__name__)
+
+def get_budget(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Fails with an `AssertionError` if the block runs more than
+    `max_queries` queries or runs a query shape more than `max_repeats`
+    times
+
+    Yields the `CaptureQueriesContext` of the block.
+
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        yield ctx
+    errors = []
+    if max_queries is not None and len(ctx) > max_queries:
+        errors.append('{0} queries run (budget {1})'.format(len(ctx),
+            max_queries))
+    if max_repeats is not None:
+        for shape, count in get_repeated(ctx.captured_queries,
+                max_repeats + 1):
+            errors.append('{0} runs of: {1}'.format(count, shape))
+    if errors:
+        raise AssertionError('Query budget exceeded:\n' + '\n'.join(
+            errors + ['{0}. {1}'.format(i + 1, x.get('sql'))
+                for i, x in enumerate(ctx.captured_queries)]))
+
+class QueryBudgetMixin(object):
+    """
+    Test case mixin checking views against `QUERY_BUDGETS`
+
+    """
+    def assertViewBudget(self, view_name, max_repeats=2):
+        """
+        Returns a context manager failing if the block exceeds the query
+        budget of `view_name` or repeats a query shape more than
+        `max_repeats` times
+
+        """
+        budget = get_budget(view_name)
+        if budget is None:
+            self.fail('No query budget for {0}'.format(view_name))
+        return query_budget(budget, max_repeats)
+
+class QueryCountMiddleware(object):
+    """
+    Records the queries of each request
+
+    Adds an `X-Query-Count` header and logs requests that repeat a query
+    shape `QUERY_REPEAT_THRESHOLD` times or exceed the budget of their view
+    in `QUERY_BUDGETS`.  Enabled by `QUERY_COUNT_ENABLED`.
+
+    """
+    def process_request(self, request):
+        if not getattr(settings, 'QUERY_COUNT_ENABLED', False):
+            return None
+        request._query_count_debug = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        request._query_count_start = len(connection.queries)
+        return None
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_query_count_start'):
+            return response
+        queries = connection.queries[request._query_count_start:]
+        connection.use_debug_cursor = request._query_count_debug
+        response['X-Query-Count'] = str(len(queries))
+        view_name = get_view_name(request)
+        budget = get_budget(view_name)
+        if budget is not None and len(queries) > budget:
+            logger.warning('%s (%s) ran %d queries (budget %d)',
+                request.path, view_name, len(queries), budget)
+        for shape, count in get_repeated(queries):
+            logger.warning('%s (%s) ran %d times: %s', request.path,
+                view_name, count, shape)
+        return response
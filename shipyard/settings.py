@@ -42,6 +42,10 @@ MANAGERS = ADMINS
 
 # cache settings
 HOST_CACHE_TTL = 30 # seconds to cache container lookup
+# amount of time in seconds to wait for docker API requests
+DOCKER_CLIENT_TIMEOUT = int(os.getenv('DOCKER_CLIENT_TIMEOUT', 60))
+# max number of connections kept open to each docker host
+DOCKER_CLIENT_POOL_SIZE = int(os.getenv('DOCKER_CLIENT_POOL_SIZE', 10))
 
 DATABASES = {
     'default': {
@@ -151,6 +155,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'shipyard.queries.QueryCountMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -217,7 +222,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -225,6 +234,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'shipyard.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
     }
 }
 
@@ -244,6 +257,102 @@ RECOVERY_THRESHOLD = int(os.getenv('RECOVERY_THRESHOLD', 3))
 RECOVERY_TIME = 60
 
 HIPACHE_ENABLED = not TESTING
+
+# max number of hosts a container is launched on at once
+CONTAINER_LAUNCH_CONCURRENCY = int(os.getenv('CONTAINER_LAUNCH_CONCURRENCY',
+    10))
+# amount of time in seconds to keep the status of a launch
+CONTAINER_LAUNCH_TTL = 3600
+# record the queries of each request (see shipyard.queries)
+QUERY_COUNT_ENABLED = DEBUG and not TESTING
+# number of runs of the same query shape in a request that is logged
+QUERY_REPEAT_THRESHOLD = 3
+# max number of queries per view ; checked by the tests and logged
+QUERY_BUDGETS = {
+    'containers.views.index': 5,
+    'containers.views.container_details': 6,
+    'images.views.index': 4,
+    'hosts.views.index': 4,
+    'applications.views.index': 4,
+    'api_dispatch_list:containers': 4,
+    'api_dispatch_list:images': 4,
+    'api_dispatch_list:applications': 7,
+}
+# number of containers per page of the container list
+CONTAINER_PAGE_SIZE = 100
+# max number of hosts pulling an image at once
+IMAGE_PULL_CONCURRENCY = int(os.getenv('IMAGE_PULL_CONCURRENCY', 4))
+# number of hosts in the first (canary) wave of an image pull
+IMAGE_PULL_FIRST_WAVE = 1
+# number of hosts in the following waves of an image pull
+IMAGE_PULL_WAVE_SIZE = int(os.getenv('IMAGE_PULL_WAVE_SIZE', 10))
+# amount of time in seconds to keep the status of an image pull
+IMAGE_PULL_TTL = 3600
+# build images once and copy them to the other hosts instead of building
+# on every host
+IMAGE_BUILD_ONCE = True
+# name of the host images are built on (defaults to the first host)
+IMAGE_BUILD_HOST = os.getenv('IMAGE_BUILD_HOST')
+# number of processes used to convert large container logs to html
+# (0 to convert in the web worker)
+LOG_RENDER_PROCESSES = 0 if TESTING else 2
+# size in bytes of the log segments converted and cached at once
+LOG_RENDER_SEGMENT_SIZE = 65536
+# amount of time in seconds to cache converted log segments
+LOG_RENDER_CACHE_TTL = 3600
+# max number of hosts worked on at once by bulk container actions
+CONTAINER_BULK_CONCURRENCY = int(os.getenv('CONTAINER_BULK_CONCURRENCY', 10))
+# max number of concurrent bulk container actions per host
+CONTAINER_BULK_HOST_CONCURRENCY = int(os.getenv(
+    'CONTAINER_BULK_HOST_CONCURRENCY', 4))
+# amount of time in seconds to wait for container port checks
+CONTAINER_PROBE_TIMEOUT = 1
+# amount of time in seconds to cache container port checks
+CONTAINER_PROBE_TTL = 2
+
+# cache agent key lookups and coalesce agent heartbeats in redis
+AGENT_CACHE_ENABLED = not TESTING
+# amount of time in seconds between agent heartbeat flushes
+AGENT_HEARTBEAT_FLUSH_INTERVAL = 5
+# number of containers synced per batch
+AGENT_SYNC_BATCH_SIZE = 500
+# max size in bytes of a decoded agent payload (0 for no limit)
+AGENT_MAX_PAYLOAD_SIZE = 256 * 1024 * 1024
+
+# buffer agent metrics in redis and write them in batches from a celery task
+# (when disabled metrics are written during the agent request)
+METRICS_BUFFER_ENABLED = not TESTING
+# max number of buffered samples before agents are asked to back off
+METRICS_BUFFER_MAX = int(os.getenv('METRICS_BUFFER_MAX', 250000))
+# seconds agents should wait before retrying when the buffer is full
+METRICS_BUFFER_RETRY_AFTER = 30
+# amount of time in seconds between metric buffer flushes
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# number of samples inserted per transaction when flushing
+METRICS_FLUSH_BATCH_SIZE = 5000
+# keep the latest samples of each container counter in redis ring buffers
+METRICS_RING_ENABLED = not TESTING
+# number of samples kept per container counter
+METRICS_RING_SIZE = int(os.getenv('METRICS_RING_SIZE', 60))
+# amount of time in seconds to keep the ring of a container that stopped
+# reporting
+METRICS_RING_TTL = 86400
+# write samples to the metric table (needed for rollups)
+METRICS_COLD_STORAGE = True
+# amount of time in seconds between metric rollups
+METRIC_ROLLUP_INTERVAL = 60
+# amount of time in seconds to keep metrics for each rollup resolution
+# (0 is the raw samples)
+METRIC_RETENTION = {
+    0: 86400,
+    60: 86400 * 7,
+    300: 86400 * 30,
+    3600: 86400 * 365,
+}
+# charts covering up to this many seconds use raw samples instead of rollups
+METRIC_RAW_PERIOD = 3600
+# max number of values returned for a chart
+METRIC_CHART_POINTS = 300
 CELERY_TIMEZONE = 'UTC'
 
 try:
@@ -273,7 +382,23 @@ CELERYBEAT_SCHEDULE = {
     'recover_containers': {
         'task': 'shipyard.tasks.recover_containers',
         'schedule': timedelta(seconds=RECOVERY_INTERVAL),
-    }
+    },
+    'flush_heartbeats': {
+        'task': 'shipyard.tasks.flush_heartbeats',
+        'schedule': timedelta(seconds=AGENT_HEARTBEAT_FLUSH_INTERVAL),
+    },
+    'flush_metrics': {
+        'task': 'shipyard.tasks.flush_metrics',
+        'schedule': timedelta(seconds=METRICS_FLUSH_INTERVAL),
+    },
+    'rollup_metrics': {
+        'task': 'shipyard.tasks.rollup_metrics',
+        'schedule': timedelta(seconds=METRIC_ROLLUP_INTERVAL),
+    },
+    'purge_metrics': {
+        'task': 'shipyard.tasks.purge_metrics',
+        'schedule': timedelta(hours=1),
+    },
 }
 
 # ssl
@@ -15,8 +15,12 @@ import celery
 from django.core.cache import cache
 from django.conf import settings
 from django.utils.translation import ugettext as _
+from containers import launch
 from containers.models import Container
 from hosts.models import Host
+from images import distribution
+from metrics import buffer
+from metrics.models import MetricRollup
 from exceptions import RecoveryThresholdError
 import utils
 import hashlib
@@ -25,27 +29,36 @@ import hashlib
 def import_image(repo_name=None):
     if not repo_name:
         raise StandardError('You must specify a repo name')
-    hosts = Host.objects.filter(enabled=True)
-    for h in hosts:
-        import_image_to_host.subtask((h, repo_name)).apply_async()
-    return True
+    hosts = Host.objects.filter(enabled=True).order_by('id')
+    results = distribution.distribute_image(repo_name, hosts)
+    done = len([x for x in results.values() if x == 'done'])
+    return 'Imported {} on {} of {} hosts'.format(repo_name, done,
+        len(results))
 
 @celery.task
 def import_image_to_host(host, repo_name):
     if not host or not repo_name:
         raise StandardError('You must specify a host and repo name')
     print('Importing {} on {}'.format(repo_name, host.name))
-    host.import_image(repo_name)
+    if not distribution.pull_on_host(host, repo_name):
+        return 'Already importing {} on {}'.format(repo_name, host.name)
     return 'Imported {} on {}'.format(repo_name, host.name)
 
 @celery.task
 def build_image(path=None, tag=None):
     if not path:
         raise StandardError('You must specify a path')
-    hosts = Host.objects.filter(enabled=True)
-    for h in hosts:
-        build_image_on_host.subtask((h, path, tag)).apply_async()
-    return True
+    hosts = Host.objects.filter(enabled=True).order_by('id')
+    if not getattr(settings, 'IMAGE_BUILD_ONCE', True):
+        for h in hosts:
+            build_image_on_host.subtask((h, path, tag)).apply_async()
+        return True
+    results = distribution.build_image(path, tag, hosts)
+    failed = [x for x in results.values() if x in ('failed', 'mismatch')]
+    if failed:
+        raise StandardError('Build of {} failed on {} of {} hosts'.format(
+            tag or path, len(failed), len(results)))
+    return 'Built {} on {} hosts'.format(tag or path, len(results))
 
 @celery.task
 def build_image_on_host(host, path, tag):
@@ -66,14 +79,17 @@ def docker_host_info():
 def recover_containers():
     protected_containers = Container.objects.filter(protected=True).exclude(
             is_running=True)
+    recovered = []
     for c in protected_containers:
         host = c.host
         print('Recovering {}'.format(c.get_name()))
         c_id, status = host.clone_container(c.container_id)
         # update container info
         host._load_container_data(c_id)
-        import time
-        time.sleep(5)
+        recovered.append((c, c_id))
+    # wait for the new containers to come up before moving apps to them
+    Container.wait_until_available([x[1] for x in recovered], timeout=5)
+    for c, c_id in recovered:
         new_c = Container.objects.get(container_id=c_id)
         # update app
         for app in c.get_applications():
@@ -81,3 +97,30 @@ def recover_containers():
             app.containers.add(new_c)
             app.save()
 
+@celery.task
+def launch_containers(batch_id, hosts, ips, **kwargs):
+    results = launch.launch_batch(batch_id, hosts, ips, **kwargs)
+    created = len([x for x in results if x[1] is None])
+    return 'Launched {} of {} containers ({} failed)'.format(created,
+        len(hosts), len(results) - created)
+
+@celery.task
+def flush_heartbeats():
+    count = Host.flush_heartbeats()
+    return 'Updated {} hosts'.format(count)
+
+@celery.task
+def flush_metrics():
+    batch_size = getattr(settings, 'METRICS_FLUSH_BATCH_SIZE', 5000)
+    count = buffer.flush_samples(batch_size)
+    return 'Flushed {} metrics'.format(count)
+
+@celery.task
+def rollup_metrics():
+    count = MetricRollup.rollup()
+    return 'Rolled up {} metrics'.format(count)
+
+@celery.task
+def purge_metrics():
+    MetricRollup.purge()
+    return True
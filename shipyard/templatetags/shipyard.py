@@ -43,12 +43,13 @@ def container_port_link(port, host):
     Returns container port as link
 
     :param port: Container port
-    :param host: Container host name
+    :param host: Container host (or host name)
 
     """
     ret = port
     if port:
-        host = Host.objects.get(name=host)
+        if not isinstance(host, Host):
+            host = Host.objects.get(name=host)
         host_url = host.hostname
         if 'unix' in host.hostname:
             host_url = '127.0.0.1'
@@ -0,0 +1,145 @@
+# Copyright Evan Hazlett and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import redis
+
+class FakeRedis(object):
+    """
+    Minimal in memory redis stand-in for tests
+
+    Implements the commands used by the metrics buffer and ring and the
+    image distribution locks ; patch `shipyard.utils.get_redis_connection`
+    to return an instance.
+
+    """
+    def __init__(self):
+        self.data = {}
+        # number of writes of each key (for watched transactions)
+        self.versions = {}
+        # called before the next watched read (to simulate a concurrent
+        # writer)
+        self.before_read = None
+
+    def _changed(self, name):
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def mget(self, keys):
+        return [self.data.get(x) for x in keys]
+
+    def set(self, name, value, ex=None, nx=False):
+        if nx and name in self.data:
+            return False
+        self.data[name] = value
+        self._changed(name)
+        return True
+
+    def setex(self, name, value, time):
+        return self.set(name, value, ex=time)
+
+    def delete(self, name):
+        if self.data.pop(name, None) is not None:
+            self._changed(name)
+
+    def expire(self, name, time):
+        pass
+
+    def sadd(self, name, value):
+        self.data.setdefault(name, set()).add(value)
+        self._changed(name)
+
+    def srem(self, name, value):
+        self.data.get(name, set()).discard(value)
+        self._changed(name)
+
+    def smembers(self, name):
+        return self.data.get(name, set())
+
+    def hset(self, name, key, value):
+        self.data.setdefault(name, {})[key] = value
+        self._changed(name)
+
+    def hgetall(self, name):
+        return self.data.get(name, {})
+
+    def llen(self, name):
+        return len(self.data.get(name, []))
+
+    def rpush(self, name, *values):
+        self.data.setdefault(name, []).extend(values)
+        self._changed(name)
+        return self.llen(name)
+
+    def lpush(self, name, *values):
+        for v in values:
+            self.data.setdefault(name, []).insert(0, v)
+        self._changed(name)
+        return self.llen(name)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakePipeline(object):
+    """
+    Pipeline of a `FakeRedis`
+
+    Commands are queued until `execute` ; `execute` raises
+    `redis.WatchError` if a watched key was written meanwhile.
+
+    """
+    def __init__(self, rds):
+        self.rds = rds
+        self.commands = []
+        self.watched = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def lrange(self, name, start, end):
+        self.commands.append(
+            lambda: self.rds.data.get(name, [])[start:end + 1])
+
+    def ltrim(self, name, start, end):
+        def ltrim():
+            self.rds.data[name] = self.rds.data.get(name, [])[start:]
+            self.rds._changed(name)
+            return True
+        self.commands.append(ltrim)
+
+    def setex(self, name, value, time):
+        self.commands.append(lambda: self.rds.setex(name, value, time))
+
+    def watch(self, *names):
+        self.watched = dict([(x, self.rds.versions.get(x)) for x in names])
+
+    def mget(self, keys):
+        if self.rds.before_read:
+            before_read, self.rds.before_read = self.rds.before_read, None
+            before_read()
+        return self.rds.mget(keys)
+
+    def multi(self):
+        pass
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        watched, self.watched = self.watched, None
+        if watched and [x for x, v in watched.items()
+                if self.rds.versions.get(x) != v]:
+            raise redis.WatchError()
+        return [x() for x in commands]
@@ -0,0 +1,133 @@
+from tastypie.test import ResourceTestCase
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.utils import override_settings
+from applications.models import Application
+from containers.models import Container
+from hosts import models
+from hosts.models import Host
+from images.models import Image
+from shipyard import queries
+from shipyard.templatetags import shipyard as tags
+import mock
+
+class QueryShapeTest(TestCase):
+
+    def test_shape(self):
+        """
+        Test queries differing only by their parameters have the same shape
+        """
+        a = queries.get_shape("SELECT * FROM t WHERE id = 1 AND n = 'a'")
+        b = queries.get_shape("SELECT *  FROM t WHERE id = 22 AND n = 'b'")
+        self.assertEqual(a, b)
+        self.assertEqual(queries.get_shape('SELECT * FROM t WHERE id IN ' \
+            '(1, 2, 3)'), 'SELECT * FROM t WHERE id IN (...)')
+
+    def test_repeated(self):
+        """
+        Test repeated query shapes are reported
+        """
+        sql = [{'sql': 'SELECT * FROM t WHERE id = {}'.format(x)}
+            for x in range(4)] + [{'sql': 'SELECT 1'}]
+        repeated = queries.get_repeated(sql, 3)
+        self.assertEqual(repeated, [('SELECT * FROM t WHERE id = ?', 4)])
+
+    def test_budget(self):
+        """
+        Test blocks over their budget or repeating queries fail
+        """
+        for x in range(3):
+            Host(name='host{}'.format(x), hostname='10.0.0.{}'.format(x)).save()
+        with queries.query_budget(1, 1):
+            list(Host.objects.all())
+        with self.assertRaises(AssertionError):
+            with queries.query_budget(1):
+                list(Host.objects.all())
+                list(Host.objects.all())
+        with self.assertRaises(AssertionError):
+            with queries.query_budget(max_repeats=2):
+                for h in Host.objects.all():
+                    Host.objects.get(id=h.id)
+
+    def test_port_link(self):
+        """
+        Test port links do not query when given the host
+        """
+        host = Host(name='local', hostname='10.0.0.1')
+        host.save()
+        with self.assertNumQueries(0):
+            link = tags.container_port_link('8080', host)
+        self.assertTrue('http://10.0.0.1:8080' in link)
+
+    @override_settings(QUERY_COUNT_ENABLED=True)
+    def test_middleware(self):
+        """
+        Test the query count of each request is recorded
+        """
+        resp = self.client.get('/accounts/login/')
+        self.assertTrue(resp.has_header('X-Query-Count'))
+
+class ViewQueryBudgetTest(queries.QueryBudgetMixin, ResourceTestCase):
+
+    def setUp(self):
+        super(ViewQueryBudgetTest, self).setUp()
+        self.username = 'testuser'
+        self.password = 'testpass'
+        self.user = User.objects.create_user(self.username,
+            'testuser@example.com', self.password)
+        self.api_key = self.user.api_key.key
+        patcher = mock.patch('shipyard.utils.update_hipache')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(models._capability_cache.clear)
+        containers = []
+        for x in range(3):
+            host = Host(name='host{}'.format(x),
+                hostname='10.0.0.{}'.format(x), enabled=True)
+            host.save()
+            host.update_capabilities('0.10.0')
+            Image.sync(host, [{'Id': 'i{}'.format(y),
+                'RepoTags': ['img{}:latest'.format(y)]} for y in range(5)])
+            for y in range(5):
+                c = Container(container_id='c{}{}'.format(x, y), host=host)
+                c.set_meta({'Name': '/app{}'.format(y),
+                    'Config': {'Image': 'img{}:latest'.format(y)},
+                    'NetworkSettings': {'Ports': {'80/tcp': [
+                        {'HostIp': '0.0.0.0', 'HostPort': str(49000 + y)}]}}})
+                c.save()
+                containers.append(c)
+        for x in range(3):
+            app = Application(name='app{}'.format(x),
+                domain_name='app{}.example.com'.format(x), backend_port='80')
+            app.save()
+            app.containers.add(*containers[x::3])
+        self.client.login(username=self.username, password=self.password)
+
+    def get_credentials(self):
+        return self.create_apikey(self.username, self.api_key)
+
+    def test_views(self):
+        """
+        Test the views stay within their query budgets
+        """
+        views = (
+            ('containers.views.index', '/containers/'),
+            ('containers.views.container_details', '/containers/details/c00/'),
+            ('images.views.index', '/images/'),
+            ('hosts.views.index', '/hosts/'),
+            ('applications.views.index', '/applications/'),
+        )
+        for view_name, url in views:
+            with self.assertViewBudget(view_name):
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+
+    def test_api(self):
+        """
+        Test the API lists stay within their query budgets
+        """
+        for resource in ('containers', 'images', 'applications'):
+            with self.assertViewBudget('api_dispatch_list:' + resource):
+                resp = self.api_client.get('/api/v1/{}/'.format(resource),
+                    format='json', authentication=self.get_credentials())
+            self.assertValidJSONResponse(resp)
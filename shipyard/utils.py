@@ -13,21 +13,154 @@
 # limitations under the License.
 from ansi2html import Ansi2HTMLConverter
 from django.conf import settings
+from django.db import connection
 from hashlib import md5
+from multiprocessing.pool import ThreadPool
+import json
 import redis
+import re
 import uuid
+import zlib
 
+ANSI_CODE = re.compile('\033\\[([\\d;]*)([a-zA-Z])')
+ANSI_MAX_STATE = 8
+# idle ansi to html converters
+_ansi_converters = []
+# zlib level used for the json blobs stored in the database
+BLOB_COMPRESSION_LEVEL = 6
+
+
+def get_redis_connection():
+    return redis.Redis(host=getattr(settings, 'REDIS_HOST'),
+        port=getattr(settings, 'REDIS_PORT'), db=getattr(settings, 'REDIS_DB'),
+        password=getattr(settings, 'REDIS_PASSWORD'))
+
+def run_concurrently(func, items, concurrency=10):
+    """
+    Calls `func` for each item using a pool of at most `concurrency` threads
+
+    Returns a list of `(result, error)` tuples in the order of `items`.
+    Database connections opened by the threads are closed when they are
+    done.
+
+    :param func: Callable taking a single item
+    :param items: Items to call `func` with
+    :param concurrency: Max number of concurrent calls
+
+    """
+    items = list(items)
+    if not items:
+        return []
+    def call(item):
+        try:
+            return func(item), None
+        except Exception, e:
+            return None, e
+        finally:
+            connection.close()
+    pool = ThreadPool(max(1, min(concurrency, len(items))))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def compress_json(data):
+    """
+    Returns the compressed binary encoding of JSON text for storage in a
+    `BinaryField`
+
+    :param data: JSON text
+
+    """
+    return zlib.compress(data, BLOB_COMPRESSION_LEVEL)
+
+def load_json_blob(value, default=None):
+    """
+    Decodes a JSON blob stored with `compress_json`
+
+    Plain JSON text (rows stored before blobs were compressed) is also
+    accepted.
+
+    :param value: Blob as returned by the database (`str`, `buffer` or
+        `memoryview`)
+    :param default: Value returned for empty blobs
+
+    """
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    elif value is not None and not isinstance(value, basestring):
+        value = str(value)
+    if not value:
+        return default
+    if value[:1] not in ('{', '['):
+        value = zlib.decompress(value)
+    return json.loads(value)
 
 def get_short_id(container_id):
     return container_id[:12]
 
-def convert_ansi_to_html(text, full=False):
+def get_ansi_converter():
+    """
+    Returns an idle ANSI converter from the pool (or a new one)
+
+    Return it with `release_ansi_converter` when done.
+
+    """
+    try:
+        return _ansi_converters.pop()
+    except IndexError:
+        return Ansi2HTMLConverter(markup_lines=True, linkify=False,
+            escaped=False)
+
+def release_ansi_converter(conv):
+    _ansi_converters.append(conv)
+
+def get_ansi_state(text, state=None):
+    """
+    Returns the ANSI attributes still active at the end of `text`
+
+    :param text: ANSI text
+    :param state: Attributes active before `text`
+
+    """
+    state = list(state or [])
+    for params, command in ANSI_CODE.findall(text):
+        if command not in 'mM':
+            continue
+        try:
+            codes = [int(x) for x in params.split(';')]
+        except ValueError:
+            codes = [0]
+        if 0 in codes:
+            state = []
+        elif params not in state[-1:]:
+            state.append(params)
+    # keep the state bounded for streams that never reset
+    return state[-ANSI_MAX_STATE:]
+
+def convert_ansi_to_html(text, full=False, state=None):
+    """
+    Converts ANSI text to HTML
+
+    :param text: ANSI text
+    :param full: Return a full HTML document
+    :param state: ANSI attributes active before `text` (see
+        `get_ansi_state`) ; used to convert a stream in chunks
+
+    """
+    if state:
+        text = ''.join(['\033[{0}m'.format(x) for x in state]) + text
+    if get_ansi_state(text):
+        text += '\033[0m'
     converted = ''
+    conv = get_ansi_converter()
     try:
-        conv = Ansi2HTMLConverter(markup_lines=True, linkify=False, escaped=False)
         converted = conv.convert(text.replace('\n', ' <br/>'), full=full)
     except Exception, e:
         converted = text
+    finally:
+        release_ansi_converter(conv)
     return converted
 
 def generate_console_session(host, container):
@@ -45,10 +178,50 @@ def generate_console_session(host, container):
     rds.expire(key, 120)
     return session_id
 
+def get_upstreams(app):
+    """
+    Returns the upstream urls of an application
+
+    The port bindings of the backend port of every container are loaded
+    with their container and host in a single query.  Raises `KeyError`
+    if a container does not publish the backend port on the application
+    host interface.
+
+    :param app: Application
+
+    """
+    from containers.models import PortBinding
+    port_proto = "{0}/tcp".format(app.backend_port)
+    host_interface = app.host_interface or '0.0.0.0'
+    container_ids = list(app.containers.values_list('id', flat=True))
+    if not container_ids:
+        return []
+    try:
+        port = int(app.backend_port)
+    except (TypeError, ValueError):
+        raise KeyError(port_proto)
+    bindings = {}
+    for b in PortBinding.objects.filter(container__in=container_ids,
+            port=port, protocol='tcp', host_interface=host_interface).\
+            select_related('container__host'):
+        bindings[b.container_id] = b
+    upstreams = []
+    for c_id in container_ids:
+        b = bindings.get(c_id)
+        if b is None:
+            raise KeyError(port_proto)
+        host = b.container.host
+        hostname = host.public_hostname or host.hostname \
+            if host_interface == '0.0.0.0' else host_interface
+        upstreams.append('{0}://{1}:{2}'.format(app.protocol, hostname,
+            b.host_port))
+    return upstreams
+
 def update_hipache(app_id=None):
     from applications.models import Application
     if getattr(settings, 'HIPACHE_ENABLED'):
         app = Application.objects.get(id=app_id)
+        upstreams = get_upstreams(app)
         redis_host = getattr(settings, 'HIPACHE_REDIS_HOST')
         redis_port = getattr(settings, 'HIPACHE_REDIS_PORT')
         rds = redis.Redis(host=redis_host, port=redis_port)
@@ -58,15 +231,7 @@ def update_hipache(app_id=None):
             pipe.delete(domain_key)
             pipe.rpush(domain_key, app.id)
             # add upstreams
-            for c in app.containers.all():
-                port_proto = "{0}/tcp".format(app.backend_port)
-                host_interface = app.host_interface or '0.0.0.0'
-                hostname = c.host.public_hostname or \
-                        c.host.hostname if host_interface == '0.0.0.0' else \
-                        host_interface
-                # check for unix socket
-                port = c.get_ports()[port_proto][host_interface]
-                upstream = '{0}://{1}:{2}'.format(app.protocol, hostname, port)
+            for upstream in upstreams:
                 pipe.rpush(domain_key, upstream)
             pipe.execute()
             return True
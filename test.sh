@@ -9,4 +9,4 @@ if [ "$1" != "-s" ]; then
     $VE_DIR/bin/pip install -r requirements.txt
     source $VE_DIR/bin/activate
 fi
-python manage.py test containers accounts applications hosts images shipyard
+python manage.py test containers accounts agent applications hosts images metrics shipyard